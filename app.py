@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
-import shap
-import matplotlib.pyplot as plt
-import altair as alt
-import pickle
 import numpy as np
 from features import CashFlowFeatures
-from pipeline import CreditPipeline
+from pipeline import CreditPipeline, compute_offers
+from cohorts import CohortIndex
+from chart_data import ChartData
+from fraud import FraudGate
+from dedup import deduplicate_transactions
+from validation import validate_inputs, ValidationError
+import memprofile
 
 # Page Config
 st.set_page_config(
@@ -86,6 +88,9 @@ FRIENDLY_NAMES = {
     'eom_balance': 'End-of-Month Buffer',
     'neg_balance_days': 'Days with Negative Balance',
     'low_balance_days': 'Days with Low Balance (<$200)',
+    'min_balance_30d': 'Lowest Balance (30 Days)',
+    'min_balance_60d': 'Lowest Balance (60 Days)',
+    'min_balance_90d': 'Lowest Balance (90 Days)',
     'declined_txns': 'Declined Transactions',
     'upi_stability': 'Transfer Inflow Stability',
     'wallet_transfers': 'Wallet Transfers to Friends',
@@ -115,21 +120,32 @@ FRIENDLY_NAMES = {
     'address_stability': 'Address Stability'
 }
 
+# Features the dashboard reads directly (offers and peer comparison), computed
+# on top of whatever the loaded model needs
+DISPLAY_FEATURES = [
+    'net_cashflow', 'income_stability', 'gambling_ratio', 'bnpl_ratio',
+    'parental_dependency', 'gig_ratio', 'signup_tenure'
+]
+
+# Opt-in per-stage memory report/budgets (CREDIT_MEMPROFILE, CREDIT_MEMORY_BUDGETS)
+memprofile.enable_from_env()
+
 # --- Load Resources ---
+# Loaded on first upload, so the landing page renders without xgboost/shap
 @st.cache_resource
 def load_pipeline():
-    return CreditPipeline()
+    # Nothing here reads the drift monitor, and every rerun would re-add the upload to it
+    return CreditPipeline(monitor_drift=False)
 
-@st.cache_resource
-def load_explainer():
-    try:
-        with open("shap_explainer.pkl", "rb") as f:
-            return pickle.load(f)
-    except FileNotFoundError:
-        return None
+@st.cache_resource(show_spinner=False)
+def build_cohort_index(features_df):
+    # Built once per scored portfolio; reruns with the same features reuse it
+    return CohortIndex(features_df)
 
-pipeline = load_pipeline()
-explainer = load_explainer()
+@st.cache_resource(show_spinner=False)
+def build_chart_data(transactions_df):
+    # Built once per upload; each applicant's chart series are cached inside
+    return ChartData(transactions_df)
 
 # --- Header ---
 st.title("🚀 Gen-Z Credit Scoring Engine")
@@ -157,54 +173,59 @@ with st.sidebar:
 
 # --- Main Logic ---
 if uploaded_file is not None:
+    import altair as alt # Charts are only drawn once there are results
+    pipeline = load_pipeline()
     try:
         # 1. Load Data
-        transactions_df = pd.read_csv(uploaded_file, dtype={'user_id': str})
-        
-        users_df = None
-        if user_file is not None:
-            users_df = pd.read_csv(user_file, dtype={'user_id': str})
+        with memprofile.stage("ingest"):
+            transactions_df = pd.read_csv(uploaded_file, dtype={'user_id': str})
+            
+            users_df = None
+            if user_file is not None:
+                users_df = pd.read_csv(user_file, dtype={'user_id': str})
+            
+            # Quarantine rows that would crash or skew the features
+            transactions_df, users_df, quarantined, quarantined_users, validation_report = \
+                validate_inputs(transactions_df, users_df, max_date=pd.Timestamp.now())
+            if transactions_df.empty:
+                raise ValidationError(f"no valid transactions ({validation_report['transactions']['reasons']})")
+            
+            # Drop rows repeated by overlapping statement windows
+            transactions_df, dedup_report = deduplicate_transactions(transactions_df)
+        for name, rows, report in [('transactions', quarantined, validation_report['transactions']),
+                                   ('user profiles', quarantined_users, validation_report['users'])]:
+            if report and report['quarantined']:
+                reasons = ', '.join(f"{reason}: {n:,}" for reason, n in report['reasons'].items())
+                st.warning(f"Quarantined {report['quarantined']:,} of {report['rows_in']:,} {name} ({reasons}).")
+                with st.expander(f"Quarantined {name}"):
+                    st.dataframe(rows.head(1000))
+        if dedup_report['exact_duplicates'] or dedup_report['near_duplicates']:
+            st.warning(f"Removed {dedup_report['exact_duplicates']:,} duplicate transactions; "
+                       f"{dedup_report['near_duplicates']:,} possible duplicates flagged.")
         
         # 2. Calculate Features
         with st.spinner("Analyzing financial DNA..."):
-            features_engine = CashFlowFeatures(transactions_df, users_df)
-            features_df = features_engine.calculate_features()
+            with memprofile.stage("features"):
+                features_engine = CashFlowFeatures(transactions_df, users_df)
+                feature_names = None
+                if pipeline.required_features is not None:
+                    feature_names = list(dict.fromkeys(pipeline.required_features + DISPLAY_FEATURES))
+                features_df = features_engine.calculate_features(feature_names)
             
-            results = []
-            for user_id, row in features_df.iterrows():
-                # Run Pipeline
-                res = pipeline.run_waterfall(row)
-                res['user_id'] = user_id
-                
-                # Score 0-100
-                if res['pd'] is not None:
-                    res['score'] = int((1 - res['pd']) * 100)
-                else:
-                    res['score'] = 0
-                
-                # --- FINANCIAL CALCULATIONS ---
-                # Get user transactions
-                user_txns = transactions_df[transactions_df['user_id'] == user_id]
-                monthly_income = user_txns[user_txns['amount'] > 0]['amount'].sum() / 3
-                
-                # Loan Limit
-                # Use net_cashflow (was n_fcf)
-                n_fcf = max(0, row.get('net_cashflow', 0))
-                loan_limit = monthly_income * n_fcf * 0.3 * 12
-                loan_limit = round(loan_limit / 100) * 100
-                
-                # Interest Rate
-                pd_val = res['pd'] if res['pd'] is not None else 1.0
-                interest_rate = 8.0 + (pd_val * 20.0)
-                if interest_rate > 36: interest_rate = 36.0
+            if len(features_engine.uncategorized):
+                st.warning(f"{len(features_engine.uncategorized):,} merchants could not be categorized "
+                           f"({features_engine.uncategorized.sum():,} transactions). Top: "
+                           f"{', '.join(features_engine.uncategorized.index[:5].astype(str))}")
+            
+            with memprofile.stage("scoring"):
+                # Gate 1 velocity state for this upload
+                fraud_gate = FraudGate()
+                fraud_gate.observe_frame(transactions_df)
                 
-                res['loan_limit'] = loan_limit if res['decision'] == 'Approve' else 0
-                res['interest_rate'] = interest_rate
-                res['monthly_income'] = monthly_income
+                # Run Pipeline (one model call for the whole upload)
+                decisions = pipeline.run_batch(features_df, fraud_gate=fraud_gate)
                 
-                results.append(res)
-            
-            results_df = pd.DataFrame(results)
+                results_df = compute_offers(decisions, features_df, transactions_df)
 
         # --- Dashboard View ---
         st.markdown("---")
@@ -235,7 +256,7 @@ if uploaded_file is not None:
             # Get Data
             user_res = results_df[results_df['user_id'] == selected_user_id].iloc[0]
             user_feats = features_df.loc[selected_user_id]
-            user_txns = transactions_df[transactions_df['user_id'] == selected_user_id]
+            chart_data = build_chart_data(features_engine.df)
             
             # --- DECISION SECTION ---
             decision = user_res['decision']
@@ -287,18 +308,15 @@ if uploaded_file is not None:
             with col_viz1:
                 st.subheader("🧐 Risk Factors")
                 
-                if explainer:
-                    # Calculate SHAP
+                if pipeline.model is not None:
+                    # Calculate SHAP (XGBoost TreeSHAP; also works for ensemble bundles)
                     shap_input = pd.DataFrame([user_feats])
-                    # Drop extra columns if any
-                    cols = explainer.feature_names
-                    # Ensure columns match
-                    shap_input = shap_input[cols] if cols else shap_input
-                    
-                    shap_values = explainer(shap_input)
+                    # Keep only the model's features, in training order
+                    shap_input = shap_input[pipeline.feature_names]
                     
-                    vals = shap_values.values[0]
-                    names = shap_values.feature_names
+                    with memprofile.stage("explanation"):
+                        vals = pipeline.model.contributions(shap_input)[0, :-1] # drop the bias
+                    names = pipeline.feature_names
                     
                     # Create DataFrame for Chart
                     impact_data = []
@@ -326,10 +344,8 @@ if uploaded_file is not None:
             with col_viz2:
                 st.subheader("💸 Spending Habits")
                 
-                # Spending Breakdown
-                expenses = user_txns[user_txns['amount'] < 0].copy()
-                expenses['amount'] = expenses['amount'].abs()
-                cat_spend = expenses.groupby('category')['amount'].sum().reset_index()
+                # Spending Breakdown (top categories plus "Other")
+                cat_spend = chart_data.spending(selected_user_id)
                 
                 donut = alt.Chart(cat_spend).mark_arc(innerRadius=60).encode(
                     theta=alt.Theta(field="amount", type="quantitative"),
@@ -347,12 +363,11 @@ if uploaded_file is not None:
             col_d1, col_d2 = st.columns(2)
             
             with col_d1:
-                st.markdown("#### Cash Flow Trend (90 Days)")
-                # Calculate running balance
-                user_txns_sorted = user_txns.sort_values('date')
-                user_txns_sorted['balance'] = user_txns_sorted['amount'].cumsum()
+                st.markdown("#### Cash Flow Trend")
+                # End-of-day balance, downsampled to a bounded number of points
+                balance_curve = chart_data.balance(selected_user_id)
                 
-                line_chart = alt.Chart(user_txns_sorted).mark_line(color='#6366f1').encode(
+                line_chart = alt.Chart(balance_curve).mark_line(color='#6366f1').encode(
                     x='date:T',
                     y='balance:Q',
                     tooltip=['date', 'balance']
@@ -362,25 +377,30 @@ if uploaded_file is not None:
                 
             with col_d2:
                 st.markdown("#### Peer Comparison")
-                # Compare user metrics to average
-                avg_feats = features_df.mean(numeric_only=True)
+                # Rank the applicant within their cohort (income source x tenure)
+                cohort_index = build_cohort_index(features_df)
+                cohort = cohort_index.cohort(selected_user_id)
+                st.caption(f"Percentile vs. {cohort_index.cohort_size(cohort)} peers in cohort: {cohort}")
                 
-                comparison_data = [
-                    {'Metric': 'Savings Ratio', 'You': row['net_cashflow'] / 1000 if abs(row['net_cashflow']) > 1 else row['net_cashflow'], 'Avg': avg_feats['net_cashflow'] / 1000 if abs(avg_feats['net_cashflow']) > 1 else avg_feats['net_cashflow']},
-                    {'Metric': 'Income Stability', 'You': row['income_stability'], 'Avg': avg_feats['income_stability']},
-                    {'Metric': 'Gambling %', 'You': row['gambling_ratio'], 'Avg': avg_feats['gambling_ratio']},
-                    {'Metric': 'BNPL %', 'You': row['bnpl_ratio'], 'Avg': avg_feats['bnpl_ratio']}
-                ]
-                comp_df = pd.DataFrame(comparison_data).melt('Metric', var_name='Type', value_name='Value')
+                comp_df = cohort_index.compare(
+                    selected_user_id, user_feats,
+                    ['net_cashflow', 'income_stability', 'gambling_ratio', 'bnpl_ratio']
+                )
+                comp_df['Metric'] = comp_df['feature'].map({
+                    'net_cashflow': 'Savings Ratio',
+                    'income_stability': 'Income Stability',
+                    'gambling_ratio': 'Gambling %',
+                    'bnpl_ratio': 'BNPL %'
+                })
                 
-                bar_chart = alt.Chart(comp_df).mark_bar().encode(
+                bar_chart = alt.Chart(comp_df).mark_bar(color='#6366f1').encode(
                     x=alt.X('Metric', axis=alt.Axis(labelAngle=0)),
-                    y='Value',
-                    color=alt.Color('Type', scale=alt.Scale(domain=['You', 'Avg'], range=['#6366f1', '#9ca3af'])),
-                    xOffset='Type:N'
+                    y=alt.Y('percentile', title='Percentile in Cohort', scale=alt.Scale(domain=[0, 100])),
+                    tooltip=['Metric', 'value', 'percentile', 'cohort_median']
                 ).properties(height=300)
+                median_rule = alt.Chart(pd.DataFrame({'y': [50]})).mark_rule(color='#9ca3af', strokeDash=[4, 4]).encode(y='y')
                 
-                st.altair_chart(bar_chart, use_container_width=True)
+                st.altair_chart(bar_chart + median_rule, use_container_width=True)
             
             # Risk Gauge (HTML/CSS)
             st.markdown("#### Credit Risk Gauge")
@@ -398,6 +418,8 @@ if uploaded_file is not None:
             <div style="text-align: center; margin-top: -40px; color: #6b7280;">Credit Score</div>
             """, unsafe_allow_html=True)
 
+    except ValidationError as e:
+        st.error(f"Invalid file: {e}")
     except Exception as e:
         st.error(f"Error: {e}")
         st.write("Please ensure you uploaded the correct files.")
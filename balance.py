@@ -0,0 +1,155 @@
+import pandas as pd
+import numpy as np
+
+# Look-back windows (days) for the minimum balance features
+BALANCE_WINDOWS = (30, 60, 90)
+
+# Balance below this counts as a low-balance day
+LOW_BALANCE_THRESHOLD = 200.0
+
+
+def _daily_flows(df):
+    """
+    Reduces transactions to (user, day, net amount) triplets.
+
+    Only successful transactions move money, so Declined/Failed rows are
+    excluded when a 'status' column is present.
+    """
+    if 'status' in df.columns:
+        df = df[df['status'] == 'Success']
+
+    days = pd.to_datetime(df['date']).dt.normalize()
+    user_codes, user_ids = pd.factorize(df['user_id'], sort=True)
+    return user_codes, user_ids, days, df['amount'].to_numpy(dtype=np.float64)
+
+
+def balance_matrix(user_codes, day_codes, amounts, n_users, n_days):
+    """
+    Builds a user x day end-of-day balance matrix.
+
+    Daily net flows are scattered into a dense matrix and cumulatively summed
+    along each row (a segmented cumsum, one segment per user), which also
+    forward-fills the balance over days without transactions. Days before a
+    user's first transaction are NaN.
+
+    Args:
+        user_codes (np.ndarray): Row index of each flow.
+        day_codes (np.ndarray): Column index of each flow.
+        amounts (np.ndarray): Signed amounts.
+        n_users (int): Number of rows.
+        n_days (int): Number of columns.
+
+    Returns:
+        np.ndarray: (n_users, n_days) float64 balances.
+    """
+    flat = user_codes.astype(np.int64) * n_days + day_codes
+    net = np.bincount(flat, weights=amounts, minlength=n_users * n_days).reshape(n_users, n_days)
+    balances = np.cumsum(net, axis=1)
+
+    first_day = np.full(n_users, n_days, dtype=np.int64)
+    np.minimum.at(first_day, user_codes, day_codes)
+    balances[np.arange(n_days)[None, :] < first_day[:, None]] = np.nan
+    return balances
+
+
+def daily_balance_features(df, as_of=None, windows=BALANCE_WINDOWS, low_threshold=LOW_BALANCE_THRESHOLD,
+                           chunk_size=50000):
+    """
+    Computes balance features for the whole portfolio from true daily balances.
+
+    Each user's calendar runs from their first transaction to their
+    statement end: `as_of` when given (transactions after it are ignored),
+    else the user's own last transaction date. A user's features therefore
+    never depend on who else is in the batch, so the same applicant gets
+    the same values alone, in a score.py shard or in the whole portfolio.
+
+    Args:
+        df (pd.DataFrame): Transactions with 'user_id', 'date', 'amount' (and optionally 'status').
+        as_of: Statement end shared by every user (default: each user's
+            last transaction date).
+        windows (tuple): Look-back windows in days for the minimum balance features.
+        low_threshold (float): Balance below which a day counts as low.
+        chunk_size (int): Users per balance matrix, bounding peak memory.
+
+    Returns:
+        pd.DataFrame: Indexed by user_id with 'eom_balance', 'neg_balance_days',
+            'low_balance_days' and 'min_balance_{w}d' for each window.
+    """
+    all_users = pd.Index(df['user_id'].unique()).sort_values()
+    if as_of is not None:
+        as_of = pd.Timestamp(as_of).normalize()
+        df = df[pd.to_datetime(df['date']) < as_of + pd.Timedelta(days=1)]
+    user_codes, user_ids, days, amounts = _daily_flows(df)
+
+    columns = ['eom_balance', 'neg_balance_days', 'low_balance_days'] + [f'min_balance_{w}d' for w in windows]
+    if len(days) == 0:
+        return pd.DataFrame(0.0, index=all_users, columns=columns).rename_axis('user_id')
+
+    start = days.min()
+    if as_of is None:
+        # Statement end per user: their last transaction of any status
+        last = pd.to_datetime(df['date']).dt.normalize().groupby(df['user_id'].to_numpy()).max()
+        ends = ((last.reindex(user_ids) - start).dt.days).to_numpy(dtype=np.int64)
+    else:
+        ends = np.full(len(user_ids), (as_of - start).days, dtype=np.int64)
+    calendar = pd.date_range(start, periods=int(ends.max()) + 1, freq='D')
+    n_days = len(calendar)
+    day_codes = ((days - start).dt.days).to_numpy(dtype=np.int64)
+    is_month_end = np.asarray(calendar.is_month_end)
+    month_ends = np.flatnonzero(is_month_end)
+    day_index = np.arange(n_days)
+
+    order = np.argsort(user_codes, kind='stable')
+    user_codes, day_codes, amounts = user_codes[order], day_codes[order], amounts[order]
+    bounds = np.searchsorted(user_codes, np.arange(0, len(user_ids) + chunk_size, chunk_size))
+
+    results = []
+    for c, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        n_users = min(chunk_size, len(user_ids) - c * chunk_size)
+        if n_users <= 0:
+            break
+        end = ends[c * chunk_size:c * chunk_size + n_users]
+        balances = balance_matrix(user_codes[lo:hi] - c * chunk_size, day_codes[lo:hi], amounts[lo:hi],
+                                  n_users, n_days)
+        balances[day_index[None, :] > end[:, None]] = np.nan
+
+        # Month-end balances up to the statement end, plus the statement end for a partial final month
+        eom = balances[:, month_ends]
+        final = np.where(is_month_end[end], np.nan, balances[np.arange(n_users), end])
+        valid = ~np.isnan(balances)
+        chunk = {
+            'eom_balance': np.nanmean(np.column_stack([eom, final]), axis=1),
+            'neg_balance_days': ((balances < 0) & valid).sum(axis=1),
+            'low_balance_days': ((balances < low_threshold) & valid).sum(axis=1)
+        }
+        # Widest window first: each pass blanks the days before the next, narrower one
+        for w in sorted(windows, reverse=True):
+            balances[day_index[None, :] <= (end - w)[:, None]] = np.nan
+            chunk[f'min_balance_{w}d'] = np.nanmin(balances, axis=1)
+        results.append(pd.DataFrame(chunk, index=user_ids[c * chunk_size:c * chunk_size + n_users]))
+
+    features = pd.concat(results)[columns]
+    # Users with no successful transactions never had a balance
+    features = features.reindex(all_users).fillna(0.0)
+    return features.rename_axis('user_id')
+
+
+def user_daily_balance(df):
+    """
+    Returns one user's end-of-day balance series over their own history.
+
+    Args:
+        df (pd.DataFrame): A single user's transactions.
+
+    Returns:
+        pd.Series: Balance indexed by day.
+    """
+    _, _, days, amounts = _daily_flows(df)
+    if len(days) == 0:
+        return pd.Series(dtype=np.float64)
+
+    start = days.min()
+    calendar = pd.date_range(start, days.max(), freq='D')
+    day_codes = ((days - start).dt.days).to_numpy(dtype=np.int64)
+    balances = balance_matrix(np.zeros(len(day_codes), dtype=np.int64), day_codes, amounts, 1, len(calendar))
+    return pd.Series(balances[0], index=calendar, name='balance')
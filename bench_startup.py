@@ -0,0 +1,108 @@
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import pandas as pd
+
+# Cold-start budgets in seconds (fresh interpreter, best of --repeat runs)
+STARTUP_BUDGETS = {
+    'import pipeline': 1.0,
+    'import features': 1.0,
+    'import score': 1.5,
+    'first decision': 3.0,
+    'first decision (forked after preload)': 0.05,
+}
+
+# Libraries that must not be imported until they are actually used
+LAZY_MODULES = ['xgboost', 'shap', 'matplotlib', 'altair']
+
+FIRST_DECISION = """
+import pandas as pd
+import pipeline
+p = pipeline.CreditPipeline()
+row = pd.read_csv('features.csv', dtype={'user_id': str}, nrows=1).iloc[0]
+p.run_waterfall(row)
+"""
+
+
+def time_fresh(code):
+    """
+    Times `code` in a fresh interpreter, imports included.
+
+    Returns:
+        tuple: (seconds, list of LAZY_MODULES imported by `code`)
+    """
+    script = f"""
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]
+print(str(elapsed) + '|' + ','.join(loaded))
+"""
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    elapsed, loaded = out.stdout.strip().splitlines()[-1].split('|')
+    return float(elapsed), [m for m in loaded.split(',') if m]
+
+
+def _worker_first_decision(row):
+    import pipeline
+    start = time.perf_counter()
+    pipeline.preload().run_waterfall(row)
+    return time.perf_counter() - start
+
+
+def time_forked(repeat):
+    """
+    Times a forked worker's first decision after the parent called preload().
+    """
+    import pipeline
+    pipeline.preload()
+    row = pd.read_csv('features.csv', dtype={'user_id': str}, nrows=1).iloc[0]
+    ctx = multiprocessing.get_context("fork")
+    times = []
+    for _ in range(repeat):
+        with ctx.Pool(1) as pool:
+            times.append(pool.apply(_worker_first_decision, (row,)))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time against the startup budgets.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case (best is reported)")
+    args = parser.parse_args()
+
+    cases = {
+        'import pipeline': "import pipeline",
+        'import features': "import features",
+        'import score': "import score",
+        'first decision': FIRST_DECISION,
+    }
+    # Modules that must stay light; loading the model legitimately needs xgboost
+    must_be_lazy = {'import pipeline', 'import features', 'import score'}
+
+    results = {}
+    failed = False
+    for name, code in cases.items():
+        runs = [time_fresh(code) for _ in range(args.repeat)]
+        results[name] = min(t for t, _ in runs)
+        loaded = runs[0][1]
+        if name in must_be_lazy and loaded:
+            print(f"FAIL {name}: eagerly imports {', '.join(loaded)}")
+            failed = True
+    if hasattr(os, 'fork'):
+        results['first decision (forked after preload)'] = time_forked(args.repeat)
+
+    print(f"\n{'Case':<40}{'Time':>10}{'Budget':>10}")
+    for name, elapsed in results.items():
+        budget = STARTUP_BUDGETS[name]
+        status = "ok" if elapsed <= budget else "OVER"
+        failed |= elapsed > budget
+        print(f"{name:<40}{elapsed:>9.3f}s{budget:>9.2f}s  {status}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
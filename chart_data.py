@@ -0,0 +1,117 @@
+from functools import lru_cache
+import pandas as pd
+import numpy as np
+from balance import user_daily_balance
+
+# Points kept per balance curve (4 per bucket: first, last, min and max)
+MAX_CURVE_POINTS = 160
+
+# Categories drawn separately in the spending donut; the rest become OTHER
+TOP_CATEGORIES = 6
+OTHER = 'Other'
+
+
+def minmax_downsample(values, max_points=MAX_CURVE_POINTS):
+    """
+    Picks at most `max_points` positions of a series, preserving its shape.
+
+    The series is split into equal-count buckets and each bucket keeps its
+    first, last, lowest and highest point, so dips and spikes (e.g. an
+    overdraft day) survive downsampling. One lexsort finds every bucket's
+    extremes at once.
+
+    Args:
+        values (np.ndarray): Series values in display order.
+        max_points (int): Upper bound on the points returned.
+
+    Returns:
+        np.ndarray: Sorted positions to keep.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    n_buckets = max(1, max_points // 4)
+    buckets = np.arange(n) * n_buckets // n
+    starts = np.searchsorted(buckets, np.arange(n_buckets))
+    ends = np.append(starts[1:], n) - 1
+    order = np.lexsort((values, buckets))
+    return np.unique(np.concatenate([starts, ends, order[starts], order[ends]]))
+
+
+def category_rollup(categories, amounts, top_n=TOP_CATEGORIES, other=OTHER):
+    """
+    Sums amounts per category, keeping the `top_n` largest and rolling the
+    rest into one `other` slice.
+
+    Returns:
+        pd.DataFrame: 'category' and 'amount', largest first (`other` last).
+    """
+    totals = pd.Series(amounts, dtype=np.float64).groupby(np.asarray(categories)).sum()
+    totals = totals.sort_values(ascending=False)
+    if len(totals) > top_n:
+        rest = totals.iloc[top_n:].sum()
+        totals = totals.iloc[:top_n]
+        totals[other] = rest
+    return totals.rename_axis('category').reset_index(name='amount')
+
+
+class ChartData:
+    def __init__(self, transactions_df, max_points=MAX_CURVE_POINTS, top_n=TOP_CATEGORIES, cache_size=256):
+        """
+        Bounded-size chart series for the applicant views.
+
+        Transactions are sorted by user once, so an applicant's rows are a
+        slice found by binary search. Each chart's data is reduced to at
+        most `max_points` points (balance curve) or `top_n` + 1 slices
+        (spending donut) whatever the history length, and cached per user.
+
+        Args:
+            transactions_df (pd.DataFrame): Transactions with 'user_id',
+                'date', 'amount', 'category' and optionally 'status' (e.g.
+                CashFlowFeatures.df, which has categories for raw statements).
+            max_points (int): Points per balance curve.
+            top_n (int): Categories shown before rolling up the rest.
+            cache_size (int): Users whose chart data is kept.
+        """
+        columns = [c for c in ('user_id', 'date', 'amount', 'category', 'status') if c in transactions_df.columns]
+        df = transactions_df[columns].assign(date=pd.to_datetime(transactions_df['date']))
+        self.df = df.sort_values(['user_id', 'date'], kind='stable').reset_index(drop=True)
+        self.users = pd.Index(self.df['user_id'].unique())
+        self.bounds = np.searchsorted(self.df['user_id'].to_numpy(), self.users.to_numpy())
+        self.bounds = np.append(self.bounds, len(self.df))
+        self.max_points = max_points
+        self.top_n = top_n
+
+        self.balance = lru_cache(maxsize=cache_size)(self._balance)
+        self.spending = lru_cache(maxsize=cache_size)(self._spending)
+
+    def user_transactions(self, user_id):
+        """
+        Returns one user's transactions (empty for unknown users).
+        """
+        if user_id not in self.users:
+            return self.df.iloc[:0]
+        i = self.users.get_loc(user_id)
+        return self.df.iloc[self.bounds[i]:self.bounds[i + 1]]
+
+    def _balance(self, user_id):
+        """
+        Downsampled end-of-day balance curve.
+
+        Returns:
+            pd.DataFrame: 'date' and 'balance', at most `max_points` rows.
+        """
+        balance = user_daily_balance(self.user_transactions(user_id))
+        keep = minmax_downsample(balance.to_numpy(), self.max_points)
+        return pd.DataFrame({'date': balance.index[keep], 'balance': balance.to_numpy()[keep]})
+
+    def _spending(self, user_id):
+        """
+        Outflows per category, top `top_n` plus OTHER.
+
+        Returns:
+            pd.DataFrame: 'category' and 'amount' (positive).
+        """
+        txns = self.user_transactions(user_id)
+        expenses = txns[txns['amount'] < 0]
+        return category_rollup(expenses['category'].to_numpy(), -expenses['amount'].to_numpy(), self.top_n)
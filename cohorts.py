@@ -0,0 +1,160 @@
+import pandas as pd
+import numpy as np
+
+# Tenure buckets (days on the app) used to segment the peer groups
+TENURE_BINS = [0, 180, 365, np.inf]
+TENURE_LABELS = ['<6m', '6-12m', '1y+']
+
+
+def assign_cohorts(features_df):
+    """
+    Assigns every user to a peer cohort of income source x tenure bucket.
+
+    Args:
+        features_df (pd.DataFrame): Output of CashFlowFeatures.calculate_features().
+
+    Returns:
+        pd.DataFrame: 'income_source', 'tenure_bucket' and 'cohort' per user.
+    """
+    parental = features_df.get('parental_dependency', pd.Series(0.0, index=features_df.index))
+    gig = features_df.get('gig_ratio', pd.Series(0.0, index=features_df.index))
+
+    income_source = np.where(parental > 0.5, 'Parental',
+                             np.where(gig > 0.5, 'Gig', 'Salaried'))
+
+    tenure = features_df.get('signup_tenure', pd.Series(0, index=features_df.index))
+    tenure_bucket = pd.cut(tenure.fillna(0), bins=TENURE_BINS, labels=TENURE_LABELS,
+                           right=False).astype(str)
+
+    cohorts = pd.DataFrame({
+        'income_source': income_source,
+        'tenure_bucket': tenure_bucket
+    }, index=features_df.index)
+    cohorts['cohort'] = cohorts['income_source'] + ' / ' + cohorts['tenure_bucket']
+    return cohorts
+
+
+class CohortIndex:
+    def __init__(self, features_df, min_cohort_size=30):
+        """
+        Builds per-cohort sorted feature arrays for percentile lookups.
+
+        Cohorts smaller than `min_cohort_size` fall back to their income source
+        group, and then to the whole portfolio.
+
+        Args:
+            features_df (pd.DataFrame): Feature matrix indexed by user_id.
+            min_cohort_size (int): Minimum number of peers for a cohort to be used.
+        """
+        numeric = features_df.select_dtypes(include=[np.number])
+        self.features = numeric.columns.tolist()
+        self._feature_pos = {f: i for i, f in enumerate(self.features)}
+
+        cohorts = assign_cohorts(features_df)
+        values = numeric.to_numpy(dtype=np.float64)
+
+        # Resolve each user's cohort to the most specific group with enough peers
+        cohort_sizes = cohorts['cohort'].map(cohorts['cohort'].value_counts())
+        source_sizes = cohorts['income_source'].map(cohorts['income_source'].value_counts())
+        resolved = np.where(cohort_sizes >= min_cohort_size, cohorts['cohort'],
+                            np.where(source_sizes >= min_cohort_size, cohorts['income_source'], 'All'))
+        self.user_cohort = pd.Series(resolved, index=features_df.index)
+
+        # Every group any user may resolve to gets its own sorted column block.
+        # NaNs sort to the end, so only the first n_valid entries are searched.
+        self._sorted = {}
+        self._n_valid = {}
+        groups = {'All': np.ones(len(values), dtype=bool)}
+        for key in set(resolved) - {'All'}:
+            column = 'cohort' if ' / ' in key else 'income_source'
+            groups[key] = (cohorts[column] == key).to_numpy()
+
+        for key, mask in groups.items():
+            block = np.sort(values[mask], axis=0)
+            self._sorted[key] = block
+            self._n_valid[key] = (~np.isnan(block)).sum(axis=0)
+
+    def cohort(self, user_id):
+        """
+        Returns the cohort label used for the user's comparisons.
+        """
+        return self.user_cohort.get(user_id, 'All')
+
+    def cohort_size(self, cohort):
+        """
+        Returns the number of peers in a cohort.
+        """
+        return len(self._sorted.get(cohort, self._sorted['All']))
+
+    def percentile(self, feature, value, cohort='All'):
+        """
+        Returns the mid-rank percentile (0-100) of `value` within a cohort.
+
+        Args:
+            feature (str): Feature name.
+            value (float): Value to rank.
+            cohort (str): Cohort label (see `cohort`).
+
+        Returns:
+            float: Percentile, or NaN if the value or cohort data is missing.
+        """
+        if cohort not in self._sorted:
+            cohort = 'All'
+        j = self._feature_pos[feature]
+        n = self._n_valid[cohort][j]
+        if n == 0 or pd.isna(value):
+            return np.nan
+
+        column = self._sorted[cohort][:n, j]
+        below = np.searchsorted(column, value, side='left')
+        at_or_below = np.searchsorted(column, value, side='right')
+        return 100.0 * (below + at_or_below) / (2 * n)
+
+    def quantile(self, feature, q, cohort='All'):
+        """
+        Returns the q-th quantile (0-1) of a feature within a cohort.
+        """
+        if cohort not in self._sorted:
+            cohort = 'All'
+        j = self._feature_pos[feature]
+        n = self._n_valid[cohort][j]
+        if n == 0:
+            return np.nan
+        return float(np.quantile(self._sorted[cohort][:n, j], q))
+
+    def compare(self, user_id, user_features, features):
+        """
+        Builds a peer comparison table for one applicant.
+
+        Args:
+            user_id: Applicant ID.
+            user_features (dict or pd.Series): The applicant's features.
+            features (list): Feature names to compare.
+
+        Returns:
+            pd.DataFrame: 'feature', 'value', 'percentile' and 'cohort_median' per feature.
+        """
+        cohort = self.cohort(user_id)
+        rows = []
+        for feat in features:
+            value = user_features[feat]
+            rows.append({
+                'feature': feat,
+                'value': value,
+                'percentile': self.percentile(feat, value, cohort),
+                'cohort_median': self.quantile(feat, 0.5, cohort)
+            })
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    try:
+        df = pd.read_csv("features.csv", dtype={'user_id': str}).set_index('user_id')
+        index = CohortIndex(df)
+        print(index.user_cohort.value_counts())
+
+        user_id = df.index[0]
+        print(f"\nUser {user_id} ({index.cohort(user_id)}):")
+        print(index.compare(user_id, df.loc[user_id], ['net_cashflow', 'gambling_ratio', 'bnpl_ratio']))
+    except FileNotFoundError:
+        print("features.csv not found. Run features.py first.")
@@ -0,0 +1,295 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+CACHE_DIR = ".pipeline_cache"
+
+_READ_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """
+    Returns the SHA-256 of a file's contents.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def module_files(modules, root="."):
+    """
+    Resolves local module names to their source files, following imports
+    of other local modules transitively.
+
+    Args:
+        modules (list): Top-level module names, e.g. ['train_model'].
+        root (str): Directory the local modules live in.
+
+    Returns:
+        list: Sorted source file paths.
+    """
+    seen = set()
+    pending = list(modules)
+    while pending:
+        path = os.path.join(root, pending.pop() + ".py")
+        if path in seen or not os.path.exists(path):
+            continue
+        seen.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module.split('.')[0])
+    return sorted(seen)
+
+
+class Stage:
+    def __init__(self, name, func, inputs=(), outputs=(), params=None, code=()):
+        """
+        One step of a pipeline.
+
+        Stages are linked through files: a stage depends on whichever stage
+        declares one of its inputs as an output.
+
+        Args:
+            name (str): Stage name.
+            func (callable): Called as func(**params); must write every output.
+            inputs (list): Files read by the stage.
+            outputs (list): Files or directories written by the stage.
+            params (dict): JSON-serializable keyword arguments (fingerprinted).
+            code (list): Local modules the stage runs (their source and local
+                imports are fingerprinted).
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params or {})
+        self.code = list(code)
+
+
+class DAGRunner:
+    def __init__(self, stages, cache_dir=CACHE_DIR, root="."):
+        """
+        Incremental, content-addressed runner for a DAG of stages.
+
+        Each stage is fingerprinted from the contents of its inputs, the
+        source of its code and its parameters. Outputs are stored in an
+        object cache keyed by content hash, so a stage whose fingerprint was
+        seen before is skipped (outputs already in place) or restored from
+        the cache (e.g. after switching back to an earlier input). Stages
+        whose dependencies are done run in parallel threads.
+
+        Args:
+            stages (list): Stage objects.
+            cache_dir (str): Directory for the manifest and object cache.
+            root (str): Directory holding the local modules.
+        """
+        self.stages = {s.name: s for s in stages}
+        self.cache_dir = cache_dir
+        self.root = root
+        self._lock = threading.Lock()
+
+        producers = {}
+        for stage in stages:
+            for out in stage.outputs:
+                if out in producers:
+                    raise ValueError(f"{out} is written by both {producers[out]} and {stage.name}")
+                producers[out] = stage.name
+        self.deps = {s.name: sorted({producers[i] for i in s.inputs if i in producers}) for s in stages}
+        self.order = self._topological_order()
+
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.manifest = {'stages': {}, 'digests': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def _topological_order(self):
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in self.deps[name]:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def digest(self, path):
+        """
+        Content hash of a file, or of a directory's file names and contents.
+
+        File hashes are memoized on (size, mtime) in the manifest, so
+        unchanged inputs are not re-read on every run.
+        """
+        if os.path.isdir(path):
+            return self._hash_json({rel: self.digest(os.path.join(path, rel))
+                                    for rel in self._list_dir(path)})
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            cached = self.manifest['digests'].get(path)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+        digest = file_digest(path)
+        with self._lock:
+            self.manifest['digests'][path] = stamp + [digest]
+        return digest
+
+    @staticmethod
+    def _list_dir(path):
+        return sorted(os.path.relpath(os.path.join(d, f), path)
+                      for d, _, files in os.walk(path) for f in files)
+
+    @staticmethod
+    def _hash_json(obj):
+        return hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+    def fingerprint(self, stage):
+        """
+        Hashes a stage's inputs, code and parameters (inputs must exist).
+        """
+        return self._hash_json({
+            'stage': stage.name,
+            'params': stage.params,
+            'code': {p: self.digest(p) for p in module_files(stage.code, self.root)},
+            'inputs': {p: self.digest(p) for p in stage.inputs},
+            'outputs': stage.outputs
+        })
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def _store(self, path):
+        # Copy (not link): stages may rewrite their outputs in place later
+        entry = {'digest': self.digest(path)}
+        files = {path: entry['digest']}
+        if os.path.isdir(path):
+            entry['files'] = {rel: self.digest(os.path.join(path, rel)) for rel in self._list_dir(path)}
+            files = {os.path.join(path, rel): d for rel, d in entry['files'].items()}
+        for src, digest in files.items():
+            obj = self._object_path(digest)
+            if not os.path.exists(obj):
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                shutil.copyfile(src, obj + ".tmp")
+                os.replace(obj + ".tmp", obj)
+        return entry
+
+    def _restore(self, path, entry):
+        if 'files' in entry:
+            shutil.rmtree(path, ignore_errors=True)
+            targets = {os.path.join(path, rel): d for rel, d in entry['files'].items()}
+        else:
+            targets = {path: entry['digest']}
+        for dst, digest in targets.items():
+            os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+            shutil.copyfile(self._object_path(digest), dst + ".tmp")
+            os.replace(dst + ".tmp", dst)
+
+    def _cached(self, entry):
+        return all(os.path.exists(self._object_path(d))
+                   for out in entry.values()
+                   for d in (out['files'].values() if 'files' in out else [out['digest']]))
+
+    def _current(self, path, entry):
+        return os.path.exists(path) and self.digest(path) == entry['digest']
+
+    def _save_manifest(self):
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.manifest_path + ".tmp", "w") as f:
+                json.dump(self.manifest, f)
+            os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _execute(self, name, force):
+        stage = self.stages[name]
+        key = self.fingerprint(stage)
+        with self._lock:
+            entry = self.manifest['stages'].get(key)
+
+        if entry is not None and not force:
+            if all(self._current(p, e) for p, e in entry.items()):
+                return 'up to date', 0.0
+            if self._cached(entry):
+                for path, out in entry.items():
+                    if not self._current(path, out):
+                        self._restore(path, out)
+                return 'restored from cache', 0.0
+
+        start = time.time()
+        stage.func(**stage.params)
+        elapsed = time.time() - start
+
+        missing = [p for p in stage.outputs if not os.path.exists(p)]
+        if missing:
+            raise RuntimeError(f"Stage {name} did not write {missing}")
+        entry = {p: self._store(p) for p in stage.outputs}
+        with self._lock:
+            self.manifest['stages'][key] = entry
+        self._save_manifest()
+        return 'ran', elapsed
+
+    def run(self, targets=None, jobs=None, force=False):
+        """
+        Brings the targets (default: every stage) up to date.
+
+        Args:
+            targets (list): Stage names to build, with their dependencies.
+            jobs (int): Max stages running at once (default: CPU count).
+            force (bool): Re-run stages even when their fingerprint is cached.
+
+        Returns:
+            dict: Stage name -> 'up to date', 'restored from cache' or 'ran'.
+        """
+        needed = set()
+        pending = list(targets or self.stages)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.deps[name])
+
+        status = {}
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            while True:
+                if error is None:
+                    for name in self.order:
+                        if (name in needed and name not in status and name not in running.values()
+                                and all(status.get(d) for d in self.deps[name])):
+                            print(f"[{name}] checking...")
+                            running[pool.submit(self._execute, name, force)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name], elapsed = future.result()
+                        suffix = f" in {elapsed:.1f}s" if status[name] == 'ran' else ""
+                        print(f"[{name}] {status[name]}{suffix}")
+                    except BaseException as e:
+                        print(f"[{name}] failed: {e!r}")
+                        error = error or e
+        self._save_manifest()
+        if error is not None:
+            raise error
+        return status
@@ -3,6 +3,35 @@ import numpy as np
 import random
 from datetime import datetime, timedelta
 
+# Merchant names per transaction category
+INCOME_CATEGORIES = ['Payroll', 'Direct Deposit', 'Freelance Income', 'Transfer In', 'Parental Transfer']
+RISKY_MERCHANTS = ['DraftKings', 'FanDuel', 'Coinbase', 'Binance', 'Casino', 'PokerStars']
+BNPL_MERCHANTS = ['Klarna', 'Affirm', 'Afterpay', 'Sezzle', 'Zip']
+ESSENTIAL_MERCHANTS = ['Rent', 'Utilities', 'Grocery', 'Gas', 'Medical']
+DISCRETIONARY_MERCHANTS = ['Uber', 'McDonalds', 'Starbucks', 'Netflix', 'Amazon', 'Cinema', 'Bar']
+FOOD_DELIVERY_MERCHANTS = ['UberEats', 'DoorDash', 'GrubHub', 'Zomato', 'Swiggy']
+GAMING_MERCHANTS = ['Steam', 'PlayStation', 'Xbox', 'Nintendo', 'Riot Games', 'Roblox']
+FASHION_MERCHANTS = ['Zara', 'H&M', 'Shein', 'Nike', 'Adidas', 'Myntra']
+SUBSCRIPTION_MERCHANTS = ['Netflix', 'Spotify', 'Apple Music', 'Prime', 'Disney+', 'Hulu']
+
+# Category taxonomy in match priority order (Netflix is a Subscription
+# before it is Discretionary). Income and fee counterparties are the
+# placeholder names the generator writes.
+MERCHANT_TAXONOMY = [
+    ('Gambling/Crypto', RISKY_MERCHANTS),
+    ('BNPL', BNPL_MERCHANTS),
+    ('Food Delivery', FOOD_DELIVERY_MERCHANTS),
+    ('Gaming', GAMING_MERCHANTS),
+    ('Fashion', FASHION_MERCHANTS),
+    ('Subscription', SUBSCRIPTION_MERCHANTS),
+    ('Essential', ESSENTIAL_MERCHANTS),
+    ('Discretionary', DISCRETIONARY_MERCHANTS),
+    ('Payroll', ['Employer']),
+    ('Freelance Income', ['Client']),
+    ('Parental Transfer', ['Dad/Mom']),
+    ('Fee', ['Bank Fee']),
+]
+
 def generate_synthetic_data(num_users=1000):
     """
     Generates a synthetic dataset of raw bank transactions and user profiles.
@@ -19,15 +48,14 @@ def generate_synthetic_data(num_users=1000):
     user_data = []
     
     # Define categories
-    income_categories = ['Payroll', 'Direct Deposit', 'Freelance Income', 'Transfer In', 'Parental Transfer']
-    risky_categories = ['DraftKings', 'FanDuel', 'Coinbase', 'Binance', 'Casino', 'PokerStars']
-    bnpl_categories = ['Klarna', 'Affirm', 'Afterpay', 'Sezzle', 'Zip']
-    essential_categories = ['Rent', 'Utilities', 'Grocery', 'Gas', 'Medical']
-    discretionary_categories = ['Uber', 'McDonalds', 'Starbucks', 'Netflix', 'Amazon', 'Cinema', 'Bar']
-    food_delivery_categories = ['UberEats', 'DoorDash', 'GrubHub', 'Zomato', 'Swiggy']
-    gaming_categories = ['Steam', 'PlayStation', 'Xbox', 'Nintendo', 'Riot Games', 'Roblox']
-    fashion_categories = ['Zara', 'H&M', 'Shein', 'Nike', 'Adidas', 'Myntra']
-    subscription_categories = ['Netflix', 'Spotify', 'Apple Music', 'Prime', 'Disney+', 'Hulu']
+    risky_categories = RISKY_MERCHANTS
+    bnpl_categories = BNPL_MERCHANTS
+    essential_categories = ESSENTIAL_MERCHANTS
+    discretionary_categories = DISCRETIONARY_MERCHANTS
+    food_delivery_categories = FOOD_DELIVERY_MERCHANTS
+    gaming_categories = GAMING_MERCHANTS
+    fashion_categories = FASHION_MERCHANTS
+    subscription_categories = SUBSCRIPTION_MERCHANTS
     
     # Define user profiles
     # 0: Stable Salaried (Low risk)
@@ -239,10 +267,10 @@ def generate_synthetic_data(num_users=1000):
                         'category': cat,
                         'status': 'Success'
                     })
-                    # Create the refund
+                    # Create the refund (within the simulated window, never in the future)
                     data.append({
                         'user_id': user_id,
-                        'date': date + timedelta(days=random.randint(1, 5)),
+                        'date': min(date + timedelta(days=random.randint(1, 5)), start_date + timedelta(days=89)),
                         'time': '10:00:00',
                         'amount': round(amt, 2),
                         'merchant_name': merch,
@@ -280,8 +308,14 @@ def generate_synthetic_data(num_users=1000):
     print(f"Generated {len(df_txns)} transactions and {len(df_users)} user profiles.")
     return df_txns, df_users
 
+def save_synthetic_data(num_users=1000, transactions_path="transactions.csv", users_path="users.csv"):
+    """
+    Generates the synthetic dataset and writes it to CSV.
+    """
+    df_txns, df_users = generate_synthetic_data(num_users)
+    df_txns.to_csv(transactions_path, index=False)
+    df_users.to_csv(users_path, index=False)
+    print(f"Saved to {transactions_path} and {users_path}")
+
 if __name__ == "__main__":
-    df_txns, df_users = generate_synthetic_data()
-    df_txns.to_csv("transactions.csv", index=False)
-    df_users.to_csv("users.csv", index=False)
-    print("Saved to transactions.csv and users.csv")
+    save_synthetic_data()
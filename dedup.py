@@ -0,0 +1,119 @@
+import pandas as pd
+import numpy as np
+
+# Fields that identify a transaction
+CANONICAL_FIELDS = ['user_id', 'timestamp', 'amount', 'merchant_name', 'status']
+
+
+def _parse_unique(values, parser):
+    # Dates and clock times repeat heavily, so parse each distinct value once
+    codes, uniques = pd.factorize(values)
+    parsed = parser(pd.Series(uniques)).to_numpy()
+    result = parsed.take(np.where(codes < 0, 0, codes)) if len(parsed) else np.full(len(codes), np.nan)
+    return pd.Series(result, index=values.index).where(codes >= 0)
+
+
+def transaction_timestamps(df):
+    """
+    Returns each transaction's timestamp: the calendar day of 'date' plus
+    the clock time in 'time' (noon when missing or unparseable).
+    """
+    if pd.api.types.is_datetime64_any_dtype(df['date']):
+        stamps = df['date'].dt.normalize()
+    else:
+        stamps = _parse_unique(df['date'], lambda u: pd.to_datetime(u).dt.normalize())
+    if 'time' in df.columns:
+        offsets = _parse_unique(df['time'].astype(str), lambda u: pd.to_timedelta(u, errors='coerce'))
+        return stamps + pd.to_timedelta(offsets).fillna(pd.Timedelta(hours=12))
+    return stamps + pd.Timedelta(hours=12)
+
+
+def canonical_fields(df, fields=CANONICAL_FIELDS, timestamps=None):
+    """
+    Returns the fields that identify each row ('timestamp' derived from
+    date/time, in seconds) as a DataFrame.
+    """
+    canonical = {}
+    for field in fields:
+        if field == 'timestamp':
+            if timestamps is None:
+                timestamps = transaction_timestamps(df)
+            canonical[field] = timestamps.to_numpy(dtype='datetime64[s]').astype(np.int64)
+        elif field in df.columns:
+            canonical[field] = df[field].to_numpy()
+    return pd.DataFrame(canonical)
+
+
+def transaction_keys(df, fields=CANONICAL_FIELDS, timestamps=None):
+    """
+    Hashes the canonical fields of every row into a 64-bit key.
+
+    Args:
+        df (pd.DataFrame): Raw transactions.
+        fields (list): Fields to hash; 'timestamp' is derived from date/time.
+        timestamps (pd.Series): Precomputed timestamps (optional).
+
+    Returns:
+        np.ndarray: uint64 key per row.
+    """
+    return pd.util.hash_pandas_object(canonical_fields(df, fields, timestamps), index=False).to_numpy()
+
+
+def deduplicate_transactions(df, tolerance='2min'):
+    """
+    Drops exact duplicate transactions and flags near-duplicates.
+
+    Exact duplicates share all canonical fields and only the first
+    occurrence is kept. Rows are grouped by a 64-bit hash of the fields,
+    and rows with a repeated hash are then compared on the fields
+    themselves, so a hash collision never drops a transaction.
+    Near-duplicates match on everything but the timestamp and land within
+    `tolerance` of the previous such row; they are kept and flagged in a
+    'near_duplicate' column.
+
+    Args:
+        df (pd.DataFrame): Raw transactions.
+        tolerance (str or pd.Timedelta): Max time gap for a near-duplicate.
+
+    Returns:
+        tuple: (deduplicated DataFrame, report dict with row counts)
+    """
+    timestamps = transaction_timestamps(df)
+    canonical = canonical_fields(df, timestamps=timestamps)
+    keys = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+    candidates = pd.Series(keys).duplicated(keep=False).to_numpy()
+    exact = np.zeros(len(df), dtype=bool)
+    if candidates.any():
+        exact[candidates] = canonical[candidates].duplicated(keep='first').to_numpy()
+
+    kept = df.loc[~exact].copy()
+    seconds = timestamps.to_numpy(dtype='datetime64[s]').astype(np.int64)[~exact]
+
+    # Sort by (key without timestamp, time): near-duplicates become neighbours
+    loose_keys = transaction_keys(kept, fields=[f for f in CANONICAL_FIELDS if f != 'timestamp'])
+    order = np.lexsort((seconds, loose_keys))
+    same_key = loose_keys[order][1:] == loose_keys[order][:-1]
+    close = np.diff(seconds[order]) <= pd.Timedelta(tolerance).total_seconds()
+
+    near = np.zeros(len(kept), dtype=bool)
+    near[order[1:][same_key & close]] = True
+    kept['near_duplicate'] = near
+
+    report = {
+        'rows_in': len(df),
+        'exact_duplicates': int(exact.sum()),
+        'near_duplicates': int(near.sum()),
+        'rows_out': len(kept)
+    }
+    return kept, report
+
+
+if __name__ == "__main__":
+    try:
+        df = pd.read_csv("transactions.csv", dtype={'user_id': str})
+        # Simulate an overlapping statement window
+        overlap = pd.concat([df, df.sample(frac=0.05, random_state=0)], ignore_index=True)
+        _, report = deduplicate_transactions(overlap)
+        print(report)
+    except FileNotFoundError:
+        print("transactions.csv not found. Run data_gen.py first.")
@@ -0,0 +1,430 @@
+# Distributed batch scoring: a coordinator hash-partitions users into shards
+# (as score.py does) and hands them to worker processes over authenticated
+# sockets. Workers score shards with score_shard() and send back Parquet; the
+# coordinator commits each part atomically, retries shards whose worker failed
+# or stopped sending heartbeats, and resumes from committed parts.
+#
+#   export CREDIT_CLUSTER_KEY=<shared secret>                   (on every node)
+#   python distributed.py coordinator --host 0.0.0.0 --port 6000 --transactions transactions.csv --users users.csv
+#   python distributed.py worker --coordinator host:6000        (on each node)
+#   python distributed.py local --workers 4                     (all on one box, random key)
+import argparse
+import io
+import os
+import queue
+import secrets
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Listener, Client
+import pandas as pd
+from score import (prepare_shards, score_shard, shard_path, default_shards, run_fingerprint, pending_shards,
+                   encode_part, write_part, RESULT_COLUMNS)
+from model_bundle import bundle_digest, MANIFEST
+
+# Shared secret for the cluster, set on every node. Connections unpickle every
+# message, so there is no default: anyone holding the key can run code.
+CLUSTER_KEY_ENV = 'CREDIT_CLUSTER_KEY'
+
+HEARTBEAT_SECONDS = 5
+HEARTBEAT_TIMEOUT = 30 # a busy worker silent this long is presumed dead
+IDLE_TIMEOUT = 300 # give up on pending shards after this long without any worker
+
+
+def _authkey():
+    key = os.environ.get(CLUSTER_KEY_ENV)
+    if not key:
+        raise RuntimeError(f"{CLUSTER_KEY_ENV} is not set. Set it to the same random secret on the "
+                           f"coordinator and every worker, e.g. with: python -c \"import secrets; "
+                           f"print(secrets.token_hex(32))\"")
+    return key
+
+
+def _parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def _read_bytes(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class Coordinator:
+    def __init__(self, work_dir, output, shards, address=('127.0.0.1', 6000), max_retries=3,
+                 heartbeat_timeout=HEARTBEAT_TIMEOUT, authkey=None, idle_timeout=IDLE_TIMEOUT, fingerprint=None):
+        """
+        Hands out the shards under `work_dir` and gathers their results.
+
+        Every worker connection is served by its own thread: it sends one
+        shard at a time and waits for the result, accepting heartbeats in
+        between. A shard whose worker reports an error, disconnects or goes
+        silent for `heartbeat_timeout` seconds is queued again, up to
+        `max_retries` times. When no worker is connected for `idle_timeout`
+        seconds, the shards still pending are given up.
+
+        Every part carries the run `fingerprint` (inputs and model digest):
+        parts from another run are rescored, and workers whose model bundle
+        differs are turned away, so one output never mixes two models.
+
+        Args:
+            work_dir (str): Directory partitioned by score.prepare_shards().
+            output (str): Output directory for part-XXXXX.parquet files.
+            shards (int): Number of shards.
+            address (tuple): (host, port) to listen on (port 0 picks one).
+            max_retries (int): Retries per shard before it is given up.
+            heartbeat_timeout (float): Seconds without a message from a busy
+                worker before its shard is reassigned.
+            authkey (str): Shared secret (default: $CREDIT_CLUSTER_KEY).
+            idle_timeout (float): Seconds without a connected worker before
+                the pending shards are given up.
+            fingerprint (dict): From score.run_fingerprint().
+        """
+        self.work_dir = work_dir
+        self.output = output
+        self.shards = shards
+        self.max_retries = max_retries
+        self.heartbeat_timeout = heartbeat_timeout
+        self.idle_timeout = idle_timeout
+        self.fingerprint = fingerprint
+        self.listener = Listener(address, authkey=(authkey or _authkey()).encode())
+        self.address = self.listener.address
+        self.queue = queue.Queue()
+        self.failed = {}
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.remaining = 0
+        self.users_done = 0
+        self.connected = 0
+        self.idle_since = None
+        self.start = None
+
+    def _resolve(self, shard, users=0):
+        with self.lock:
+            self.remaining -= 1
+            self.users_done += users
+            remaining, users_done = self.remaining, self.users_done
+        if users:
+            elapsed = time.time() - self.start
+            print(f"Shard {shard + 1}/{self.shards}: {users:,} users | "
+                  f"{users_done / elapsed:,.0f} users/s | {remaining} shards left")
+        if remaining == 0:
+            self.done.set()
+
+    def _retry(self, shard, attempt, reason):
+        if attempt < self.max_retries:
+            print(f"Shard {shard + 1} failed ({reason}); retrying ({attempt + 1}/{self.max_retries})")
+            self.queue.put((shard, attempt + 1))
+        else:
+            print(f"Shard {shard + 1} failed ({reason}); giving up after {self.max_retries} retries")
+            self.failed[shard] = reason
+            self._resolve(shard)
+
+    def _give_up(self, reason):
+        # Fails the queued shards; shards held by a worker come back through _retry
+        shards = []
+        while True:
+            try:
+                shards.append(self.queue.get_nowait()[0])
+            except queue.Empty:
+                break
+        if shards:
+            print(f"Giving up on {len(shards)} shards: {reason}")
+        for shard in shards:
+            self.failed[shard] = reason
+            self._resolve(shard)
+
+    def _serve(self, conn):
+        shard = None
+        with self.lock:
+            self.connected += 1
+        try:
+            hello = conn.recv()
+            worker = hello.get('worker', '?')
+            if self.fingerprint is not None and hello.get('model') != self.fingerprint['model']:
+                print(f"Rejected worker {worker}: its model bundle differs from this run's")
+                conn.send({'type': 'stop'})
+                return
+            print(f"Worker {worker} connected")
+            while not self.done.is_set():
+                try:
+                    shard, attempt = self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                conn.send({
+                    'type': 'shard',
+                    'shard': shard,
+                    'transactions': _read_bytes(shard_path(self.work_dir, 'transactions', shard)),
+                    'users': _read_bytes(shard_path(self.work_dir, 'users', shard)),
+                    'fingerprint': self.fingerprint
+                })
+                while True:
+                    if not conn.poll(self.heartbeat_timeout):
+                        raise TimeoutError(f"no heartbeat from {worker} for {self.heartbeat_timeout:g}s")
+                    message = conn.recv()
+                    if message['type'] == 'heartbeat':
+                        continue
+                    if message['type'] == 'result':
+                        write_part(self.output, shard, message['parquet'])
+                        self._resolve(shard, message['users'])
+                    else:
+                        self._retry(shard, attempt, f"{worker}: {message['error']}")
+                    shard = None
+                    break
+            conn.send({'type': 'stop'})
+        except (EOFError, OSError, TimeoutError) as e:
+            if shard is not None:
+                self._retry(shard, attempt, f"worker lost: {str(e) or type(e).__name__}")
+        finally:
+            conn.close()
+            with self.lock:
+                self.connected -= 1
+                if self.connected == 0:
+                    self.idle_since = time.time()
+
+    def _accept(self):
+        while not self.done.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return # listener closed
+            except Exception as e: # failed handshake (wrong key, port scan)
+                print(f"Rejected connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def run(self, workers=None):
+        """
+        Serves workers until every shard is committed or given up.
+
+        Args:
+            workers (list): Local worker processes (subprocess.Popen). Once
+                all of them have exited, the pending shards are given up
+                instead of waiting for `idle_timeout`.
+
+        Returns:
+            dict: Shard -> failure reason for shards that were given up.
+        """
+        pending = pending_shards(self.output, self.shards, self.fingerprint)
+        self.start = self.idle_since = time.time()
+        self.remaining = len(pending)
+        for shard in pending:
+            if os.path.exists(shard_path(self.work_dir, 'transactions', shard)):
+                self.queue.put((shard, 0))
+            else:
+                # Nothing to score: commit the empty part here
+                write_part(self.output, shard, encode_part(pd.DataFrame(columns=RESULT_COLUMNS), self.fingerprint))
+                self._resolve(shard)
+        if self.remaining == 0:
+            self.done.set()
+
+        print(f"Coordinator listening on {self.address[0]}:{self.address[1]}")
+        threading.Thread(target=self._accept, daemon=True).start()
+        while not self.done.wait(1):
+            with self.lock:
+                idle = time.time() - self.idle_since if self.connected == 0 else 0
+            if workers and all(worker.poll() is not None for worker in workers):
+                self._give_up("all local workers exited")
+            elif idle > self.idle_timeout:
+                self._give_up(f"no worker connected for {self.idle_timeout:g}s")
+        self.listener.close()
+        return self.failed
+
+
+def run_worker(address, model_path="model_bundle", name=None, connect_timeout=60,
+               heartbeat_seconds=HEARTBEAT_SECONDS, authkey=None):
+    """
+    Connects to a coordinator and scores the shards it sends until told to stop.
+
+    The model is loaded once. While a shard is scored, a background thread
+    sends heartbeats so the coordinator can tell a slow shard from a dead
+    worker.
+
+    Args:
+        address (tuple): Coordinator (host, port).
+        model_path (str): Model bundle directory on this node.
+        name (str): Worker name in the coordinator's log (default: host:pid).
+        connect_timeout (float): Seconds to keep retrying the first connect.
+        heartbeat_seconds (float): Heartbeat interval while busy.
+        authkey (str): Shared secret (default: $CREDIT_CLUSTER_KEY).
+    """
+    from pipeline import preload
+
+    authkey = (authkey or _authkey()).encode()
+    pipeline = preload(model_path)
+    if pipeline.model is None:
+        sys.exit(1)
+    model_digest = bundle_digest(model_path)
+    name = name or f"{os.uname().nodename}:{os.getpid()}"
+
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                sys.exit(f"Coordinator {address[0]}:{address[1]} not reachable")
+            time.sleep(0.5)
+
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def heartbeat(busy):
+        while not busy.wait(heartbeat_seconds):
+            try:
+                send({'type': 'heartbeat'})
+            except OSError:
+                return
+
+    send({'type': 'hello', 'worker': name, 'model': model_digest})
+    try:
+        while True:
+            message = conn.recv()
+            if message['type'] == 'stop':
+                break
+            finished = threading.Event()
+            threading.Thread(target=heartbeat, args=(finished,), daemon=True).start()
+            try:
+                transactions_df = pd.read_csv(io.BytesIO(message['transactions']), dtype={'user_id': str})
+                users_df = None
+                if message['users'] is not None:
+                    users_df = pd.read_csv(io.BytesIO(message['users']), dtype={'user_id': str})
+                results = score_shard(transactions_df, users_df, pipeline)
+                reply = {'type': 'result', 'shard': message['shard'], 'users': len(results),
+                         'parquet': encode_part(results, message['fingerprint'])}
+            except Exception as e:
+                reply = {'type': 'error', 'shard': message['shard'], 'error': f"{type(e).__name__}: {e}"}
+            finally:
+                finished.set()
+            send(reply)
+    except EOFError:
+        pass # coordinator went away
+    finally:
+        conn.close()
+
+
+def score_distributed(transactions="transactions.csv", users=None, output="decisions", shards=None,
+                      chunk_rows=1000000, work_dir=None, fresh=False, host='127.0.0.1', port=6000,
+                      max_retries=3, local_workers=0, model="model_bundle", heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                      authkey=None, idle_timeout=IDLE_TIMEOUT):
+    """
+    Partitions the inputs and coordinates scoring of every shard.
+
+    Args:
+        transactions (str): Transactions CSV.
+        users (str): User profiles CSV (optional).
+        output (str): Output directory, one part file per shard.
+        shards (int): Number of user shards (default: from the input size).
+        chunk_rows (int): Rows per input read chunk while partitioning.
+        work_dir (str): Checkpoint directory (default: <output>.work).
+        fresh (bool): Discard checkpoints and start over.
+        host (str): Interface to listen on.
+        port (int): Port to listen on (0 picks a free one).
+        max_retries (int): Retries per shard.
+        local_workers (int): Worker processes to start on this machine.
+        model (str): Model bundle the workers score with; the coordinator
+            needs its manifest to fingerprint the run.
+        heartbeat_timeout (float): Seconds of worker silence before its
+            shard is reassigned.
+        authkey (str): Shared secret (default: $CREDIT_CLUSTER_KEY, or a
+            random one for the run when local workers are started).
+        idle_timeout (float): Seconds without a connected worker before the
+            pending shards are given up.
+
+    Returns:
+        bool: True if every shard was scored.
+    """
+    work_dir = work_dir or output.rstrip('/') + '.work'
+    if fresh:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(output, exist_ok=True)
+    if authkey is None and local_workers:
+        # Local workers get a one-off key through their environment
+        authkey = secrets.token_bytes(32).hex()
+    authkey = authkey or _authkey()
+    if not os.path.exists(os.path.join(model, MANIFEST)):
+        raise RuntimeError(f"Model bundle {model} not found. The coordinator needs the workers' bundle "
+                           f"(its manifest at least) to fingerprint the run.")
+    shards = shards or default_shards(transactions)
+    fingerprint = run_fingerprint(prepare_shards(transactions, users, work_dir, shards, chunk_rows), model)
+
+    coordinator = Coordinator(work_dir, output, shards, (host, port), max_retries, heartbeat_timeout, authkey,
+                              idle_timeout, fingerprint)
+    workers = []
+    connect = f"{'localhost' if host == '0.0.0.0' else host}:{coordinator.address[1]}"
+    for i in range(local_workers):
+        workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker",
+                                         "--coordinator", connect, "--model", model,
+                                         "--name", f"local-{i}"],
+                                        env=dict(os.environ, **{CLUSTER_KEY_ENV: authkey})))
+    try:
+        failed = coordinator.run(workers)
+    finally:
+        for worker in workers:
+            try:
+                worker.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+
+    if failed:
+        print(f"{len(failed)} shards failed: {', '.join(str(k + 1) for k in sorted(failed))}. "
+              f"Rerun to retry them.")
+        return False
+    print(f"Done. Decisions in {output}/ (read with pd.read_parquet('{output}'))")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed batch scoring over sockets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("coordinator", "local"):
+        sub = commands.add_parser(command, help="Partition and coordinate" if command == "coordinator"
+                                  else "Coordinator plus local worker processes")
+        sub.add_argument("--transactions", default="transactions.csv", help="Transactions CSV")
+        sub.add_argument("--users", default=None, help="User profiles CSV (optional)")
+        sub.add_argument("--output", default="decisions", help="Output Parquet dataset directory")
+        sub.add_argument("--shards", type=int, default=None, help="Number of user shards (default: from the input size)")
+        sub.add_argument("--chunk-rows", type=int, default=1000000, help="Rows per input read chunk")
+        sub.add_argument("--work-dir", default=None, help="Checkpoint directory (default: <output>.work)")
+        sub.add_argument("--fresh", action="store_true", help="Discard checkpoints and start over")
+        sub.add_argument("--host", default="127.0.0.1",
+                         help="Interface to listen on (0.0.0.0 for remote workers)")
+        sub.add_argument("--port", type=int, default=6000 if command == "coordinator" else 0,
+                         help="Port to listen on (0 = any free port)")
+        sub.add_argument("--retries", type=int, default=3, help="Retries per shard")
+        sub.add_argument("--heartbeat-timeout", type=float, default=HEARTBEAT_TIMEOUT,
+                         help="Seconds of worker silence before its shard is reassigned")
+        sub.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                         help="Seconds without any connected worker before pending shards are given up")
+        sub.add_argument("--model", default="model_bundle", help="Model bundle from train_model.py (the workers' one)")
+        if command == "local":
+            sub.add_argument("--workers", type=int, default=os.cpu_count(), help="Local worker processes")
+
+    worker = commands.add_parser("worker", help="Score shards for a coordinator")
+    worker.add_argument("--coordinator", required=True, help="Coordinator host:port")
+    worker.add_argument("--model", default="model_bundle", help="Model bundle from train_model.py")
+    worker.add_argument("--name", default=None, help="Worker name in the coordinator's log")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "worker":
+            run_worker(_parse_address(args.coordinator), args.model, args.name)
+            sys.exit(0)
+        ok = score_distributed(args.transactions, args.users, args.output, args.shards, args.chunk_rows,
+                               args.work_dir, args.fresh, args.host, args.port, args.retries,
+                               getattr(args, 'workers', 0), args.model,
+                               args.heartbeat_timeout, idle_timeout=args.idle_timeout)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    sys.exit(0 if ok else 1)
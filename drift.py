@@ -0,0 +1,189 @@
+import json
+import threading
+import pandas as pd
+import numpy as np
+
+# Population Stability Index bands commonly used in credit risk
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+
+
+class FeatureSketch:
+    def __init__(self, feature_names, edges):
+        """
+        Fixed-bin histograms for a set of features.
+
+        Each feature has bins (-inf, e0], (e0, e1], ..., (ek, inf) plus a
+        final bin for missing values. Sketches with the same edges merge by
+        adding counts, so workers can sketch their own batches and combine.
+
+        Args:
+            feature_names (list): Features in column order.
+            edges (list): One sorted array of inner bin edges per feature.
+        """
+        self.feature_names = list(feature_names)
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.n_bins = np.array([len(e) + 2 for e in self.edges])
+        self.offsets = np.concatenate([[0], np.cumsum(self.n_bins)[:-1]])
+        self.counts = np.zeros(self.n_bins.sum(), dtype=np.int64)
+
+        # Padded edge matrix for the single-row fast path
+        width = max((len(e) for e in self.edges), default=0)
+        self._edge_matrix = np.full((len(self.edges), width), np.inf)
+        for i, e in enumerate(self.edges):
+            self._edge_matrix[i, :len(e)] = e
+
+    @classmethod
+    def from_data(cls, df, n_bins=10):
+        """
+        Builds quantile bin edges from (training) data and counts it.
+
+        Args:
+            df (pd.DataFrame): Feature matrix.
+            n_bins (int): Target number of bins per feature.
+        """
+        qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+        edges = []
+        for col in df.columns:
+            values = df[col].to_numpy(dtype=np.float64)
+            values = values[~np.isnan(values)]
+            edges.append(np.unique(np.quantile(values, qs)) if len(values) else np.array([]))
+        sketch = cls(df.columns, edges)
+        sketch.update(df)
+        return sketch
+
+    def empty_like(self):
+        """
+        Returns a sketch with the same bins and no counts.
+        """
+        return FeatureSketch(self.feature_names, self.edges)
+
+    def update(self, df):
+        """
+        Adds a batch of rows (DataFrame, Series or dict for a single row).
+        """
+        if isinstance(df, pd.DataFrame):
+            values = df[self.feature_names].to_numpy(dtype=np.float64)
+        else:
+            values = np.array([[df[f] for f in self.feature_names]], dtype=np.float64)
+
+        missing = np.isnan(values)
+        if len(values) == 1:
+            # Count edges below the value: bins are right-closed
+            bins = (self._edge_matrix < values[0][:, None]).sum(axis=1)[None, :]
+        else:
+            bins = np.column_stack([np.searchsorted(e, values[:, j], side='left')
+                                    for j, e in enumerate(self.edges)])
+        bins = np.where(missing, self.n_bins - 1, bins)
+        self.counts += np.bincount((bins + self.offsets).ravel(), minlength=len(self.counts))
+
+    def merge(self, other):
+        """
+        Adds another sketch's counts into this one (bins must match).
+        """
+        if self.feature_names != other.feature_names or any(
+                not np.array_equal(a, b) for a, b in zip(self.edges, other.edges)):
+            raise ValueError("Cannot merge sketches with different bins")
+        self.counts += other.counts
+        return self
+
+    def histogram(self, feature):
+        """
+        Returns the bin counts of one feature (missing-value bin last).
+        """
+        i = self.feature_names.index(feature)
+        return self.counts[self.offsets[i]:self.offsets[i] + self.n_bins[i]]
+
+    @property
+    def n_rows(self):
+        return int(self.histogram(self.feature_names[0]).sum()) if self.feature_names else 0
+
+    def to_dict(self):
+        return {
+            'feature_names': self.feature_names,
+            'edges': [e.tolist() for e in self.edges],
+            'counts': self.counts.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['feature_names'], data['edges'])
+        sketch.counts = np.asarray(data['counts'], dtype=np.int64)
+        return sketch
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+def compare_sketches(reference, live, eps=1e-4):
+    """
+    Computes PSI and KS per feature between two sketches with the same bins.
+
+    Returns:
+        pd.DataFrame: 'psi', 'ks' and 'status' (ok/warn/alert) per feature.
+    """
+    rows = []
+    for feat in reference.feature_names:
+        ref = reference.histogram(feat).astype(np.float64)
+        cur = live.histogram(feat).astype(np.float64)
+        if cur.sum() == 0 or ref.sum() == 0:
+            rows.append({'feature': feat, 'psi': np.nan, 'ks': np.nan, 'status': 'no data'})
+            continue
+        p = np.clip(ref / ref.sum(), eps, None)
+        q = np.clip(cur / cur.sum(), eps, None)
+        psi = float(np.sum((q - p) * np.log(q / p)))
+        ks = float(np.max(np.abs(np.cumsum(ref) / ref.sum() - np.cumsum(cur) / cur.sum())))
+        status = 'alert' if psi >= PSI_ALERT else 'warn' if psi >= PSI_WARN else 'ok'
+        rows.append({'feature': feat, 'psi': psi, 'ks': ks, 'status': status})
+    return pd.DataFrame(rows).set_index('feature')
+
+
+class DriftMonitor:
+    def __init__(self, reference):
+        """
+        Tracks live feature distributions against a training reference.
+
+        Args:
+            reference (FeatureSketch): Sketch built at training time.
+        """
+        self.reference = reference
+        self.live = reference.empty_like()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        return cls(FeatureSketch.load(path))
+
+    def update(self, features):
+        """
+        Adds scored rows (DataFrame of a batch, or one user's features).
+        """
+        with self._lock:
+            self.live.update(features)
+
+    def merge(self, sketch):
+        """
+        Folds in a live sketch from another worker process.
+        """
+        with self._lock:
+            self.live.merge(sketch)
+
+    def reset(self):
+        with self._lock:
+            self.live = self.reference.empty_like()
+
+    def report(self):
+        """
+        Returns PSI/KS per feature for everything scored since the last reset.
+        """
+        with self._lock:
+            live = FeatureSketch.from_dict(self.live.to_dict())
+        report = compare_sketches(self.reference, live)
+        report['live_rows'] = live.n_rows
+        return report.sort_values('psi', ascending=False)
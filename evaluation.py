@@ -0,0 +1,273 @@
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+from pipeline import APPROVE_PD, REJECT_PD
+
+# Scores where the approval-rate / bad-rate curve is evaluated
+CURVE_THRESHOLDS = np.round(np.linspace(0.0, 1.0, 41), 3)
+
+# Score bins the bootstrap resamples at (table boundaries are always kept)
+BOOTSTRAP_BINS = 1 << 14
+
+# Poisson draws per bootstrap batch
+BATCH_DRAWS = 1 << 22
+
+# Bootstrap grid shared with the worker processes (set by _init_worker)
+_grid = None
+
+
+def _grid_for(bounds, cum_rows, cum_bads, cum_scores, cut_positions):
+    """
+    Aggregates sorted rows into contiguous segments [bounds[i], bounds[i+1]).
+
+    Returns:
+        dict: Per-segment 'rows', 'bads' and 'score_sum', and every table
+            boundary as an index into the segments.
+    """
+    return {
+        'rows': np.diff(cum_rows[bounds]),
+        'bads': np.diff(cum_bads[bounds]),
+        'score_sum': np.diff(cum_scores[bounds]),
+        'cuts': {name: np.searchsorted(bounds, pos) for name, pos in cut_positions.items()}
+    }
+
+
+def _prepare(y_true, y_score, n_deciles=10, n_calibration_bins=10, approve_pd=APPROVE_PD, reject_pd=REJECT_PD,
+             n_bins=BOOTSTRAP_BINS):
+    """
+    Sorts once and aggregates rows into two segment grids.
+
+    The exact grid has one segment per distinct score (point estimates).
+    The bootstrap grid merges neighbouring scores into about `n_bins` rank
+    bins, split at every decile, calibration, curve and policy boundary,
+    so each table is exact on both grids.
+
+    Returns:
+        tuple: (exact grid, bootstrap grid)
+    """
+    y_score = np.asarray(y_score, dtype=np.float64)
+    order = np.argsort(y_score, kind='stable')
+    scores = y_score[order]
+    y = np.asarray(y_true, dtype=np.float64)[order]
+    n = len(scores)
+
+    starts = np.flatnonzero(np.r_[True, scores[1:] != scores[:-1]])
+    tie_bounds = np.r_[starts, n]
+
+    def snap(positions):
+        # Never split a run of equal scores: move each cut to the nearest tie
+        # boundary, then merge cuts that land on the same one (no empty bands)
+        upper = np.minimum(np.searchsorted(tie_bounds, positions, side='left'), len(tie_bounds) - 1)
+        lower = np.maximum(upper - 1, 0)
+        nearest = np.where(positions - tie_bounds[lower] < tie_bounds[upper] - positions, lower, upper)
+        return np.unique(tie_bounds[nearest])
+
+    cut_positions = {
+        'decile': snap(np.round(np.linspace(0, n, n_deciles + 1)).astype(np.int64)),
+        'calibration': np.searchsorted(scores, np.linspace(0, 1, n_calibration_bins + 1), side='left'),
+        'curve': np.searchsorted(scores, CURVE_THRESHOLDS, side='left'), # approve if pd < t
+        'policy': np.array([0, np.searchsorted(scores, approve_pd, side='left'),
+                            np.searchsorted(scores, reject_pd, side='right'), n])
+    }
+    cut_positions['calibration'][-1] = n
+
+    bins = snap(np.round(np.linspace(0, n, n_bins + 1)).astype(np.int64))
+    bin_bounds = np.unique(np.concatenate([bins, *cut_positions.values(), [0, n]]))
+
+    cum_rows = np.arange(n + 1, dtype=np.float64)
+    cum_bads = np.r_[0.0, np.cumsum(y)]
+    cum_scores = np.r_[0.0, np.cumsum(scores)]
+    exact = _grid_for(tie_bounds, cum_rows, cum_bads, cum_scores, cut_positions)
+    boot = _grid_for(bin_bounds, cum_rows, cum_bads, cum_scores, cut_positions)
+    return exact, boot
+
+
+def _segment_sums(cumulative, cuts):
+    # cumulative: (B, S+1) prefix sums over segments; cuts: ascending segment indices
+    return cumulative[:, cuts[1:]] - cumulative[:, cuts[:-1]]
+
+
+def _metrics(rows, bads, score_sum, cuts):
+    """
+    Computes every metric from per-segment counts.
+
+    Segments are in ascending score order; rows within a segment count as
+    tied scores.
+
+    Args:
+        rows (np.ndarray): (B, S) row counts per segment, one line per resample.
+        bads (np.ndarray): (B, S) defaults per segment.
+        score_sum (np.ndarray): (B, S) summed predicted PD per segment.
+        cuts (dict): Table boundaries as segment indices.
+
+    Returns:
+        dict: Metric name -> array with a leading resample axis of size B.
+    """
+    goods = rows - bads
+    zero = np.zeros((len(rows), 1))
+    cum_bads = np.hstack([zero, np.cumsum(bads, axis=1)])
+    cum_goods = np.hstack([zero, np.cumsum(goods, axis=1)])
+    cum_rows = cum_bads + cum_goods
+    cum_pred = np.hstack([zero, np.cumsum(score_sum, axis=1)])
+    total_bads, total_goods, total = cum_bads[:, -1], cum_goods[:, -1], cum_rows[:, -1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # AUC: P(score of a bad > score of a good), ties count one half
+        auc = (bads * (cum_goods[:, :-1] + goods / 2)).sum(axis=1) / (total_bads * total_goods)
+        ks = np.abs(cum_bads / total_bads[:, None] - cum_goods / total_goods[:, None]).max(axis=1)
+        bad_rate = total_bads / total
+
+        # Deciles, riskiest first
+        dec_rows = _segment_sums(cum_rows, cuts['decile'])[:, ::-1]
+        dec_bads = _segment_sums(cum_bads, cuts['decile'])[:, ::-1]
+        gains = np.cumsum(dec_bads, axis=1) / total_bads[:, None]
+        cum_share = np.cumsum(dec_rows, axis=1) / total[:, None]
+
+        cal_rows = _segment_sums(cum_rows, cuts['calibration'])
+
+        curve = cuts['curve']
+        pol_rows = _segment_sums(cum_rows, cuts['policy'])
+
+        return {
+            'auc': auc,
+            'gini': 2 * auc - 1,
+            'ks': ks,
+            'bad_rate': bad_rate,
+            'decile_share': dec_rows / total[:, None],
+            'decile_bad_rate': dec_bads / dec_rows,
+            'decile_gains': gains,
+            'decile_lift': gains / cum_share,
+            'calibration_predicted': _segment_sums(cum_pred, cuts['calibration']) / cal_rows,
+            'calibration_observed': _segment_sums(cum_bads, cuts['calibration']) / cal_rows,
+            'calibration_share': cal_rows / total[:, None],
+            'approval_rate': cum_rows[:, curve] / total[:, None],
+            'approved_bad_rate': cum_bads[:, curve] / cum_rows[:, curve],
+            'policy_share': pol_rows / total[:, None],
+            'policy_bad_rate': _segment_sums(cum_bads, cuts['policy']) / pol_rows
+        }
+
+
+def _init_worker(grid):
+    global _grid
+    _grid = grid
+
+
+def _bootstrap_batch(seed, batch_id, size):
+    """
+    Runs `size` Poisson bootstrap resamples on the bootstrap grid.
+
+    Each row is drawn Poisson(1) times, so the goods and bads of a segment
+    are drawn Poisson(count) times in total: resampling segment counts is
+    exact and costs O(segments), not O(rows), per resample. Within a
+    segment, resampled rows carry the segment's mean PD.
+    """
+    rng = np.random.default_rng([seed, batch_id])
+    goods = rng.poisson(_grid['rows'] - _grid['bads'], size=(size, len(_grid['rows']))).astype(np.float64)
+    bads = rng.poisson(_grid['bads'], size=goods.shape).astype(np.float64)
+    rows = goods + bads
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_score = np.where(_grid['rows'] > 0, _grid['score_sum'] / _grid['rows'], 0.0)
+    return _metrics(rows, bads, rows * mean_score, _grid['cuts'])
+
+
+def evaluate(y_true, y_score, n_bootstrap=1000, alpha=0.05, seed=0, workers=None,
+             n_deciles=10, n_calibration_bins=10, approve_pd=APPROVE_PD, reject_pd=REJECT_PD):
+    """
+    Scores a model's predictions with bootstrap confidence intervals.
+
+    Args:
+        y_true (array-like): 1 = default (bad), 0 = good.
+        y_score (array-like): Predicted probability of default.
+        n_bootstrap (int): Bootstrap resamples (0 for point estimates only).
+        alpha (float): 1 - confidence level of the percentile intervals.
+        seed (int): Seed for reproducible resamples.
+        workers (int): Processes for the bootstrap (default: CPU count).
+        n_deciles (int): Risk bands in the gains/lift table. Runs of tied
+            scores are never split, so heavily tied data gets fewer bands.
+        n_calibration_bins (int): Equal-width PD bins for the calibration table.
+        approve_pd (float): Waterfall approval cut-off (pd below it).
+        reject_pd (float): Waterfall rejection cut-off (pd above it).
+
+    Returns:
+        dict: 'summary', 'deciles', 'calibration', 'approval_curve' and
+            'policy' DataFrames, each with 'lo'/'hi' interval columns.
+    """
+    exact, boot = _prepare(y_true, y_score, n_deciles, n_calibration_bins, approve_pd, reject_pd)
+    point = _metrics(exact['rows'][None], exact['bads'][None], exact['score_sum'][None], exact['cuts'])
+
+    samples = None
+    if n_bootstrap:
+        batch = max(1, min(n_bootstrap, BATCH_DRAWS // (2 * len(boot['rows']))))
+        sizes = [min(batch, n_bootstrap - i) for i in range(0, n_bootstrap, batch)]
+        workers = min(workers or os.cpu_count(), len(sizes))
+        if workers > 1:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(boot,)) as pool:
+                results = list(pool.map(_bootstrap_batch, [seed] * len(sizes), range(len(sizes)), sizes))
+        else:
+            _init_worker(boot)
+            results = [_bootstrap_batch(seed, i, size) for i, size in enumerate(sizes)]
+        samples = {k: np.concatenate([r[k] for r in results]) for k in point}
+
+    def interval(values):
+        # Empty segments (e.g. no rejects) have no interval
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanpercentile(values, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+
+    def table(keys, index, index_name):
+        frame = pd.DataFrame(index=pd.Index(index, name=index_name))
+        for key, column in keys.items():
+            frame[column] = point[key][0]
+            if samples is not None:
+                frame[f'{column}_lo'], frame[f'{column}_hi'] = interval(samples[key])
+        return frame
+
+    summary_keys = ['auc', 'gini', 'ks', 'bad_rate']
+    summary = pd.DataFrame({'estimate': [point[k][0] for k in summary_keys]}, index=summary_keys)
+    if samples is not None:
+        for k in summary_keys:
+            summary.loc[k, 'lo'], summary.loc[k, 'hi'] = interval(samples[k])
+
+    edges = np.linspace(0, 1, n_calibration_bins + 1)
+    return {
+        'summary': summary,
+        'deciles': table({'decile_share': 'share', 'decile_bad_rate': 'bad_rate',
+                          'decile_gains': 'cum_gains', 'decile_lift': 'cum_lift'},
+                         range(1, len(exact['cuts']['decile'])), 'decile'),
+        'calibration': table({'calibration_share': 'share', 'calibration_predicted': 'predicted',
+                              'calibration_observed': 'observed'},
+                             [f'{a:.1f}-{b:.1f}' for a, b in zip(edges[:-1], edges[1:])], 'pd_bin'),
+        'approval_curve': table({'approval_rate': 'approval_rate', 'approved_bad_rate': 'bad_rate'},
+                                CURVE_THRESHOLDS, 'threshold'),
+        'policy': table({'policy_share': 'share', 'policy_bad_rate': 'bad_rate'},
+                        ['Approve', 'Refer', 'Reject'], 'decision')
+    }
+
+
+def print_report(report):
+    with pd.option_context('display.float_format', '{:.4f}'.format, 'display.width', 160,
+                           'display.max_columns', None):
+        for name in ['summary', 'policy', 'deciles', 'calibration']:
+            print(f"\n{name.title()}:\n{report[name]}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation report on synthetic scores.")
+    parser.add_argument("--rows", type=int, default=1000000, help="Synthetic applicants")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Bootstrap resamples")
+    parser.add_argument("--workers", type=int, default=None, help="Bootstrap processes")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scores = rng.beta(1, 6, args.rows)
+    labels = rng.random(args.rows) < scores
+
+    start = time.time()
+    report = evaluate(labels, scores, n_bootstrap=args.bootstrap, workers=args.workers)
+    print(f"Evaluated {args.rows:,} rows with {args.bootstrap} resamples in {time.time() - start:.1f}s")
+    print_report(report)
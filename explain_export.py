@@ -0,0 +1,138 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import numpy as np
+import memprofile
+
+# Model (and shared input/output matrices) set once per worker process by _init_worker()
+_bundle = None
+_matrix = None
+_explained = None
+
+
+def _init_worker(model_path, matrix=None, explained=None):
+    global _bundle, _matrix, _explained
+    from model_bundle import ModelBundle
+    _bundle = ModelBundle(model_path)
+    _bundle.set_threads(1) # one process per core, no oversubscription
+    _matrix, _explained = matrix, explained
+
+
+def _explain_chunk(values):
+    # Per-feature SHAP values plus the bias term for one chunk (float32)
+    return _bundle.contributions(values).astype(np.float32)
+
+
+def _explain_rows(start, stop):
+    # Shared-memory variant: read rows [start, stop) and write their SHAP values in place
+    _explained.values[start:stop] = _bundle.contributions(_matrix.rows(start, stop, _bundle.feature_names))
+
+
+def export_explanations(features_path="features.csv", model_path="model_bundle",
+                        output_path="explanations.parquet", chunk_rows=50000, workers=None):
+    """
+    Computes SHAP values for every user and writes them to a Parquet file.
+
+    The features are explained in chunks in a process pool; at most two
+    chunks per worker are in flight and results are appended in input
+    order as Parquet row groups, so memory stays bounded however large the
+    book is. Columns are 'user_id', one float32 column per feature and
+    'bias' (the expected log-odds): per row, the SHAP values plus bias add
+    up to the model's log-odds.
+
+    A features CSV is streamed and each chunk sent to a worker. A
+    SharedFeatureMatrix is not sent at all: workers attach to it, read
+    their row range in place and write SHAP values into a shared output
+    block, so only row ranges cross process boundaries.
+
+    Args:
+        features_path (str or SharedFeatureMatrix): Features CSV (user_id
+            plus model features), or features already in shared memory.
+        model_path (str): Model bundle directory.
+        output_path (str): Output Parquet file (replaced atomically).
+        chunk_rows (int): Rows per task.
+        workers (int): Worker processes (default: CPU count).
+
+    Returns:
+        int: Rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from model_bundle import ModelBundle
+    from shared_features import SharedFeatureMatrix
+
+    feature_names = ModelBundle(model_path).feature_names
+    schema = pa.schema([('user_id', pa.string())] +
+                       [(f, pa.float32()) for f in feature_names + ['bias']])
+    workers = workers or os.cpu_count()
+
+    matrix = explained = None
+    initargs = (model_path,)
+    if isinstance(features_path, SharedFeatureMatrix):
+        matrix = features_path
+        explained = SharedFeatureMatrix.allocate(matrix.index, feature_names + ['bias'])
+        initargs = (model_path, matrix, explained)
+
+    tmp_path = output_path + ".tmp"
+    rows = 0
+    start = time.time()
+    try:
+        with memprofile.stage("explanation"), \
+                ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool, \
+                pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            in_flight = deque()
+
+            def write_next():
+                nonlocal rows
+                user_ids, future, span = in_flight.popleft()
+                contribs = future.result()
+                if span is not None:
+                    contribs = explained.values[span[0]:span[1]]
+                columns = [pa.array(user_ids, pa.string())] + [pa.array(contribs[:, j]) for j in range(contribs.shape[1])]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                rows += len(user_ids)
+                print(f"Explained {rows:,} users ({rows / (time.time() - start):,.0f} users/s)")
+
+            def submit_chunks():
+                # Lazily, so only the in-flight chunks are ever in memory
+                if matrix is None:
+                    reader = pd.read_csv(features_path, dtype={'user_id': str}, chunksize=chunk_rows,
+                                         usecols=['user_id'] + feature_names)
+                    for chunk in reader:
+                        values = chunk[feature_names].to_numpy(dtype=np.float32)
+                        yield chunk['user_id'].to_numpy(), pool.submit(_explain_chunk, values), None
+                else:
+                    for i in range(0, len(matrix), chunk_rows):
+                        stop = min(i + chunk_rows, len(matrix))
+                        yield matrix.index[i:stop].to_numpy(), pool.submit(_explain_rows, i, stop), (i, stop)
+
+            for task in submit_chunks():
+                in_flight.append(task)
+                if len(in_flight) >= 2 * workers:
+                    write_next()
+            while in_flight:
+                write_next()
+    finally:
+        if explained is not None:
+            explained.unlink()
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export SHAP explanations for a whole portfolio.")
+    parser.add_argument("--features", default="features.csv", help="Features CSV from features.py")
+    parser.add_argument("--model", default="model_bundle", help="Model bundle from train_model.py")
+    parser.add_argument("--output", default="explanations.parquet", help="Output Parquet file")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="Rows per task")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    try:
+        n = export_explanations(args.features, args.model, args.output, args.chunk_rows, args.workers)
+        print(f"Saved {n:,} explanations to {args.output}")
+    except FileNotFoundError as e:
+        print(f"{e.filename} not found. Run features.py and train_model.py first.")
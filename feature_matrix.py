@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import pandas as pd
+import numpy as np
+
+# Bumped when the layout changes (2: float64 values, typed DMatrix)
+MATRIX_FORMAT = 2
+
+MANIFEST = "manifest.json"
+VALUES_FILE = "values.npy"
+IDS_FILE = "user_ids.npy"
+DMATRIX_FILE = "features.dmatrix"
+
+
+def _dmatrix(values, columns):
+    # Typed like a DMatrix built from the features DataFrame, so models trained
+    # from either source carry the same feature types
+    import xgboost as xgb
+    return xgb.DMatrix(values, feature_names=columns, feature_types=['float'] * len(columns))
+
+
+def save_feature_matrix(features_df, path="features.bin", dmatrix=True):
+    """
+    Writes features as a binary, memory-mappable matrix directory.
+
+    Layout:
+        manifest.json      format version, row count and ordered column names
+        values.npy         float64 (users x features), C order
+        user_ids.npy       fixed-width user ids, one per row
+        features.dmatrix   the values as an XGBoost binary DMatrix (optional;
+                           no labels, which the trainer sets)
+
+    Values keep the float64 precision of features.csv, so labels, drift
+    sketches and the DMatrix built from them match the CSV path exactly
+    (e.g. a ratio of exactly 0.05 stays 0.05; in float32 it is above it).
+
+    Like model bundles, the directory is written next to `path` and swapped
+    in with a rename.
+
+    Args:
+        features_df (pd.DataFrame): Features indexed by user_id, e.g. from
+            CashFlowFeatures.calculate_features().
+        path (str): Matrix directory.
+        dmatrix (bool): Also cache the XGBoost DMatrix (imports xgboost).
+    """
+    tmp = path.rstrip('/') + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = [str(c) for c in features_df.columns]
+    values = np.ascontiguousarray(features_df.to_numpy(dtype=np.float64))
+    np.save(os.path.join(tmp, VALUES_FILE), values)
+    np.save(os.path.join(tmp, IDS_FILE), features_df.index.astype(str).to_numpy().astype('U'))
+    if dmatrix:
+        _dmatrix(values, columns).save_binary(os.path.join(tmp, DMATRIX_FILE), silent=True)
+
+    manifest = {
+        'format': MATRIX_FORMAT,
+        'rows': int(values.shape[0]),
+        'columns': columns,
+        'dmatrix': DMATRIX_FILE if dmatrix else None,
+    }
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old = path.rstrip('/') + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class FeatureMatrix:
+    def __init__(self, path="features.bin", mmap=True):
+        """
+        Opens a matrix written by save_feature_matrix().
+
+        Values are memory-mapped (read-only), so opening is O(1) and rows
+        are paged in as they are used.
+
+        Args:
+            path (str): Matrix directory.
+            mmap (bool): Memory-map the arrays instead of reading them.
+        """
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get('format', 0) > MATRIX_FORMAT:
+            raise ValueError(f"Feature matrix {path} has format {manifest['format']}; "
+                             f"this version reads up to {MATRIX_FORMAT}")
+        self.path = path
+        self.manifest = manifest
+        self.columns = manifest['columns']
+        mode = 'r' if mmap else None
+        self.values = np.load(os.path.join(path, VALUES_FILE), mmap_mode=mode)
+        self._ids = np.load(os.path.join(path, IDS_FILE), mmap_mode=mode)
+        self._index = None
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    @property
+    def index(self):
+        """
+        User ids as a pd.Index (built on first use).
+        """
+        if self._index is None:
+            self._index = pd.Index(self._ids.astype(object), name='user_id')
+        return self._index
+
+    def frame(self):
+        """
+        Returns the features as a DataFrame indexed by user_id that shares
+        the mapped values (read-only).
+        """
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+    def dmatrix(self, label=None):
+        """
+        Returns the values as an XGBoost DMatrix: the cached binary one when
+        it matches the matrix, else built from the mapped values.
+
+        Args:
+            label (array-like): Labels to set (optional).
+        """
+        import xgboost as xgb
+        dmatrix = None
+        cached = self.manifest.get('dmatrix')
+        if cached and os.path.exists(os.path.join(self.path, cached)):
+            dmatrix = xgb.DMatrix(os.path.join(self.path, cached))
+            if ((dmatrix.num_row(), dmatrix.num_col()) != self.values.shape or dmatrix.feature_names != self.columns
+                    or dmatrix.feature_types != ['float'] * len(self.columns)):
+                dmatrix = None # stale cache: fall back to the values
+        if dmatrix is None:
+            dmatrix = _dmatrix(self.values, self.columns)
+        if label is not None:
+            dmatrix.set_label(np.asarray(label, dtype=np.float32))
+        return dmatrix
@@ -0,0 +1,427 @@
+import warnings
+import pandas as pd
+import numpy as np
+from balance import daily_balance_features
+from periodicity import periodicity_features
+from dedup import transaction_timestamps
+
+# --- Category groups used by the spending features ---
+ESSENTIAL_CATEGORIES = ('Essential', 'Rent', 'Utilities', 'Grocery', 'Gas', 'Medical')
+DISCRETIONARY_CATEGORIES = ('Discretionary', 'Shopping', 'Entertainment')
+UPI_INFLOW_CATEGORIES = ('Transfer In', 'Parental Transfer')
+
+def _status(df, value):
+    if 'status' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return (df['status'] == value).to_numpy()
+
+
+# Atomic row filters. A feature's filters are AND-ed together, so each
+# distinct combination is one row subset of the plan.
+FILTERS = {
+    'success': lambda df: _status(df, 'Success') if 'status' in df.columns else np.ones(len(df), dtype=bool),
+    'declined': lambda df: _status(df, 'Declined'),
+    'failed': lambda df: _status(df, 'Failed'),
+    'inflow': lambda df: (df['amount'] > 0).to_numpy(),
+    'outflow': lambda df: (df['amount'] < 0).to_numpy(),
+    'night': lambda df: ((df['hour'] >= 2) & (df['hour'] <= 5)).to_numpy(),
+    'weekend': lambda df: (df['date'].dt.weekday >= 5).to_numpy(),
+    'weekday': lambda df: (df['date'].dt.weekday < 5).to_numpy(),
+    'micro': lambda df: df['amount'].abs().between(20, 200).to_numpy(),
+}
+
+# Columns that filters need, beyond what the raw transactions carry
+FILTER_COLUMNS = {
+    'success': ('status',), 'declined': ('status',), 'failed': ('status',),
+    'inflow': ('amount',), 'outflow': ('amount',), 'micro': ('amount',),
+    'night': ('hour',), 'weekend': ('date',), 'weekday': ('date',),
+}
+
+
+def category(*names):
+    """
+    Builds a filter term matching rows whose category is one of `names`.
+    """
+    return ('category', frozenset(names))
+
+
+class Feature:
+    def __init__(self, name, columns=(), filters=(), agg=None, column='amount', per_inflow=False,
+                 compute=None, requires=()):
+        """
+        Declares a feature.
+
+        A feature is either an aggregation over a filtered row subset (`agg`),
+        or a `compute(ctx)` function over other features and raw data.
+
+        Args:
+            name (str): Feature name (output column).
+            columns (tuple): Transaction columns the feature reads.
+            filters (tuple): Filter names from FILTERS or `category(...)` terms.
+            agg (str): One of 'sum', 'abs_sum', 'count' or 'nunique'.
+            column (str): Column aggregated by 'sum', 'abs_sum' and 'nunique'.
+            per_inflow (bool): Divide by total successful inflow (0 when there is none).
+            compute (callable): Function of a FeatureContext returning values per user.
+            requires (tuple): Features `compute` reads through the context.
+        """
+        self.name = name
+        self.filters = frozenset(filters)
+        self.agg = agg
+        self.column = column
+        self.per_inflow = per_inflow
+        self.compute = compute
+
+        requires = tuple(requires)
+        if per_inflow:
+            requires += ('total_inflow',)
+        self.requires = requires
+
+        cols = set(columns)
+        for term in self.filters:
+            cols.update(('category',) if isinstance(term, tuple) else FILTER_COLUMNS[term])
+        if agg is not None:
+            cols.add(column)
+        self.columns = frozenset(cols)
+
+
+REGISTRY = {}
+
+
+def register(feature):
+    """
+    Adds a feature to the registry, replacing any feature of the same name.
+    """
+    REGISTRY[feature.name] = feature
+    return feature
+
+
+class FeatureContext:
+    def __init__(self, df, users_df=None, as_of=None):
+        """
+        Shared state for one plan execution: derived columns, row masks and
+        computed features are each built at most once.
+
+        Args:
+            df (pd.DataFrame): Transactions sorted by user_id and date.
+            users_df (pd.DataFrame): User profiles indexed by user_id.
+            as_of: Reference date for date-relative features (balances,
+                days to the next payment); None ends each user's history
+                at their last transaction.
+        """
+        self.df = df
+        self.users_df = users_df
+        self.as_of = as_of
+        self.user_codes, self.users = pd.factorize(df['user_id'], sort=True)
+        self.n_users = len(self.users)
+        self.values = {}
+        self._masks = {}
+        self._families = {}
+
+    def ensure_columns(self, columns):
+        """
+        Derives columns the plan needs that the raw data does not carry.
+        """
+        if 'hour' in columns and 'hour' not in self.df.columns:
+            # Unparseable or missing times fall back to noon
+            self.df = self.df.assign(hour=transaction_timestamps(self.df).dt.hour.to_numpy())
+
+    def mask(self, filters):
+        """
+        Returns the boolean row mask for a set of filter terms.
+        """
+        if filters not in self._masks:
+            mask = np.ones(len(self.df), dtype=bool)
+            for term in filters:
+                if term not in self._masks:
+                    if isinstance(term, tuple):
+                        self._masks[term] = self.df[term[0]].isin(term[1]).to_numpy()
+                    else:
+                        self._masks[term] = FILTERS[term](self.df)
+                mask &= self._masks[term]
+            self._masks[filters] = mask
+        return self._masks[filters]
+
+    def family(self, key, builder):
+        """
+        Computes a multi-feature family (e.g. balance features) once per plan.
+        """
+        if key not in self._families:
+            self._families[key] = builder(self)
+        return self._families[key]
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+
+def aggregate(ctx, filters, features):
+    """
+    Computes all aggregations over one row subset, filtering it once.
+
+    Returns:
+        dict: Feature name -> np.ndarray of per-user values (0 for users without rows).
+    """
+    mask = ctx.mask(filters)
+    codes = ctx.user_codes[mask]
+    out = {}
+    sums = {}
+    for feat in features:
+        if feat.agg == 'count':
+            out[feat.name] = np.bincount(codes, minlength=ctx.n_users).astype(np.float64)
+        elif feat.agg in ('sum', 'abs_sum'):
+            if feat.column not in sums:
+                weights = ctx.df[feat.column].to_numpy(dtype=np.float64)[mask]
+                sums[feat.column] = np.bincount(codes, weights=weights, minlength=ctx.n_users)
+            total = sums[feat.column]
+            out[feat.name] = np.abs(total) if feat.agg == 'abs_sum' else total
+        elif feat.agg == 'nunique':
+            pairs = pd.DataFrame({'code': codes, 'value': ctx.df[feat.column].to_numpy()[mask]})
+            distinct = pairs.dropna().drop_duplicates()
+            out[feat.name] = np.bincount(distinct['code'].to_numpy(), minlength=ctx.n_users).astype(np.float64)
+        else:
+            raise ValueError(f"Unknown aggregation '{feat.agg}' for feature {feat.name}")
+    return out
+
+
+class FeaturePlan:
+    def __init__(self, names, registry=None):
+        """
+        Compiles requested features into a shared execution plan.
+
+        Dependencies are resolved, aggregations are grouped by their row
+        subset, and only features needed for `names` are computed.
+
+        Args:
+            names (list): Feature names to output, in order.
+            registry (dict): Feature registry (defaults to REGISTRY).
+        """
+        registry = REGISTRY if registry is None else registry
+        unknown = [n for n in names if n not in registry]
+        if unknown:
+            raise KeyError(f"Unknown features: {unknown}")
+
+        self.output = list(names)
+        self.order = []
+        seen = set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in registry[name].requires:
+                visit(dep)
+            self.order.append(registry[name])
+
+        for name in self.output:
+            visit(name)
+
+        self.subsets = {}
+        for feat in self.order:
+            if feat.agg is not None:
+                self.subsets.setdefault(feat.filters, []).append(feat)
+        self.columns = frozenset().union(*(f.columns for f in self.order))
+
+    def aggregate(self, ctx):
+        """
+        Runs every subset aggregation, filtering each distinct subset once.
+        """
+        ctx.ensure_columns(self.columns)
+        out = {}
+        for filters, features in self.subsets.items():
+            out.update(aggregate(ctx, filters, features))
+        return out
+
+    def finalize(self, ctx, aggregates):
+        """
+        Applies ratios and computed features on top of raw aggregates.
+
+        Returns:
+            pd.DataFrame: Output features indexed by user_id.
+        """
+        ctx.ensure_columns(self.columns)
+        for feat in self.order:
+            if feat.agg is not None:
+                values = aggregates[feat.name]
+            else:
+                values = np.asarray(feat.compute(ctx), dtype=np.float64)
+
+            if feat.per_inflow:
+                inflow = ctx['total_inflow']
+                values = np.divide(values, inflow, out=np.zeros(ctx.n_users), where=inflow > 0)
+            ctx.values[feat.name] = values
+
+        result = pd.DataFrame({n: ctx.values[n] for n in self.output}, index=ctx.users)
+        return result.rename_axis('user_id')
+
+    def run(self, ctx):
+        """
+        Computes the planned features for every user in the context.
+        """
+        return self.finalize(ctx, self.aggregate(ctx))
+
+
+# --- Computed features ---
+
+def _income_stability(ctx):
+    # Std/mean of monthly successful inflow, over each user's months from
+    # first to last inflow (months without inflow count as 0)
+    mask = ctx.mask(frozenset(('success', 'inflow')))
+    codes = ctx.user_codes[mask]
+    dates = ctx.df['date'][mask]
+    months = (dates.dt.year * 12 + dates.dt.month).to_numpy()
+    result = np.ones(ctx.n_users)
+    if len(months) == 0:
+        return result
+
+    months = months - months.min()
+    n_months = months.max() + 1
+    sums = np.bincount(codes * n_months + months, weights=ctx.df['amount'].to_numpy()[mask],
+                       minlength=ctx.n_users * n_months).reshape(ctx.n_users, n_months)
+
+    first = np.full(ctx.n_users, n_months)
+    last = np.full(ctx.n_users, -1)
+    np.minimum.at(first, codes, months)
+    np.maximum.at(last, codes, months)
+    span = np.arange(n_months)
+    sums[(span < first[:, None]) | (span > last[:, None])] = np.nan
+
+    counts = np.bincount(codes, minlength=ctx.n_users)
+    active = counts > 1
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(sums[active], axis=1)
+        std = np.nanstd(sums[active], axis=1, ddof=1)
+    result[active] = np.where(mean > 0, std / np.where(mean > 0, mean, 1.0), 1.0)
+    return result
+
+
+def _upi_stability(ctx):
+    # Coefficient of variation of successful transfer inflows
+    mask = ctx.mask(frozenset(('success', 'inflow', category(*UPI_INFLOW_CATEGORIES))))
+    stats = pd.Series(ctx.df['amount'].to_numpy()[mask]).groupby(ctx.user_codes[mask]).agg(['count', 'mean', 'std'])
+    stats = stats[stats['count'] > 1]
+    result = np.zeros(ctx.n_users)
+    result[stats.index.to_numpy()] = (stats['std'] / stats['mean']).to_numpy()
+    return result
+
+
+def _balance_family(ctx):
+    return daily_balance_features(ctx.df, ctx.as_of).reindex(ctx.users)
+
+
+def _balance(name):
+    return lambda ctx: ctx.family('balance', _balance_family)[name].to_numpy()
+
+
+def _periodicity_family(ctx):
+    return periodicity_features(ctx.df, ctx.as_of).reindex(ctx.users)
+
+
+def _periodicity(name):
+    return lambda ctx: ctx.family('periodicity', _periodicity_family)[name].to_numpy()
+
+
+def _profile(column):
+    # Static profile fields; users without a profile get 0
+    def compute(ctx):
+        if ctx.users_df is None or column not in ctx.users_df.columns:
+            return np.zeros(ctx.n_users)
+        return ctx.users_df[column].reindex(ctx.users).fillna(0).to_numpy()
+    return compute
+
+
+# --- Registered features ---
+
+SUCCESS_IN = ('success', 'inflow')
+SUCCESS_OUT = ('success', 'outflow')
+RECURRING_COLUMNS = ('date', 'amount', 'status', 'merchant_name')
+
+for _feature in [
+    # Building blocks
+    Feature('total_inflow', filters=SUCCESS_IN, agg='sum'),
+    Feature('total_outflow', filters=SUCCESS_OUT, agg='abs_sum'),
+    Feature('weekend_spend', filters=SUCCESS_OUT + ('weekend',), agg='abs_sum'),
+    Feature('weekday_spend', filters=SUCCESS_OUT + ('weekday',), agg='abs_sum'),
+
+    # --- 1. Cashflow Strength Features (35-40%) ---
+    Feature('net_cashflow', compute=lambda ctx: ctx['total_inflow'] - ctx['total_outflow'],
+            requires=('total_inflow', 'total_outflow')),
+    Feature('income_stability', columns=('date', 'amount', 'status'), compute=_income_stability),
+    Feature('eom_balance', columns=('date', 'amount', 'status'), compute=_balance('eom_balance')),
+    Feature('neg_balance_days', columns=('date', 'amount', 'status'), compute=_balance('neg_balance_days')),
+    Feature('low_balance_days', columns=('date', 'amount', 'status'), compute=_balance('low_balance_days')),
+    Feature('min_balance_30d', columns=('date', 'amount', 'status'), compute=_balance('min_balance_30d')),
+    Feature('min_balance_60d', columns=('date', 'amount', 'status'), compute=_balance('min_balance_60d')),
+    Feature('min_balance_90d', columns=('date', 'amount', 'status'), compute=_balance('min_balance_90d')),
+    # Recurring inflows (paychecks) and payments, from per-counterparty gaps
+    Feature('recurring_income_streams', columns=RECURRING_COLUMNS, compute=_periodicity('recurring_income_streams')),
+    Feature('income_cadence_days', columns=RECURRING_COLUMNS, compute=_periodicity('income_cadence_days')),
+    Feature('income_regularity', columns=RECURRING_COLUMNS, compute=_periodicity('income_regularity')),
+    Feature('days_to_next_income', columns=RECURRING_COLUMNS, compute=_periodicity('days_to_next_income')),
+    Feature('recurring_payments', columns=RECURRING_COLUMNS, compute=_periodicity('recurring_payments')),
+    Feature('recurring_outflow_ratio', columns=RECURRING_COLUMNS, compute=_periodicity('recurring_outflow'),
+            per_inflow=True),
+    Feature('days_to_next_payment', columns=RECURRING_COLUMNS, compute=_periodicity('days_to_next_payment')),
+
+    # --- 2. Digital Payment Behavior (18-22%) ---
+    Feature('declined_txns', filters=('declined',), agg='count'),
+    Feature('upi_stability', columns=('amount', 'status', 'category'), compute=_upi_stability),
+    # Wallet transfers to friends (Discretionary outflows as proxy)
+    Feature('wallet_transfers', filters=SUCCESS_OUT + (category('Discretionary'),), agg='count'),
+
+    # --- 3. Spending Type Ratios (12-15%) ---
+    Feature('essential_ratio', filters=SUCCESS_OUT + (category(*ESSENTIAL_CATEGORIES),), agg='abs_sum', per_inflow=True),
+    Feature('discretionary_ratio', filters=SUCCESS_OUT + (category(*DISCRETIONARY_CATEGORIES),), agg='abs_sum', per_inflow=True),
+    Feature('food_delivery_ratio', filters=SUCCESS_OUT + (category('Food Delivery'),), agg='abs_sum', per_inflow=True),
+    Feature('gaming_ratio', filters=SUCCESS_OUT + (category('Gaming'),), agg='abs_sum', per_inflow=True),
+    Feature('fashion_ratio', filters=SUCCESS_OUT + (category('Fashion'),), agg='abs_sum', per_inflow=True),
+
+    # --- 4. Risky Merchant & BNPL Behavior (10-15%) ---
+    Feature('gambling_ratio', filters=SUCCESS_OUT + (category('Gambling/Crypto'),), agg='abs_sum', per_inflow=True),
+    Feature('bnpl_ratio', filters=SUCCESS_OUT + (category('BNPL'),), agg='abs_sum', per_inflow=True),
+    # BNPL repayment delays (Failed BNPL txns)
+    Feature('bnpl_failures', filters=('failed', category('BNPL')), agg='count'),
+
+    # --- 5. GenZ Behavioral Patterns (10-12%) ---
+    # Night transactions (2am-5am)
+    Feature('night_txns', filters=SUCCESS_OUT + ('night',), agg='count'),
+    Feature('weekend_ratio', compute=lambda ctx: ctx['weekend_spend'] / (ctx['weekday_spend'] + 1.0),
+            requires=('weekend_spend', 'weekday_spend')),
+    # Micro-spend count (20-200)
+    Feature('micro_spends', filters=SUCCESS_OUT + ('micro',), agg='count'),
+    Feature('refunds', filters=SUCCESS_IN + (category('Refund'),), agg='count'),
+
+    # --- 6. Income Source Mix (8-10%) ---
+    Feature('parental_dependency', filters=SUCCESS_IN + (category('Parental Transfer'),), agg='sum', per_inflow=True),
+    Feature('gig_ratio', filters=SUCCESS_IN + (category('Freelance Income'),), agg='sum', per_inflow=True),
+
+    # --- 7. Subscription & Micro-Commitments (5-8%) ---
+    Feature('failed_subs', filters=('failed', category('Subscription')), agg='count'),
+    Feature('active_subs', filters=SUCCESS_OUT + (category('Subscription'),), agg='nunique', column='merchant_name'),
+
+    # --- 8. Device & App Behavior (4-6%) / 9. Personal Stability Indicators (3-5%) ---
+    Feature('sim_age', compute=_profile('sim_age_months')),
+    Feature('device_age', compute=_profile('device_age_months')),
+    Feature('loan_apps', compute=_profile('loan_apps_installed')),
+    Feature('gaming_apps', compute=_profile('gaming_apps_installed')),
+    Feature('finance_apps', compute=_profile('finance_apps_installed')),
+    Feature('signup_tenure', compute=_profile('signup_tenure_days')),
+    Feature('upi_tenure', compute=_profile('upi_id_tenure_days')),
+    Feature('address_stability', compute=_profile('address_stability_flag')),
+]:
+    register(_feature)
+
+# Default output of CashFlowFeatures, in model column order
+FEATURE_NAMES = [
+    'net_cashflow', 'income_stability', 'eom_balance', 'neg_balance_days', 'low_balance_days',
+    'min_balance_30d', 'min_balance_60d', 'min_balance_90d',
+    'recurring_income_streams', 'income_cadence_days', 'income_regularity', 'days_to_next_income',
+    'recurring_payments', 'recurring_outflow_ratio', 'days_to_next_payment',
+    'declined_txns', 'upi_stability', 'wallet_transfers',
+    'essential_ratio', 'discretionary_ratio', 'food_delivery_ratio', 'gaming_ratio', 'fashion_ratio',
+    'gambling_ratio', 'bnpl_ratio', 'bnpl_failures',
+    'night_txns', 'weekend_ratio', 'micro_spends', 'refunds',
+    'parental_dependency', 'gig_ratio',
+    'failed_subs', 'active_subs',
+    'sim_age', 'device_age', 'loan_apps', 'gaming_apps', 'finance_apps',
+    'signup_tenure', 'upi_tenure', 'address_stability'
+]
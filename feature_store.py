@@ -0,0 +1,191 @@
+import sqlite3
+import threading
+import pandas as pd
+import numpy as np
+
+# Timestamps are stored as fixed-width ISO strings, so text order is time order
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _timestamp(value):
+    return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+
+
+class FeatureStore:
+    def __init__(self, path="features.db"):
+        """
+        Opens (or creates) an on-disk feature store.
+
+        Rows are keyed by (user_id, as_of) with one REAL column per feature.
+        The table is clustered on that key, so latest-value and point-in-time
+        lookups are a single index seek.
+
+        The connection is shared by threads (e.g. request threads calling
+        CreditPipeline.score_user), so every use of it holds the store's lock.
+
+        Args:
+            path (str): SQLite database file.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS features (
+                user_id TEXT NOT NULL,
+                as_of TEXT NOT NULL,
+                PRIMARY KEY (user_id, as_of)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    @property
+    def feature_names(self):
+        """
+        Feature columns currently in the store.
+        """
+        with self._lock:
+            info = self.conn.execute("PRAGMA table_info(features)").fetchall()
+        return [row[1] for row in info if row[1] not in ('user_id', 'as_of')]
+
+    def _ensure_columns(self, names):
+        existing = set(self.feature_names)
+        for name in names:
+            if name not in existing:
+                self.conn.execute(f'ALTER TABLE features ADD COLUMN "{name}" REAL')
+
+    def write(self, features_df, as_of):
+        """
+        Bulk-writes a feature snapshot, replacing rows with the same key.
+
+        Args:
+            features_df (pd.DataFrame): Output of CashFlowFeatures.calculate_features().
+            as_of: Timestamp the features describe (e.g. CashFlowFeatures.as_of).
+
+        Returns:
+            int: Number of rows written.
+        """
+        names = features_df.columns.tolist()
+        values = features_df.to_numpy(dtype=np.float64)
+        values = np.where(np.isnan(values), None, values).tolist()
+        stamp = _timestamp(as_of)
+        rows = [(str(uid), stamp, *vals) for uid, vals in zip(features_df.index, values)]
+
+        columns = ', '.join(f'"{n}"' for n in names)
+        placeholders = ', '.join(['?'] * (len(names) + 2))
+        with self._lock, self.conn:
+            self._ensure_columns(names)
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO features (user_id, as_of, {columns}) VALUES ({placeholders})', rows
+            )
+        return len(rows)
+
+    def _select(self, feature_names):
+        names = feature_names if feature_names is not None else self.feature_names
+        return names, ', '.join(f'f."{n}"' for n in names)
+
+    def latest(self, user_id, feature_names=None):
+        """
+        Returns a user's most recent feature row.
+
+        Args:
+            user_id: User to look up.
+            feature_names (list): Columns to return (default: all).
+
+        Returns:
+            pd.Series: Features (with 'as_of'), or None if the user is unknown.
+        """
+        names, select = self._select(feature_names)
+        with self._lock:
+            row = self.conn.execute(
+                f'SELECT f.as_of, {select} FROM features f WHERE f.user_id = ? ORDER BY f.as_of DESC LIMIT 1',
+                (str(user_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        return pd.Series(row, index=['as_of'] + names, name=str(user_id))
+
+    def read_latest(self, user_ids=None, feature_names=None):
+        """
+        Returns the most recent feature row for many users.
+
+        Args:
+            user_ids (list): Users to read (default: every user in the store).
+            feature_names (list): Columns to return (default: all).
+
+        Returns:
+            pd.DataFrame: Indexed by user_id, with an 'as_of' column.
+        """
+        if user_ids is None:
+            user_ids = self._user_ids()
+        requests = pd.DataFrame({'user_id': user_ids, 'as_of': pd.Timestamp.max})
+        return self.read_point_in_time(requests, feature_names).set_index('user_id')
+
+    def read_as_of(self, as_of, user_ids=None, feature_names=None):
+        """
+        Returns every user's features as they were known at one timestamp.
+        """
+        if user_ids is None:
+            user_ids = self._user_ids()
+        requests = pd.DataFrame({'user_id': user_ids, 'as_of': as_of})
+        return self.read_point_in_time(requests, feature_names).set_index('user_id')
+
+    def read_point_in_time(self, requests, feature_names=None):
+        """
+        Batched point-in-time read: for each (user_id, as_of) request, the
+        latest snapshot at or before that timestamp. Snapshots written later
+        are never returned, which keeps training sets free of leakage.
+
+        Args:
+            requests (pd.DataFrame): 'user_id' and 'as_of' columns.
+            feature_names (list): Columns to return (default: all).
+
+        Returns:
+            pd.DataFrame: One row per matched request, in request order, with
+                'user_id', 'as_of' (the requested time), 'feature_as_of' and features.
+        """
+        names, select = self._select(feature_names)
+        stamps = pd.to_datetime(requests['as_of']).dt.strftime(TIMESTAMP_FORMAT)
+        rows = list(zip(range(len(requests)), requests['user_id'].astype(str), stamps))
+
+        # The temp table is per connection: the lock keeps concurrent reads apart
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS pit_requests (rid INTEGER PRIMARY KEY, user_id TEXT, as_of TEXT)")
+            self.conn.execute("DELETE FROM pit_requests")
+            self.conn.executemany("INSERT INTO pit_requests VALUES (?, ?, ?)", rows)
+            result = self.conn.execute(f"""
+                SELECT r.rid, r.user_id, r.as_of, f.as_of, {select}
+                FROM pit_requests r
+                JOIN features f ON f.user_id = r.user_id AND f.as_of = (
+                    SELECT MAX(g.as_of) FROM features g
+                    WHERE g.user_id = r.user_id AND g.as_of <= r.as_of
+                )
+                ORDER BY r.rid
+            """).fetchall()
+
+        df = pd.DataFrame(result, columns=['rid', 'user_id', 'as_of', 'feature_as_of'] + names)
+        return df.drop('rid', axis=1)
+
+    def _user_ids(self):
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT user_id FROM features")]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    import time
+
+    store = FeatureStore()
+    users = [r[0] for r in store.conn.execute("SELECT DISTINCT user_id FROM features LIMIT 1000")]
+    if not users:
+        print("Feature store is empty. Run features.py first.")
+    else:
+        start = time.perf_counter()
+        for uid in users:
+            store.latest(uid)
+        elapsed = (time.perf_counter() - start) / len(users)
+        print(f"{len(users)} latest-value lookups: {elapsed * 1000:.3f} ms each")
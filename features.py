@@ -1,227 +1,116 @@
 import pandas as pd
 import numpy as np
+from feature_registry import FeatureContext, FeaturePlan, FEATURE_NAMES
+from feature_store import FeatureStore
+from feature_matrix import save_feature_matrix
+from dedup import deduplicate_transactions
+from validation import validate_inputs
+from categorizer import MerchantCategorizer
 
 class CashFlowFeatures:
-    def __init__(self, transactions_df, users_df=None):
+    def __init__(self, transactions_df, users_df=None, as_of=None):
         """
         Initializes the feature engineering class.
         
         Args:
             transactions_df (pd.DataFrame): DataFrame containing raw transaction logs.
             users_df (pd.DataFrame): DataFrame containing static user profile data.
+            as_of: Point in time to compute features for; later transactions
+                are ignored and balances run to this day. By default each
+                user's history ends at their own last transaction, so a
+                user's features do not depend on the rest of the batch.
         """
         self.df = transactions_df.copy()
         self.df['date'] = pd.to_datetime(self.df['date'])
+        if as_of is not None:
+            as_of = pd.Timestamp(as_of).normalize()
+            self.df = self.df[self.df['date'] < as_of + pd.Timedelta(days=1)]
+        
+        # Raw statements carry merchant descriptors only: derive categories
+        self.uncategorized = pd.Series(dtype=np.int64, name='rows')
+        if 'category' not in self.df.columns:
+            self.df['category'], self.uncategorized = MerchantCategorizer().categorize_frame(self.df)
         self.df = self.df.sort_values(['user_id', 'date'])
         
-        # Handle time if present
-        if 'time' in self.df.columns:
-            self.df['datetime'] = pd.to_datetime(self.df['date'].astype(str) + ' ' + self.df['time'].astype(str))
-            self.df['hour'] = self.df['datetime'].dt.hour
-        else:
-            self.df['hour'] = 12 # Default to noon if missing
+        # Point in time the features describe (latest transaction seen by default)
+        self.cutoff = as_of # None: each user's own last transaction
+        self.as_of = as_of if as_of is not None else self.df['date'].max()
             
         self.users_df = users_df
         if self.users_df is not None:
             self.users_df = self.users_df.set_index('user_id')
         
-    def calculate_features(self):
+    def calculate_features(self, feature_names=None):
         """
         Calculates the specific features for each user.
-        """
-        features = []
-        
-        for user_id, group in self.df.groupby('user_id'):
-            user_features = self._calculate_user_features(user_id, group)
-            features.append(user_features)
-            
-        return pd.DataFrame(features).set_index('user_id')
-    
-    def _calculate_user_features(self, user_id, group):
-        """
-        Calculates features for a single user.
-        """
-        # Helper variables
-        inflows = group[group['amount'] > 0]
-        outflows = group[group['amount'] < 0]
-        
-        # Filter for successful transactions for most calcs
-        success_group = group[group['status'] == 'Success'] if 'status' in group.columns else group
-        success_inflows = success_group[success_group['amount'] > 0]
-        success_outflows = success_group[success_group['amount'] < 0]
-        
-        total_inflow = success_inflows['amount'].sum()
-        total_outflow = abs(success_outflows['amount'].sum())
-        
-        # --- 1. Cashflow Strength Features (35-40%) ---
-        # Net monthly cashflow
-        net_cashflow = total_inflow - total_outflow
-        
-        # Income stability (month-to-month)
-        if len(success_inflows) > 1:
-            monthly_inflow = success_inflows.set_index('date').resample('M')['amount'].sum()
-            income_stability = monthly_inflow.std() / monthly_inflow.mean() if monthly_inflow.mean() > 0 else 1.0
-        else:
-            income_stability = 1.0 # High volatility
-            
-        # End-of-month balance (buffer) - Simulated
-        group['balance'] = group['amount'].cumsum()
-        eom_balance = group.set_index('date').resample('M')['balance'].last().mean()
-        
-        # Negative balance days
-        neg_balance_days = len(group[group['balance'] < 0])
-        
-        # Frequent low-balance (<200)
-        low_balance_days = len(group[group['balance'] < 200])
-        
-        # --- 2. Digital Payment Behavior (18-22%) ---
-        # UPI declined transactions
-        if 'status' in group.columns:
-            declined_txns = len(group[group['status'] == 'Declined'])
-        else:
-            declined_txns = 0
-            
-        # UPI inflow stability (same as income stability but specifically for transfers)
-        upi_inflows = success_inflows[success_inflows['category'].isin(['Transfer In', 'Parental Transfer'])]
-        if len(upi_inflows) > 1:
-            upi_stability = upi_inflows['amount'].std() / upi_inflows['amount'].mean()
-        else:
-            upi_stability = 0.0
-            
-        # Wallet transfers to friends (Outflows to Discretionary/Transfer)
-        wallet_transfers = len(success_outflows[success_outflows['category'] == 'Discretionary']) # Proxy
-        
-        # --- 3. Spending Type Ratios (12-15%) ---
-        def get_ratio(cat_list):
-            spend = abs(success_outflows[success_outflows['category'].isin(cat_list)]['amount'].sum())
-            return spend / total_inflow if total_inflow > 0 else 0.0
-            
-        essential_ratio = get_ratio(['Essential', 'Rent', 'Utilities', 'Grocery', 'Gas', 'Medical'])
-        discretionary_ratio = get_ratio(['Discretionary', 'Shopping', 'Entertainment'])
-        food_delivery_ratio = get_ratio(['Food Delivery'])
-        gaming_ratio = get_ratio(['Gaming'])
-        fashion_ratio = get_ratio(['Fashion'])
-        
-        # --- 4. Risky Merchant & BNPL Behavior (10-15%) ---
-        gambling_crypto_spend = abs(success_outflows[success_outflows['category'] == 'Gambling/Crypto']['amount'].sum())
-        gambling_ratio = gambling_crypto_spend / total_inflow if total_inflow > 0 else 0.0
         
-        bnpl_spend = abs(success_outflows[success_outflows['category'] == 'BNPL']['amount'].sum())
-        bnpl_ratio = bnpl_spend / total_inflow if total_inflow > 0 else 0.0
+        Features are declared in feature_registry.py and compiled into one
+        shared plan, so only the requested features (and what they depend on)
+        are computed.
         
-        # BNPL repayment delays (Failed BNPL txns)
-        if 'status' in group.columns:
-            bnpl_failures = len(group[(group['category'] == 'BNPL') & (group['status'] == 'Failed')])
-        else:
-            bnpl_failures = 0
-            
-        # --- 5. GenZ Behavioral Patterns (10-12%) ---
-        # Night transactions (2am-5am)
-        night_txns = len(success_outflows[(success_outflows['hour'] >= 2) & (success_outflows['hour'] <= 5)])
-        
-        # Weekend overspending
-        weekend_spend = abs(success_outflows[success_outflows['date'].dt.weekday >= 5]['amount'].sum())
-        weekday_spend = abs(success_outflows[success_outflows['date'].dt.weekday < 5]['amount'].sum())
-        weekend_ratio = weekend_spend / (weekday_spend + 1.0)
-        
-        # Micro-spend count (20-200)
-        micro_spends = len(success_outflows[(abs(success_outflows['amount']) >= 20) & (abs(success_outflows['amount']) <= 200)])
-        
-        # Refund-driven spending
-        refunds = len(success_inflows[success_inflows['category'] == 'Refund'])
-        
-        # --- 6. Income Source Mix (8-10%) ---
-        # Parental transfer dependency
-        parental_income = success_inflows[success_inflows['category'] == 'Parental Transfer']['amount'].sum()
-        parental_dependency = parental_income / total_inflow if total_inflow > 0 else 0.0
-        
-        # Gig income
-        gig_income = success_inflows[success_inflows['category'] == 'Freelance Income']['amount'].sum()
-        gig_ratio = gig_income / total_inflow if total_inflow > 0 else 0.0
-        
-        # --- 7. Subscription & Micro-Commitments (5-8%) ---
-        # Failed subscriptions
-        if 'status' in group.columns:
-            failed_subs = len(group[(group['category'] == 'Subscription') & (group['status'] == 'Failed')])
-        else:
-            failed_subs = 0
-            
-        active_subs = success_outflows[success_outflows['category'] == 'Subscription']['merchant_name'].nunique()
-        
-        # --- 8. Device & App Behavior (4-6%) ---
-        # From users_df
-        if self.users_df is not None and user_id in self.users_df.index:
-            u = self.users_df.loc[user_id]
-            sim_age = u.get('sim_age_months', 0)
-            device_age = u.get('device_age_months', 0)
-            loan_apps = u.get('loan_apps_installed', 0)
-            gaming_apps = u.get('gaming_apps_installed', 0)
-            finance_apps = u.get('finance_apps_installed', 0)
-            signup_tenure = u.get('signup_tenure_days', 0)
-            upi_tenure = u.get('upi_id_tenure_days', 0)
-            address_stability = u.get('address_stability_flag', 0)
-        else:
-            sim_age = 0
-            device_age = 0
-            loan_apps = 0
-            gaming_apps = 0
-            finance_apps = 0
-            signup_tenure = 0
-            upi_tenure = 0
-            address_stability = 0
-            
-        # --- 9. Personal Stability Indicators (3-5%) ---
-        # (Covered above with tenure vars)
+        Args:
+            feature_names (list): Features to compute, e.g. the loaded model's
+                feature names. Defaults to all of FEATURE_NAMES.
         
-        return {
-            'user_id': user_id,
-            'net_cashflow': net_cashflow,
-            'income_stability': income_stability,
-            'eom_balance': eom_balance,
-            'neg_balance_days': neg_balance_days,
-            'low_balance_days': low_balance_days,
-            'declined_txns': declined_txns,
-            'upi_stability': upi_stability,
-            'wallet_transfers': wallet_transfers,
-            'essential_ratio': essential_ratio,
-            'discretionary_ratio': discretionary_ratio,
-            'food_delivery_ratio': food_delivery_ratio,
-            'gaming_ratio': gaming_ratio,
-            'fashion_ratio': fashion_ratio,
-            'gambling_ratio': gambling_ratio,
-            'bnpl_ratio': bnpl_ratio,
-            'bnpl_failures': bnpl_failures,
-            'night_txns': night_txns,
-            'weekend_ratio': weekend_ratio,
-            'micro_spends': micro_spends,
-            'refunds': refunds,
-            'parental_dependency': parental_dependency,
-            'gig_ratio': gig_ratio,
-            'failed_subs': failed_subs,
-            'active_subs': active_subs,
-            'sim_age': sim_age,
-            'device_age': device_age,
-            'loan_apps': loan_apps,
-            'gaming_apps': gaming_apps,
-            'finance_apps': finance_apps,
-            'signup_tenure': signup_tenure,
-            'upi_tenure': upi_tenure,
-            'address_stability': address_stability
-        }
+        Returns:
+            pd.DataFrame: Features indexed by user_id, in the requested order.
+        """
+        plan = FeaturePlan(feature_names if feature_names is not None else FEATURE_NAMES)
+        return plan.run(FeatureContext(self.df, self.users_df, self.cutoff))
+
+def build_features(transactions_path="transactions.csv", users_path="users.csv",
+                   features_path="features.csv", store_path="features.db", matrix_path="features.bin",
+                   quarantine_path="quarantine.csv"):
+    """
+    Builds features from raw CSVs: validate, dedup, compute, save, and snapshot into the store.
+    
+    Args:
+        transactions_path (str): Raw transactions CSV.
+        users_path (str): User profiles CSV (optional, skipped if missing).
+        features_path (str): Output features CSV.
+        store_path (str): Feature store to append the snapshot to (None to skip).
+        matrix_path (str): Binary feature matrix (and cached DMatrix) for
+            train_model.py, see feature_matrix.py (None to skip).
+        quarantine_path (str): Where to write invalid transactions, with
+            the reason, when there are any (None to skip).
+    """
+    df = pd.read_csv(transactions_path, dtype={'user_id': str})
+    try:
+        users = pd.read_csv(users_path, dtype={'user_id': str})
+    except FileNotFoundError:
+        print(f"{users_path} not found, proceeding without it.")
+        users = None
+        
+    df, users, quarantined, _, validation_report = validate_inputs(df, users, max_date=pd.Timestamp.now())
+    print(f"Validation: {validation_report}")
+    if len(quarantined) and quarantine_path is not None:
+        quarantined.to_csv(quarantine_path, index=False)
+        print(f"Quarantined {len(quarantined):,} transactions to {quarantine_path}")
+    if df.empty:
+        print("No valid transactions, nothing to build.")
+        return
+        
+    df, dedup_report = deduplicate_transactions(df)
+    print(f"Dedup: {dedup_report}")
+        
+    features_engine = CashFlowFeatures(df, users)
+    features_df = features_engine.calculate_features()
+    print(features_df.head())
+    features_df.to_csv(features_path)
+    print(f"Saved to {features_path}")
+    
+    if matrix_path is not None:
+        save_feature_matrix(features_df, matrix_path)
+        print(f"Saved binary feature matrix to {matrix_path}/")
+    
+    if store_path is not None:
+        store = FeatureStore(store_path)
+        written = store.write(features_df, features_engine.as_of)
+        store.close()
+        print(f"Stored {written} feature rows as of {features_engine.as_of} in {store_path}")
 
 if __name__ == "__main__":
     try:
-        df = pd.read_csv("transactions.csv", dtype={'user_id': str})
-        try:
-            users = pd.read_csv("users.csv", dtype={'user_id': str})
-        except FileNotFoundError:
-            print("users.csv not found, proceeding without it.")
-            users = None
-            
-        features_engine = CashFlowFeatures(df, users)
-        features_df = features_engine.calculate_features()
-        print(features_df.head())
-        features_df.to_csv("features.csv")
-        print("Saved to features.csv")
+        build_features()
     except FileNotFoundError:
         print("transactions.csv not found. Run data_gen.py first.")
@@ -0,0 +1,204 @@
+import threading
+from collections import deque
+import numpy as np
+from dedup import transaction_timestamps
+
+# Sliding windows, in hourly buckets
+WINDOWS = {'1h': 1, '24h': 24, '7d': 168}
+RING_HOURS = max(WINDOWS.values())
+
+# Per-event signals tracked by the velocity counters
+SIGNALS = ('txns', 'declined', 'new_merchant', 'night', 'rapid_transfer')
+
+# An outflow of at least this share of an inflow received within the last
+# hour counts as a rapid in/out transfer
+RAPID_TRANSFER_SHARE = 0.8
+RAPID_TRANSFER_SECONDS = 3600
+
+# Fraud score contributions: (signal, window, minimum count, weight, reason)
+FRAUD_RULES = [
+    ('declined', '1h', 3, 0.6, 'Declined-transaction burst (1h)'),
+    ('declined', '24h', 6, 0.4, 'Repeated declines (24h)'),
+    ('new_merchant', '24h', 6, 0.3, 'Many new merchants (24h)'),
+    ('night', '1h', 4, 0.3, 'Night-time spending spike'),
+    ('rapid_transfer', '24h', 2, 0.6, 'Rapid in/out transfers (24h)'),
+]
+
+
+class VelocityCounter:
+    def __init__(self):
+        """
+        Hourly-bucketed counters for every signal over all windows.
+
+        Only hours with activity get a bucket. Each window keeps a running
+        total and a pointer to its oldest bucket; as the clock moves, buckets
+        are retired from each window exactly once. Recording an event and
+        reading a window are O(1) amortized, however long a user was idle.
+        """
+        self.buckets = deque() # [hour, counts]
+        self.totals = {w: [0] * len(SIGNALS) for w in WINDOWS}
+        self.first = {w: 0 for w in WINDOWS} # absolute index of oldest bucket in window
+        self.dropped = 0 # buckets popped from the left of the deque
+        self.hour = None
+
+    def advance(self, hour):
+        """
+        Moves the clock forward to `hour`, retiring buckets that leave each window.
+        """
+        if self.hour is not None and hour <= self.hour:
+            return
+        self.hour = hour
+        for w, size in WINDOWS.items():
+            totals = self.totals[w]
+            i = self.first[w]
+            while i - self.dropped < len(self.buckets) and self.buckets[i - self.dropped][0] <= hour - size:
+                for s, count in enumerate(self.buckets[i - self.dropped][1]):
+                    totals[s] -= count
+                i += 1
+            self.first[w] = i
+        while self.buckets and self.buckets[0][0] <= hour - RING_HOURS:
+            self.buckets.popleft()
+            self.dropped += 1
+
+    def add(self, hour, signal_counts):
+        """
+        Records one event's signal counts at `hour`.
+
+        Events older than the current clock (out of order) are counted in
+        the current hour.
+        """
+        self.advance(hour)
+        if not self.buckets or self.buckets[-1][0] != self.hour:
+            self.buckets.append([self.hour, [0] * len(SIGNALS)])
+        bucket = self.buckets[-1][1]
+        for s, count in enumerate(signal_counts):
+            if count:
+                bucket[s] += count
+                for totals in self.totals.values():
+                    totals[s] += count
+
+    def window(self, w):
+        """
+        Returns {signal: count} over window `w` ending at the current hour.
+        """
+        return dict(zip(SIGNALS, self.totals[w]))
+
+
+class UserVelocity:
+    def __init__(self):
+        self.counter = VelocityCounter()
+        self.merchants = set()
+        self.recent_inflows = deque() # (timestamp, amount) within RAPID_TRANSFER_SECONDS
+
+
+class FraudGate:
+    def __init__(self, rules=None):
+        """
+        Real-time fraud gate over per-user velocity state.
+
+        Feed it transactions with `observe` (streaming) or `observe_frame`
+        (batch replay), then `score` users as of the latest event seen.
+        Scoring moves the velocity windows forward too, so every call takes
+        the gate's lock and one gate can be shared by request threads.
+
+        Args:
+            rules (list): Fraud rules, defaults to FRAUD_RULES.
+        """
+        self.rules = FRAUD_RULES if rules is None else rules
+        self.users = {}
+        self.clock = None
+        self.lock = threading.Lock()
+
+    def observe(self, user_id, timestamp, amount, merchant_name=None, status='Success'):
+        """
+        Updates a user's velocity state with one transaction.
+
+        Args:
+            user_id: User the transaction belongs to.
+            timestamp (float): Seconds since the epoch.
+            amount (float): Signed amount (inflows positive).
+            merchant_name (str): Counterparty.
+            status (str): 'Success', 'Declined' or 'Failed'.
+        """
+        with self.lock:
+            self._observe(user_id, timestamp, amount, merchant_name, status)
+
+    def _observe(self, user_id, timestamp, amount, merchant_name, status):
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = UserVelocity()
+
+        timestamp = float(timestamp)
+        hour = int(timestamp // 3600)
+        declined = status == 'Declined'
+        success = status == 'Success'
+
+        new_merchant = night = rapid = 0
+        if amount < 0 and merchant_name is not None and merchant_name not in state.merchants:
+            state.merchants.add(merchant_name)
+            new_merchant = 1
+
+        if success:
+            inflows = state.recent_inflows
+            while inflows and timestamp - inflows[0][0] > RAPID_TRANSFER_SECONDS:
+                inflows.popleft()
+            if amount > 0:
+                inflows.append((timestamp, amount))
+            elif amount < 0:
+                night = 1 if 2 <= hour % 24 <= 5 else 0
+                if any(-amount >= RAPID_TRANSFER_SHARE * a for _, a in inflows):
+                    rapid = 1
+
+        state.counter.add(hour, (1, int(declined), new_merchant, night, rapid))
+        if self.clock is None or timestamp > self.clock:
+            self.clock = timestamp
+
+    def observe_frame(self, transactions_df):
+        """
+        Replays a transactions DataFrame in time order (batch scoring).
+
+        Args:
+            transactions_df (pd.DataFrame): Raw transactions ('user_id', 'date',
+                'amount' and optionally 'time', 'merchant_name', 'status').
+        """
+        df = transactions_df
+        seconds = transaction_timestamps(df).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+        order = np.argsort(seconds, kind='stable')
+        merchants = df['merchant_name'].to_numpy() if 'merchant_name' in df.columns else [None] * len(df)
+        statuses = df['status'].to_numpy() if 'status' in df.columns else ['Success'] * len(df)
+        user_ids = df['user_id'].to_numpy()
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+
+        with self.lock:
+            for i in order:
+                self._observe(user_ids[i], seconds[i], amounts[i], merchants[i], statuses[i])
+
+    def signals(self, user_id, now=None):
+        """
+        Returns a user's signal counts per window, as of `now` (default:
+        the latest event seen by the gate).
+        """
+        with self.lock:
+            state = self.users.get(user_id)
+            if state is None:
+                return {w: dict.fromkeys(SIGNALS, 0) for w in WINDOWS}
+            now = self.clock if now is None else now
+            state.counter.advance(int(now // 3600))
+            return {w: state.counter.window(w) for w in WINDOWS}
+
+    def score(self, user_id, now=None):
+        """
+        Scores a user from their velocity signals.
+
+        Returns:
+            tuple: (fraud_score in [0, 1], list of triggered rule reasons)
+        """
+        signals = self.signals(user_id, now)
+        score = 0.0
+        reasons = []
+        for signal, window, threshold, weight, reason in self.rules:
+            if signals[window][signal] >= threshold:
+                score += weight
+                reasons.append(reason)
+        return min(score, 1.0), reasons
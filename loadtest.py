@@ -0,0 +1,372 @@
+# Open-loop load generator for decision latency: replays synthetic applicants
+# against the in-process CreditPipeline or a local HTTP scoring endpoint at a
+# fixed request rate, and sweeps rates to find where throughput saturates.
+#
+#   python loadtest.py --rates 50 100 200 400 --concurrency 4 --duration 10
+#   python loadtest.py --url http://localhost:8000/score --rates 100 --output run.json
+import argparse
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+PERCENTILES = [50, 95, 99, 99.9]
+
+
+class LatencyHistogram:
+    def __init__(self, max_seconds=60.0, sub_bucket_bits=8):
+        """
+        HDR-style latency histogram (log-linear buckets over microseconds).
+
+        Values below 2**sub_bucket_bits microseconds are recorded exactly;
+        above that every power-of-two range is split into 2**(sub_bucket_bits
+        - 1) equal buckets, so any recorded value is reported within 1/128
+        (default) of its true value. Recording is O(1), memory is fixed and
+        histograms from different threads merge by adding counts.
+
+        Args:
+            max_seconds (float): Largest trackable latency (larger values are
+                clamped into the top bucket; the exact maximum is kept).
+            sub_bucket_bits (int): Precision, see above.
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.half = 1 << (sub_bucket_bits - 1)
+        self.max_us = int(max_seconds * 1e6)
+        self.counts = np.zeros(self._index(self.max_us) + 1, dtype=np.int64)
+        self.total = 0
+        self.sum_us = 0
+        self.max_seen_us = 0
+
+    def _index(self, us):
+        shift = max(0, us.bit_length() - self.sub_bucket_bits)
+        return shift * self.half + (us >> shift)
+
+    def _value(self, index):
+        # Highest value that maps to `index` (HDR's "highest equivalent value")
+        if index < 2 * self.half:
+            return index
+        shift = index // self.half - 1
+        return ((index - shift * self.half + 1) << shift) - 1
+
+    def record(self, seconds):
+        us = max(0, int(seconds * 1e6))
+        self.counts[self._index(min(us, self.max_us))] += 1
+        self.total += 1
+        self.sum_us += us
+        self.max_seen_us = max(self.max_seen_us, us)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_seen_us = max(self.max_seen_us, other.max_seen_us)
+        return self
+
+    def percentile(self, q):
+        """
+        Returns the q-th percentile latency in milliseconds (NaN if empty).
+        """
+        if not self.total:
+            return np.nan
+        rank = max(1, int(np.ceil(q / 100 * self.total)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._value(index), self.max_seen_us) / 1000
+
+    def mean(self):
+        return self.sum_us / self.total / 1000 if self.total else np.nan
+
+    def max(self):
+        return self.max_seen_us / 1000
+
+
+def generate_applicants(num_users=500, feature_names=None, seed=0):
+    """
+    Builds scoring requests from data_gen's synthetic users.
+
+    Args:
+        num_users (int): Synthetic users to generate.
+        feature_names (list): Features to compute (default: all).
+        seed (int): Seed for reproducible applicants.
+
+    Returns:
+        tuple: (list of feature dicts with 'user_id', FraudGate primed with
+            their transactions)
+    """
+    from data_gen import generate_synthetic_data
+    from dedup import deduplicate_transactions
+    from features import CashFlowFeatures
+    from fraud import FraudGate
+
+    random.seed(seed)
+    np.random.seed(seed)
+    transactions_df, users_df = generate_synthetic_data(num_users)
+    transactions_df['user_id'] = transactions_df['user_id'].astype(str)
+    users_df['user_id'] = users_df['user_id'].astype(str)
+    transactions_df, _ = deduplicate_transactions(transactions_df)
+    features_df = CashFlowFeatures(transactions_df, users_df).calculate_features(feature_names)
+
+    fraud_gate = FraudGate()
+    fraud_gate.observe_frame(transactions_df)
+    applicants = [{'user_id': user_id, **{k: float(v) for k, v in row.items()}}
+                  for user_id, row in features_df.iterrows()]
+    return applicants, fraud_gate
+
+
+def pipeline_target(model_path="model_bundle", fraud_gate=None):
+    """
+    Returns a request function scoring one applicant with an in-process pipeline.
+    """
+    from pipeline import CreditPipeline
+    pipeline = CreditPipeline(model_path, fraud_gate=fraud_gate)
+    if pipeline.model is None:
+        sys.exit(f"Model bundle {model_path} not found. Run train_model.py first.")
+
+    def score(applicant):
+        result = pipeline.run_waterfall(applicant)
+        if result['decision'] == 'Error':
+            raise RuntimeError(result['reason'])
+        return result
+    return score, pipeline.required_features
+
+
+def endpoint_target(url, timeout=10.0):
+    """
+    Returns a request function POSTing one applicant as JSON to `url`.
+
+    Each worker thread keeps its own keep-alive connection; any non-2xx
+    response counts as an error.
+    """
+    import http.client
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    path = parts.path or '/'
+    local = threading.local()
+    headers = {'Content-Type': 'application/json'}
+
+    def score(body):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = connection_class(parts.netloc, timeout=timeout)
+        try:
+            connection.request('POST', path, body=body, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except Exception:
+            connection.close()
+            local.connection = None
+            raise
+        if not 200 <= response.status < 300:
+            raise RuntimeError(f"HTTP {response.status}")
+        return payload
+    return score
+
+
+def run_load(target, requests, rate, duration, concurrency, arrivals='poisson', seed=0):
+    """
+    Offers `rate` requests/s for `duration` seconds (open loop).
+
+    Arrival times are fixed up front and do not wait for responses, so a
+    slow server builds a queue instead of slowing the generator down.
+    Latency is measured from each request's scheduled arrival, so queueing
+    delay is included (no coordinated omission); service time is measured
+    from when a worker picked the request up.
+
+    Args:
+        target (callable): Sends one request; raises on failure.
+        requests (list): Request payloads, replayed round-robin.
+        rate (float): Offered requests per second.
+        duration (float): Seconds of arrivals.
+        concurrency (int): Worker threads (requests in flight at most).
+        arrivals (str): 'poisson' (exponential gaps) or 'uniform'.
+        seed (int): Seed for the arrival process.
+
+    Returns:
+        dict: Offered and achieved rates, latency percentiles (ms), errors.
+    """
+    n = max(1, int(rate * duration))
+    if arrivals == 'poisson':
+        offsets = np.cumsum(np.random.default_rng(seed).exponential(1 / rate, n))
+    else:
+        offsets = np.arange(n) / rate
+
+    work = queue.Queue()
+    latency = [LatencyHistogram() for _ in range(concurrency)]
+    service = [LatencyHistogram() for _ in range(concurrency)]
+    errors = [0] * concurrency
+    finished = [0.0] * concurrency
+
+    def worker(w):
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            scheduled, payload = item
+            started = time.perf_counter()
+            try:
+                target(payload)
+            except Exception:
+                errors[w] += 1
+            done = time.perf_counter()
+            latency[w].record(done - scheduled)
+            service[w].record(done - started)
+            finished[w] = done
+
+    threads = [threading.Thread(target=worker, args=(w,), daemon=True) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for i, offset in enumerate(offsets):
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        work.put((scheduled, requests[i % len(requests)]))
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+
+    latency = _merge(latency)
+    service = _merge(service)
+    elapsed = max(finished) - start
+    result = {
+        'rate': rate,
+        'offered': n / offsets[-1] if offsets[-1] > 0 else np.nan, # realized arrival rate
+        'requests': n,
+        'errors': sum(errors),
+        'throughput': n / elapsed if elapsed > 0 else np.nan,
+        'mean_ms': latency.mean(),
+        'max_ms': latency.max(),
+        'service_p50_ms': service.percentile(50),
+        'service_p99_ms': service.percentile(99),
+    }
+    for q in PERCENTILES:
+        result[f'p{q:g}_ms'] = latency.percentile(q)
+    return result
+
+
+def _merge(histograms):
+    merged = LatencyHistogram()
+    for histogram in histograms:
+        merged.merge(histogram)
+    return merged
+
+
+def sweep(target, requests, rates, duration, concurrency, arrivals='poisson', slo_ms=None,
+          keep_up=0.95, seed=0):
+    """
+    Runs run_load() at increasing rates until the target saturates.
+
+    A rate is saturated when achieved throughput falls below `keep_up` of
+    the realized arrival rate, or p99 latency exceeds `slo_ms`.
+
+    Returns:
+        tuple: (results DataFrame indexed by offered rate, highest rate that
+            was not saturated or None)
+    """
+    results = []
+    sustained = None
+    for rate in sorted(rates):
+        result = run_load(target, requests, rate, duration, concurrency, arrivals, seed)
+        result['saturated'] = bool(result['throughput'] < keep_up * result['offered'] or
+                                   (slo_ms is not None and result['p99_ms'] > slo_ms))
+        results.append(result)
+        print(f"{rate:>8g} req/s offered: {result['throughput']:8.1f} req/s, "
+              f"p50 {result['p50_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms, errors {result['errors']}"
+              + ("  SATURATED" if result['saturated'] else ""))
+        if result['saturated']:
+            break
+        sustained = rate
+    return pd.DataFrame(results).set_index('rate'), sustained
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Lists percentiles that got slower than `baseline` by more than `tolerance`.
+
+    Args:
+        results (pd.DataFrame): sweep() results.
+        baseline (pd.DataFrame): Results of an earlier run (same rates).
+        tolerance (float): Allowed relative increase.
+
+    Returns:
+        list: (rate, percentile column, baseline ms, current ms) per regression.
+    """
+    regressions = []
+    for rate in results.index.intersection(baseline.index):
+        for q in PERCENTILES:
+            col = f'p{q:g}_ms'
+            before, after = baseline.loc[rate, col], results.loc[rate, col]
+            if after > before * (1 + tolerance):
+                regressions.append((rate, col, before, after))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load test of credit decisions.")
+    parser.add_argument("--url", default=None, help="Scoring endpoint to POST JSON applicants to (default: in-process pipeline)")
+    parser.add_argument("--model", default="model_bundle", help="Model bundle for in-process scoring")
+    parser.add_argument("--rates", type=float, nargs="+", default=[50, 100, 200, 400, 800],
+                        help="Offered request rates to sweep (req/s)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per rate")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at most")
+    parser.add_argument("--arrivals", choices=['poisson', 'uniform'], default='poisson', help="Arrival process")
+    parser.add_argument("--num-users", type=int, default=500, help="Synthetic applicants to replay")
+    parser.add_argument("--slo-ms", type=float, default=None, help="p99 latency above which a rate counts as saturated")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--baseline", default=None, help="Earlier --output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown vs. the baseline")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for applicants and arrivals")
+    args = parser.parse_args()
+
+    if args.url:
+        applicants, _ = generate_applicants(args.num_users, seed=args.seed)
+        target = endpoint_target(args.url)
+        requests = [json.dumps(a).encode() for a in applicants]
+    else:
+        from model_bundle import ModelBundle
+        feature_names = ModelBundle(args.model).feature_names
+        applicants, fraud_gate = generate_applicants(args.num_users, feature_names, seed=args.seed)
+        target, _ = pipeline_target(args.model, fraud_gate)
+        requests = applicants
+
+    # Warm-up: first-call costs (lazy imports, caches) are not part of the test
+    for payload in requests:
+        try:
+            target(payload)
+        except Exception as e:
+            sys.exit(f"Warm-up request failed: {e}")
+
+    print(f"Load test: {len(requests)} applicants, concurrency {args.concurrency}, "
+          f"{args.duration:g}s per rate, {args.arrivals} arrivals")
+    results, sustained = sweep(target, requests, args.rates, args.duration, args.concurrency,
+                               args.arrivals, args.slo_ms, seed=args.seed)
+    print(f"\n{results.round(2).to_string()}")
+    if sustained is None:
+        print(f"\nSaturated already at {results.index[0]:g} req/s")
+    elif results['saturated'].any():
+        print(f"\nSaturation point: between {sustained:g} and {results.index[-1]:g} req/s")
+    else:
+        print(f"\nNo saturation up to {sustained:g} req/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'concurrency': args.concurrency, 'duration': args.duration, 'arrivals': args.arrivals,
+                       'target': args.url or args.model, 'results': results.reset_index().to_dict('records')},
+                      f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = pd.DataFrame(json.load(f)['results']).set_index('rate')
+        regressions = compare(results, baseline, args.tolerance)
+        for rate, col, before, after in regressions:
+            print(f"REGRESSION at {rate:g} req/s: {col} {before:.2f}ms -> {after:.2f}ms")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,270 @@
+# Opt-in memory instrumentation per pipeline stage (ingest, features, scoring,
+# explanation): peak RSS and the top allocation sites, written as a JSON report
+# that can be diffed across versions, with optional per-stage budgets. Budgets
+# are checked when a stage ends: they fail a run (e.g. in CI) after the fact
+# and do not stop the allocation, so they are no protection against an OOM.
+#
+#   CREDIT_MEMPROFILE=mem.json CREDIT_MEMORY_BUDGETS=features=512,scoring=256 streamlit run app.py
+#   python score.py --memprofile mem.json --memory-budget features=512
+#   python memprofile.py old.json new.json
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+MB = 1 << 20
+
+# Stack depth kept per allocation, to attribute library allocations to repo code
+TRACE_FRAMES = 16
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Active profiler, set by enable(); stage() is a no-op while it is None
+_profiler = None
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+
+def _rss():
+    # (current RSS, peak RSS) in bytes; the peak is resettable on Linux only
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['VmRSS'].split()[0]) * 1024, int(fields['VmHWM'].split()[0]) * 1024
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == 'darwin' else 1024
+        return peak, peak
+
+
+def _reset_peak_rss():
+    # Linux resets VmHWM (peak RSS) to the current RSS on writing "5"
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def parse_budgets(spec):
+    """
+    Parses "stage=MB,stage=MB" (or a list of "stage=MB") into {stage: MB}.
+    """
+    if not spec:
+        return {}
+    items = spec.split(',') if isinstance(spec, str) else spec
+    budgets = {}
+    for item in items:
+        name, _, limit = item.partition('=')
+        budgets[name.strip()] = float(limit)
+    return budgets
+
+
+class MemoryProfiler:
+    def __init__(self, path=None, budgets=None, top=10, trace_allocations=True):
+        """
+        Records memory use per named stage.
+
+        For each stage it records the RSS at entry and the peak RSS while
+        it ran (exact on Linux, where the kernel's high-water mark is reset
+        at entry; elsewhere only a new process-wide peak is seen). With
+        tracemalloc it also records the peak of Python/numpy allocations
+        and the source lines holding the most memory allocated during the
+        stage and still alive at its end. Repeated stages (e.g. one per
+        shard) keep the call with the highest peak.
+
+        Args:
+            path (str): JSON report, rewritten after every stage (optional).
+            budgets (dict): Stage -> MB the stage may grow RSS by. This is
+                a post-hoc check: a stage that completes over its budget
+                raises MemoryBudgetExceeded when it ends; the memory is not
+                capped while it runs. Stages that raise keep their own
+                exception.
+            top (int): Allocation sites to keep per stage.
+            trace_allocations (bool): Use tracemalloc (slows Python code
+                down noticeably; RSS alone is nearly free).
+        """
+        self.path = path
+        self.budgets = budgets or {}
+        self.top = top
+        self.trace_allocations = trace_allocations
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        tracing = self.trace_allocations
+        if tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            traced_start = tracemalloc.get_traced_memory()[0]
+        exact = _reset_peak_rss()
+        rss_start, peak_start = _rss()
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            seconds = time.perf_counter() - start
+            rss_end, peak_end = _rss()
+            # Without a reset, a peak below the old high-water mark is invisible
+            rss_peak = peak_end if exact or peak_end > peak_start else max(rss_start, rss_end)
+            record = {
+                'seconds': seconds,
+                'rss_start_mb': rss_start / MB,
+                'rss_end_mb': rss_end / MB,
+                'rss_peak_mb': rss_peak / MB,
+                'rss_growth_mb': (rss_peak - rss_start) / MB,
+                'peak_exact': exact,
+            }
+            if tracing:
+                record['py_peak_mb'] = (tracemalloc.get_traced_memory()[1] - traced_start) / MB
+                record['top_allocations'] = self._top_sites(tracemalloc.take_snapshot(), before)
+            # A failing stage's own exception must not be replaced by a budget error
+            self._add(name, record, check_budget=not failed)
+
+    def _top_sites(self, after, before):
+        # Net allocations of the stage, charged to the innermost line of repo
+        # code on their stack (so pandas' allocations land on the caller)
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'traceback')
+        sites = {}
+        for stat in diff:
+            frames = list(stat.traceback)
+            frame = next((f for f in reversed(frames) if f.filename.startswith(ROOT + os.sep)), frames[-1])
+            filename = frame.filename
+            if filename.startswith(ROOT + os.sep):
+                filename = os.path.relpath(filename, ROOT)
+            site = f"{filename}:{frame.lineno}"
+            size, count = sites.get(site, (0, 0))
+            sites[site] = (size + stat.size_diff, count + stat.count_diff)
+        ranked = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)
+        return [{'site': site, 'size_mb': size / MB, 'count': count}
+                for site, (size, count) in ranked[:self.top] if size > 0]
+
+    def _add(self, name, record, check_budget=True):
+        previous = self.stages.get(name)
+        if previous is not None:
+            record['calls'] = previous['calls'] + 1
+            record['seconds'] += previous['seconds']
+            if previous['rss_growth_mb'] > record['rss_growth_mb']:
+                record = dict(previous, calls=record['calls'], seconds=record['seconds'])
+        else:
+            record['calls'] = 1
+        self.stages[name] = record
+        if self.path:
+            self.save(self.path)
+
+        budget = self.budgets.get(name)
+        if check_budget and budget is not None and record['rss_growth_mb'] > budget:
+            raise MemoryBudgetExceeded(f"Stage '{name}' grew RSS by {record['rss_growth_mb']:.0f} MB "
+                                       f"(budget {budget:.0f} MB)")
+
+    def report(self):
+        """
+        Returns:
+            dict: 'stages' (name -> record), 'budgets' and the environment.
+        """
+        return {
+            'stages': self.stages,
+            'budgets': self.budgets,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        }
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(tmp, path)
+
+
+def enable(path=None, budgets=None, top=10, trace_allocations=True):
+    """
+    Turns on stage() instrumentation for this process.
+
+    Returns:
+        MemoryProfiler: The active profiler.
+    """
+    global _profiler
+    _profiler = MemoryProfiler(path, budgets, top, trace_allocations)
+    return _profiler
+
+
+def enable_from_env():
+    """
+    Enables profiling if CREDIT_MEMPROFILE (report path) or
+    CREDIT_MEMORY_BUDGETS ("stage=MB,...") is set; a no-op otherwise or if
+    already enabled. CREDIT_MEMPROFILE_TRACE=0 records RSS only.
+    """
+    path = os.environ.get('CREDIT_MEMPROFILE')
+    budgets = parse_budgets(os.environ.get('CREDIT_MEMORY_BUDGETS'))
+    if _profiler is None and (path or budgets):
+        enable(path, budgets, trace_allocations=os.environ.get('CREDIT_MEMPROFILE_TRACE', '1') != '0')
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+@contextmanager
+def stage(name):
+    """
+    Records `name` with the active profiler (no-op when profiling is off).
+    """
+    if _profiler is None:
+        yield
+        return
+    with _profiler.stage(name):
+        yield
+
+
+def diff_reports(old, new):
+    """
+    Compares two saved reports stage by stage.
+
+    Returns:
+        list: (stage, old rss growth MB, new rss growth MB, old py peak MB,
+            new py peak MB); None where a report lacks the stage or value.
+    """
+    rows = []
+    for name in dict.fromkeys(list(old['stages']) + list(new['stages'])):
+        a, b = old['stages'].get(name, {}), new['stages'].get(name, {})
+        rows.append((name, a.get('rss_growth_mb'), b.get('rss_growth_mb'),
+                     a.get('py_peak_mb'), b.get('py_peak_mb')))
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python memprofile.py OLD_REPORT.json NEW_REPORT.json")
+    with open(sys.argv[1]) as f:
+        old = json.load(f)
+    with open(sys.argv[2]) as f:
+        new = json.load(f)
+
+    def fmt(v):
+        return f"{v:>10.1f}" if v is not None else f"{'-':>10}"
+
+    print(f"{'Stage':<14}{'RSS old':>10}{'RSS new':>10}{'Change':>10}{'Py old':>10}{'Py new':>10}   (MB)")
+    for name, a, b, pa, pb in diff_reports(old, new):
+        change = b - a if a is not None and b is not None else None
+        print(f"{name:<14}{fmt(a)}{fmt(b)}{fmt(change)}{fmt(pa)}{fmt(pb)}")
+    for name, record in new['stages'].items():
+        if record.get('top_allocations'):
+            print(f"\nTop allocations in {name} (new):")
+            for site in record['top_allocations']:
+                print(f"  {site['size_mb']:8.1f} MB  {site['count']:>8,} blocks  {site['site']}")
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import shutil
+import pandas as pd
+import numpy as np
+from drift import FeatureSketch
+
+# Bumped when the layout changes; older readers refuse newer bundles.
+# Single-model bundles are still written as format 1.
+BUNDLE_FORMAT = 2
+
+MANIFEST = "manifest.json"
+MODEL_FILE = "model.ubj"
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bundle_digest(path):
+    """
+    Returns a digest identifying a bundle: the SHA-256 of its manifest,
+    which holds every file's checksum.
+    """
+    return _sha256(os.path.join(path, MANIFEST))
+
+
+def save_bundle(path, boosters, monotone_constraints, thresholds, metadata=None, drift_sketch=None):
+    """
+    Writes a model bundle directory.
+
+    Layout:
+        manifest.json   format version, ordered feature names, monotone
+                        constraints, decision thresholds, training metadata
+                        and a SHA-256 per file
+        model.ubj       the booster in XGBoost's native binary (UBJSON) format
+                        (model_0.ubj, model_1.ubj, ... for an ensemble)
+        drift_*.npy     training feature sketch (optional, memory-mappable)
+
+    The bundle is written next to `path` and swapped in with a rename, so
+    readers never see a half-written bundle.
+
+    Args:
+        path (str): Bundle directory.
+        boosters (xgb.Booster or list): Trained booster (feature names set),
+            or the members of an ensemble averaged in log-odds.
+        monotone_constraints (list): One of -1/0/1 per feature.
+        thresholds (dict): Decision cut-offs, e.g. {'approve_pd': 0.1, 'reject_pd': 0.8}.
+        metadata (dict): Training metadata (JSON-serializable).
+        drift_sketch (FeatureSketch): Reference sketch for drift monitoring.
+    """
+    tmp = path.rstrip('/') + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    if not isinstance(boosters, (list, tuple)):
+        boosters = [boosters]
+    if len(boosters) == 1:
+        members = [MODEL_FILE]
+        sections = {'model': MODEL_FILE}
+    else:
+        members = [f"model_{i}.ubj" for i in range(len(boosters))]
+        sections = {f"model_{i}": f for i, f in enumerate(members)}
+    for booster, member in zip(boosters, members):
+        booster.save_model(os.path.join(tmp, member))
+    if drift_sketch is not None:
+        edges = drift_sketch.edges
+        arrays = {
+            'drift_edges': np.concatenate(edges) if edges else np.array([], dtype=np.float64),
+            'drift_edge_counts': np.array([len(e) for e in edges], dtype=np.int64),
+            'drift_counts': drift_sketch.counts,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), array)
+            sections[name] = f"{name}.npy"
+
+    manifest = {
+        'format': 1 if len(members) == 1 else 2,
+        'feature_names': list(boosters[0].feature_names),
+        'members': members,
+        'monotone_constraints': [int(c) for c in monotone_constraints],
+        'thresholds': thresholds,
+        'metadata': metadata or {},
+        'drift_features': drift_sketch.feature_names if drift_sketch is not None else None,
+        'sections': sections,
+        'sha256': {f: _sha256(os.path.join(tmp, f)) for f in sections.values()}
+    }
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old = path.rstrip('/') + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class ModelBundle:
+    def __init__(self, path, mmap=True, verify=False):
+        """
+        Loads a model bundle written by save_bundle().
+
+        Only the manifest and the booster(s) are read up front. The drift
+        sketch is loaded (memory-mapped by default) and the SHAP explainer
+        rebuilt from the booster on first access. An ensemble bundle
+        averages its members' log-odds.
+
+        Args:
+            path (str): Bundle directory.
+            mmap (bool): Memory-map the array sections instead of reading them.
+            verify (bool): Check every file against its manifest SHA-256.
+        """
+        self.path = path
+        self.mmap = mmap
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format', 0) > BUNDLE_FORMAT:
+            raise ValueError(f"{path} has bundle format {self.manifest['format']}; "
+                             f"this version reads up to {BUNDLE_FORMAT}")
+        if verify:
+            for name, digest in self.manifest['sha256'].items():
+                if _sha256(os.path.join(path, name)) != digest:
+                    raise ValueError(f"{path}/{name} does not match its manifest checksum")
+
+        import xgboost as xgb
+        members = self.manifest.get('members', [self.manifest['sections'].get('model')])
+        self.boosters = [xgb.Booster(model_file=os.path.join(path, m)) for m in members]
+        self._drift_sketch = None
+        self._explainer = None
+
+    @property
+    def booster(self):
+        """
+        The model's booster (single-model bundles only).
+        """
+        if len(self.boosters) > 1:
+            raise ValueError(f"{self.path} is an ensemble of {len(self.boosters)} boosters; use `boosters`")
+        return self.boosters[0]
+
+    @property
+    def feature_names(self):
+        return self.manifest['feature_names']
+
+    @property
+    def monotone_constraints(self):
+        return self.manifest['monotone_constraints']
+
+    @property
+    def thresholds(self):
+        return self.manifest['thresholds']
+
+    @property
+    def metadata(self):
+        return self.manifest['metadata']
+
+    def _array(self, section):
+        return np.load(os.path.join(self.path, self.manifest['sections'][section]),
+                       mmap_mode='r' if self.mmap else None)
+
+    @property
+    def drift_sketch(self):
+        """
+        Training feature sketch (None if the bundle has none).
+        """
+        if self._drift_sketch is None and 'drift_counts' in self.manifest['sections']:
+            flat = self._array('drift_edges')
+            bounds = np.cumsum(self._array('drift_edge_counts'))[:-1]
+            sketch = FeatureSketch(self.manifest['drift_features'], np.split(flat, bounds))
+            sketch.counts = self._array('drift_counts')
+            self._drift_sketch = sketch
+        return self._drift_sketch
+
+    @property
+    def explainer(self):
+        """
+        SHAP TreeExplainer over the booster, built on first access
+        (single-model bundles; use contributions() for ensembles).
+        """
+        if self._explainer is None:
+            import shap
+            self._explainer = shap.TreeExplainer(self.booster)
+        return self._explainer
+
+    def set_threads(self, nthread):
+        """
+        Limits the XGBoost threads used per prediction.
+        """
+        for booster in self.boosters:
+            booster.set_param({'nthread': nthread})
+
+    def predict(self, features_df):
+        """
+        Returns the probability of default for each row.
+
+        Args:
+            features_df (pd.DataFrame or np.ndarray): Model features; an
+                array must already be in `feature_names` order.
+        """
+        X = features_df if isinstance(features_df, np.ndarray) else features_df[self.feature_names]
+        if len(self.boosters) == 1:
+            return self.boosters[0].inplace_predict(X)
+        margin = np.mean([b.inplace_predict(X, predict_type='margin') for b in self.boosters], axis=0)
+        return 1 / (1 + np.exp(-margin))
+
+    def contributions(self, features):
+        """
+        Returns SHAP values in log-odds: one column per feature, then the bias.
+
+        Uses XGBoost's built-in TreeSHAP (pred_contribs), which gives the same
+        values as shap.TreeExplainer. Ensemble members are averaged, like
+        their log-odds, so each row still adds up to the model's log-odds.
+
+        Args:
+            features (pd.DataFrame or np.ndarray): Model features, in
+                `feature_names` order.
+        """
+        import xgboost as xgb
+        if isinstance(features, pd.DataFrame):
+            features = features[self.feature_names].to_numpy(dtype=np.float32)
+        matrix = xgb.DMatrix(features, feature_names=self.feature_names)
+        contribs = [b.predict(matrix, pred_contribs=True) for b in self.boosters]
+        return contribs[0] if len(contribs) == 1 else np.mean(contribs, axis=0)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "model_bundle"
+    try:
+        start = time.perf_counter()
+        bundle = ModelBundle(path, verify=True)
+        print(f"Loaded {path} in {time.perf_counter() - start:.3f}s")
+        print(json.dumps({k: v for k, v in bundle.manifest.items() if k != 'feature_names'}, indent=2))
+    except FileNotFoundError:
+        print(f"{path} not found. Run train_model.py first.")
@@ -0,0 +1,201 @@
+import pandas as pd
+import numpy as np
+
+# Gaps (days) that count as a schedule: weekly to monthly
+MIN_CADENCE_DAYS = 5
+MAX_CADENCE_DAYS = 45
+
+# Events a series needs before it can count as recurring (at least two gaps)
+MIN_OCCURRENCES = 3
+
+# Share of gaps that must land near the cadence
+MIN_REGULARITY = 0.75
+
+# A gap is "on schedule" within the larger of these of the cadence
+GAP_TOLERANCE_DAYS = 2
+GAP_TOLERANCE_SHARE = 0.25
+
+PERIODICITY_FEATURES = [
+    'recurring_income_streams', 'income_cadence_days', 'income_regularity', 'days_to_next_income',
+    'recurring_payments', 'recurring_outflow', 'days_to_next_payment'
+]
+
+# Cadence and timing features: NaN for users without a matching recurring series
+SCHEDULE_FEATURES = ['income_cadence_days', 'days_to_next_income', 'days_to_next_payment']
+
+
+def _group_median(keys, values, n_keys):
+    """
+    Median of `values` per key (NaN for keys without values).
+
+    Args:
+        keys (np.ndarray): Sorted group codes in [0, n_keys).
+        values (np.ndarray): Values, aligned with `keys`.
+        n_keys (int): Number of groups.
+    """
+    order = np.lexsort((values, keys))
+    ordered = values[order]
+    starts = np.searchsorted(keys[order], np.arange(n_keys))
+    counts = np.bincount(keys, minlength=n_keys)
+
+    median = np.full(n_keys, np.nan)
+    has = counts > 0
+    lo = starts[has] + (counts[has] - 1) // 2
+    hi = starts[has] + counts[has] // 2
+    median[has] = (ordered[lo] + ordered[hi]) / 2
+    return median
+
+
+def recurring_series(df, min_occurrences=MIN_OCCURRENCES, min_regularity=MIN_REGULARITY,
+                     min_cadence=MIN_CADENCE_DAYS, max_cadence=MAX_CADENCE_DAYS):
+    """
+    Finds payment series and their schedules for the whole portfolio at once.
+
+    A series is every successful inflow (or outflow) between one user and
+    one counterparty, reduced to one event per day. Events are sorted once
+    by (series, day); inter-arrival gaps are differences of neighbours in
+    the same series, and every statistic is a grouped reduction over the
+    gaps (bincounts, one lexsort for the medians), so the cost does not
+    depend on the number of users.
+
+    Args:
+        df (pd.DataFrame): Transactions with 'user_id', 'date', 'amount',
+            'merchant_name' (or 'category') and optionally 'status'.
+        min_occurrences (int): Events needed to count as recurring.
+        min_regularity (float): Share of on-schedule gaps needed.
+        min_cadence (float): Shortest cadence (days) that counts as a schedule.
+        max_cadence (float): Longest cadence (days) that counts as a schedule.
+
+    Returns:
+        pd.DataFrame: One row per series: 'user_id', 'merchant', 'direction'
+            (1 inflow, -1 outflow), 'events', 'cadence_days' (median gap),
+            'regularity' (share of gaps within tolerance of the cadence),
+            'gap_cv', 'total_amount' (absolute), 'last_date',
+            'next_expected' and 'recurring'.
+    """
+    columns = ['user_id', 'merchant', 'direction', 'events', 'cadence_days', 'regularity', 'gap_cv',
+               'total_amount', 'last_date', 'next_expected', 'recurring']
+    if 'status' in df.columns:
+        df = df[df['status'] == 'Success']
+    amounts = df['amount'].to_numpy(dtype=np.float64)
+    df = df[amounts != 0]
+    amounts = amounts[amounts != 0]
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+
+    merchant_column = 'merchant_name' if 'merchant_name' in df.columns else 'category'
+    user_codes, user_ids = pd.factorize(df['user_id'], sort=True)
+    merchant_codes, merchants = pd.factorize(df[merchant_column].fillna(''))
+    direction = (amounts > 0).astype(np.int64)
+    days = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+    # One code per (user, counterparty, direction), in user order
+    raw = (user_codes.astype(np.int64) * len(merchants) + merchant_codes) * 2 + direction
+    series_codes, series_raw = pd.factorize(raw, sort=True)
+    n_series = len(series_raw)
+
+    # Collapse same-day events; np.unique also sorts by (series, day)
+    first_day = days.min()
+    span = days.max() - first_day + 1
+    events, inverse = np.unique(series_codes.astype(np.int64) * span + (days - first_day), return_inverse=True)
+    event_series = events // span
+    event_days = events % span + first_day
+    event_amounts = np.bincount(inverse, weights=np.abs(amounts), minlength=len(events))
+
+    same = event_series[1:] == event_series[:-1]
+    gaps = (event_days[1:] - event_days[:-1])[same].astype(np.float64)
+    gap_series = event_series[1:][same]
+
+    n_events = np.bincount(event_series, minlength=n_series)
+    n_gaps = np.bincount(gap_series, minlength=n_series)
+    cadence = _group_median(gap_series, gaps, n_series)
+    tolerance = np.maximum(GAP_TOLERANCE_DAYS, GAP_TOLERANCE_SHARE * np.nan_to_num(cadence))
+    on_schedule = np.abs(gaps - cadence[gap_series]) <= tolerance[gap_series]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        regularity = np.bincount(gap_series, weights=on_schedule, minlength=n_series) / n_gaps
+        mean_gap = np.bincount(gap_series, weights=gaps, minlength=n_series) / n_gaps
+        var_gap = np.bincount(gap_series, weights=gaps ** 2, minlength=n_series) / n_gaps - mean_gap ** 2
+        gap_cv = np.sqrt(np.maximum(var_gap, 0)) / mean_gap
+
+    last_day = event_days[np.cumsum(n_events) - 1]
+    recurring = ((n_events >= min_occurrences) & (regularity >= min_regularity) &
+                 (cadence >= min_cadence) & (cadence <= max_cadence))
+
+    series_direction = series_raw % 2
+    series_merchant = (series_raw // 2) % len(merchants)
+    series_user = series_raw // 2 // len(merchants)
+    return pd.DataFrame({
+        'user_id': user_ids[series_user],
+        'merchant': merchants[series_merchant],
+        'direction': np.where(series_direction == 1, 1, -1),
+        'events': n_events,
+        'cadence_days': cadence,
+        'regularity': np.nan_to_num(regularity),
+        'gap_cv': gap_cv,
+        'total_amount': np.bincount(event_series, weights=event_amounts, minlength=n_series),
+        'last_date': last_day.astype('datetime64[D]'),
+        'next_expected': (last_day + np.round(np.nan_to_num(cadence)).astype(np.int64)).astype('datetime64[D]'),
+        'recurring': recurring
+    }, columns=columns)
+
+
+def periodicity_features(df, as_of=None):
+    """
+    Computes per-user recurring income and payment features.
+
+    The main income stream is the recurring inflow series with the largest
+    total. Users without a recurring income (payment) series get 0 streams
+    (payments), regularity and outflow, and NaN cadence and days-to-next
+    values: there is no schedule to measure, and the models treat NaN as
+    missing rather than as a 0-day cadence or a payment due today.
+
+    Args:
+        df (pd.DataFrame): Transactions (see recurring_series()).
+        as_of: Reference date for the next-expected features (default: each
+            user's own last transaction date, so a user's values do not
+            depend on the rest of the batch).
+
+    Returns:
+        pd.DataFrame: Indexed by user_id with 'recurring_income_streams',
+            'income_cadence_days', 'income_regularity', 'days_to_next_income'
+            (negative when the next paycheck is overdue), 'recurring_payments',
+            'recurring_outflow' (absolute total of recurring outflows) and
+            'days_to_next_payment' (next upcoming recurring outflow; negative,
+            the least overdue one, when every series is overdue).
+    """
+    all_users = pd.Index(df['user_id'].unique()).sort_values()
+    features = pd.DataFrame(0.0, index=all_users, columns=PERIODICITY_FEATURES).rename_axis('user_id')
+    features[SCHEDULE_FEATURES] = np.nan
+    series = recurring_series(df)
+    series = series[series['recurring']]
+    if series.empty:
+        return features
+
+    if as_of is None:
+        last = pd.to_datetime(df['date']).dt.normalize().groupby(df['user_id'].to_numpy()).max()
+        reference = last.reindex(series['user_id']).to_numpy()
+    else:
+        reference = pd.Timestamp(as_of).normalize()
+    days_ahead = (series['next_expected'] - reference).dt.days.to_numpy(dtype=np.float64)
+
+    inflows = series['direction'].to_numpy() == 1
+    income = series[inflows].assign(days_ahead=days_ahead[inflows])
+    if len(income):
+        main = income.sort_values(['user_id', 'total_amount']).groupby('user_id', sort=False).tail(1).set_index('user_id')
+        features.loc[main.index, 'income_cadence_days'] = main['cadence_days']
+        features.loc[main.index, 'income_regularity'] = main['regularity']
+        features.loc[main.index, 'days_to_next_income'] = main['days_ahead']
+        counts = income['user_id'].value_counts()
+        features.loc[counts.index, 'recurring_income_streams'] = counts.to_numpy(dtype=np.float64)
+
+    payments = series[~inflows].assign(days_ahead=days_ahead[~inflows])
+    if len(payments):
+        payments = payments.assign(upcoming=payments['days_ahead'].where(payments['days_ahead'] >= 0))
+        grouped = payments.groupby('user_id')
+        stats = grouped.agg(n=('merchant', 'size'), total=('total_amount', 'sum'), next=('upcoming', 'min'),
+                            overdue=('days_ahead', 'max'))
+        features.loc[stats.index, 'recurring_payments'] = stats['n'].to_numpy(dtype=np.float64)
+        features.loc[stats.index, 'recurring_outflow'] = stats['total']
+        features.loc[stats.index, 'days_to_next_payment'] = stats['next'].fillna(stats['overdue'])
+    return features
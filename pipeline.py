@@ -1,37 +1,108 @@
+import os
 import pandas as pd
-import pickle
-import xgboost as xgb
+import numpy as np
+from drift import DriftMonitor
+from model_bundle import ModelBundle, MANIFEST
+from shadow import ShadowScorer
+from shared_features import SharedFeatureMatrix
+
+# Gate 2 cut-offs on the probability of default (defaults for new bundles;
+# a loaded bundle carries the thresholds it was trained with)
+REJECT_PD = 0.8
+APPROVE_PD = 0.1
 
 class CreditPipeline:
-    def __init__(self, model_path="xgb_model.pkl"):
+    def __init__(self, model_path="model_bundle", feature_store=None, monitor_drift=True, fraud_gate=None,
+                 shadow_models=None, shadow_workers=1, shadow_block=False):
         """
         Initializes the pipeline with the trained model.
+        
+        Heavy libraries are not imported at module level: loading the bundle
+        pulls in xgboost, and shap is only loaded on first use of `explainer`.
+        
+        Args:
+            model_path (str): Model bundle directory from train_model.py.
+            feature_store (FeatureStore): Optional store for scoring by user_id.
+            monitor_drift (bool): Add every scored user to `drift_monitor`,
+                against the training sketch stored in the bundle.
+            fraud_gate (FraudGate): Default velocity state for Gate 1.
+            shadow_models (dict or list): Challenger bundles (name -> path, or
+                paths) scored in the background on every run_batch() feature
+                matrix; see `shadow` for the comparison with the champion.
+            shadow_workers (int): Background threads for shadow scoring.
+            shadow_block (bool): Wait for the challengers when their queue
+                is full instead of dropping the batch from the comparison.
         """
-        try:
-            with open(model_path, "rb") as f:
-                self.model = pickle.load(f)
-        except FileNotFoundError:
-            print(f"Model file {model_path} not found.")
+        self.feature_store = feature_store
+        self.fraud_gate = fraud_gate
+        self.reject_pd = REJECT_PD
+        self.approve_pd = APPROVE_PD
+        self.drift_monitor = None
+        self.shadow = ShadowScorer(shadow_models, shadow_workers, block=shadow_block) if shadow_models else None
+        
+        if not os.path.exists(os.path.join(model_path, MANIFEST)):
+            print(f"Model bundle {model_path} not found.")
             self.model = None
+            return
+        self.model = ModelBundle(model_path)
+        self.reject_pd = self.model.thresholds.get('reject_pd', REJECT_PD)
+        self.approve_pd = self.model.thresholds.get('approve_pd', APPROVE_PD)
+        
+        if monitor_drift and self.model.drift_sketch is not None:
+            self.drift_monitor = DriftMonitor(self.model.drift_sketch)
 
-    def run_waterfall(self, user_features):
+    @property
+    def explainer(self):
+        """
+        SHAP explainer, rebuilt from the model on first access (None if no model).
+        """
+        return self.model.explainer if self.model is not None else None
+
+    @property
+    def feature_names(self):
+        """
+        Ordered feature names the loaded model was trained on (None if unknown).
+        """
+        if self.model is None:
+            return None
+        return self.model.feature_names
+
+    @property
+    def required_features(self):
+        """
+        Features to compute for run_batch(): the model's plus any shadow model's.
+        """
+        if self.feature_names is None or self.shadow is None:
+            return self.feature_names
+        return list(dict.fromkeys(self.feature_names + self.shadow.feature_names))
+
+    def _fraud_check(self, user_id, fraud_gate):
+        fraud_gate = fraud_gate if fraud_gate is not None else self.fraud_gate
+        if fraud_gate is None or user_id is None:
+            return 0.0, [] # No velocity state: treat as low risk
+        return fraud_gate.score(user_id)
+
+    def run_waterfall(self, user_features, user_id=None, fraud_gate=None):
         """
         Runs the waterfall logic for a single user.
         
         Args:
             user_features (dict or pd.Series): Features for the user.
+            user_id: User to fraud-check (defaults to user_features['user_id']).
+            fraud_gate (FraudGate): Velocity state for Gate 1 (defaults to the
+                pipeline's own).
             
         Returns:
             dict: Decision result containing 'decision', 'reason', 'pd', 'gate'.
         """
-        # Gate 1: Fraud Check (Mocked)
-        # In a real system, this would check identity verification, etc.
-        # For MVP, we assume everyone passes unless flagged explicitly (not implemented here)
-        fraud_score = 0.0 # Low risk
+        # Gate 1: Fraud Check (sliding-window velocity signals)
+        if user_id is None and 'user_id' in user_features:
+            user_id = user_features['user_id']
+        fraud_score, fraud_reasons = self._fraud_check(user_id, fraud_gate)
         if fraud_score > 0.5:
             return {
                 'decision': 'Reject',
-                'reason': 'Fraud Check Failed',
+                'reason': f"Fraud Check Failed: {'; '.join(fraud_reasons)}",
                 'pd': None,
                 'gate': 1
             }
@@ -45,29 +116,30 @@ class CreditPipeline:
         # We need to convert the single user features to a DataFrame
         # The model expects specific columns. We assume user_features has them.
         
-        # Get feature names from the model if possible, or assume standard order
-        # For safety, let's load the feature names from the model object if available
-        # or just rely on the input being a dict with correct keys.
-        
         # Convert to DataFrame
         input_df = pd.DataFrame([user_features])
         
-        # Drop non-feature columns if present (like user_id)
-        if 'user_id' in input_df.columns:
+        # Keep only the model's features, in training order (drops user_id and
+        # any display-only features)
+        if self.feature_names is not None:
+            input_df = input_df[self.feature_names]
+        elif 'user_id' in input_df.columns:
             input_df = input_df.drop('user_id', axis=1)
             
         # Predict Probability of Default (PD)
-        # XGBoost predict_proba returns [prob_0, prob_1]
-        pd_score = self.model.predict_proba(input_df)[0][1]
+        pd_score = float(self.model.predict(input_df)[0])
         
-        if pd_score > 0.8:
+        if self.drift_monitor is not None:
+            self.drift_monitor.update(input_df.iloc[0])
+        
+        if pd_score > self.reject_pd:
             return {
                 'decision': 'Reject',
                 'reason': f'High Probability of Default ({pd_score:.2f})',
                 'pd': pd_score,
                 'gate': 2
             }
-        elif pd_score < 0.1:
+        elif pd_score < self.approve_pd:
             return {
                 'decision': 'Approve',
                 'reason': f'Low Probability of Default ({pd_score:.2f})',
@@ -83,6 +155,145 @@ class CreditPipeline:
                 'gate': 3
             }
 
+    def run_batch(self, features_df, fraud_gate=None):
+        """
+        Runs the waterfall for many users with one model call.
+        
+        Args:
+            features_df (pd.DataFrame or SharedFeatureMatrix): Features indexed
+                by user_id. A shared matrix is scored in place (no copy when
+                it holds exactly the model's features, in order).
+            fraud_gate (FraudGate): Velocity state for Gate 1 (defaults to the
+                pipeline's own).
+            
+        Returns:
+            pd.DataFrame: 'decision', 'reason', 'pd' and 'gate' per user, same
+                index as `features_df`. 'pd' is None for users stopped at Gate 1.
+        """
+        model_input = None
+        if isinstance(features_df, SharedFeatureMatrix):
+            if self.feature_names is not None:
+                model_input = features_df.rows(columns=self.feature_names)
+            features_df = features_df.frame()
+        
+        fraud = [self._fraud_check(uid, fraud_gate) for uid in features_df.index]
+        fraud_reject = np.array([score > 0.5 for score, _ in fraud], dtype=bool)
+        
+        if self.model is None:
+            return pd.DataFrame({
+                'decision': 'Error', 'reason': 'Model not loaded', 'pd': None, 'gate': 2
+            }, index=features_df.index)
+        
+        if model_input is None:
+            model_input = features_df[self.feature_names]
+        pd_scores = self.model.predict(model_input)
+        
+        if self.drift_monitor is not None:
+            self.drift_monitor.update(features_df)
+        
+        decision = np.select([pd_scores > self.reject_pd, pd_scores < self.approve_pd], ['Reject', 'Approve'], 'Refer')
+        reason = np.select(
+            [pd_scores > self.reject_pd, pd_scores < self.approve_pd],
+            ['High Probability of Default ({:.2f})', 'Low Probability of Default ({:.2f})'],
+            'Moderate Risk ({:.2f}) - Manual Review Required'
+        )
+        result = pd.DataFrame({
+            'decision': decision,
+            'reason': [r.format(p) for r, p in zip(reason, pd_scores)],
+            'pd': pd.Series(pd_scores, dtype=object).to_numpy(),
+            'gate': np.where(decision == 'Refer', 3, 2)
+        }, index=features_df.index)
+        
+        if fraud_reject.any():
+            result.loc[fraud_reject, 'decision'] = 'Reject'
+            result.loc[fraud_reject, 'reason'] = [
+                f"Fraud Check Failed: {'; '.join(reasons)}" for (_, reasons), r in zip(fraud, fraud_reject) if r
+            ]
+            result.loc[fraud_reject, 'pd'] = None
+            result.loc[fraud_reject, 'gate'] = 1
+        
+        # Challengers see the same feature matrix, off the request path
+        if self.shadow is not None:
+            self.shadow.submit(features_df, result)
+        return result
+
+    def score_user(self, user_id):
+        """
+        Runs the waterfall on a user's latest features from the feature store.
+        
+        Returns:
+            dict: Decision result, or None if the user has no stored features.
+        """
+        if self.feature_store is None:
+            raise ValueError("CreditPipeline was created without a feature store")
+        user_features = self.feature_store.latest(user_id, self.feature_names)
+        if user_features is None:
+            return None
+        return self.run_waterfall(user_features.drop('as_of'))
+
+# Pipelines loaded by preload(), shared with forked worker processes
+_PRELOADED = {}
+
+def preload(model_path="model_bundle", explainer=False, **kwargs):
+    """
+    Loads the heavy libraries and the model once, before forking workers.
+    
+    Call it in the parent process: workers forked afterwards inherit the
+    imported modules and the loaded model (copy-on-write), so their first
+    decision skips the import and load entirely. Workers then call
+    preload() again with the same path and get the already loaded pipeline.
+    
+    Args:
+        model_path (str): Model to load.
+        explainer (bool): Also load the SHAP explainer.
+        **kwargs: Other CreditPipeline arguments (used on first load only).
+        
+    Returns:
+        CreditPipeline: The shared pipeline for `model_path`.
+    """
+    pipeline = _PRELOADED.get(model_path)
+    if pipeline is None:
+        pipeline = _PRELOADED[model_path] = CreditPipeline(model_path, **kwargs)
+    if explainer:
+        pipeline.explainer
+    return pipeline
+
+def compute_offers(decisions, features_df, transactions_df, history_months=3):
+    """
+    Turns waterfall decisions into scores and loan offers.
+    
+    Args:
+        decisions (pd.DataFrame): Output of CreditPipeline.run_batch().
+        features_df (pd.DataFrame): Features indexed by user_id (needs 'net_cashflow').
+        transactions_df (pd.DataFrame): Transactions the features were built from.
+        history_months (int): Months of history, to get monthly income.
+        
+    Returns:
+        pd.DataFrame: One row per user with 'user_id', the decision columns,
+            'score', 'loan_limit', 'interest_rate' and 'monthly_income'.
+    """
+    results = decisions.copy()
+    pd_val = pd.to_numeric(results['pd'], errors='coerce')
+    
+    # Score 0-100
+    results['score'] = ((1 - pd_val.fillna(1.0)) * 100).astype(int)
+    
+    # --- FINANCIAL CALCULATIONS ---
+    inflows = transactions_df[transactions_df['amount'] > 0]
+    monthly_income = inflows.groupby('user_id')['amount'].sum().reindex(results.index).fillna(0.0) / history_months
+    
+    # Loan Limit: 30% of income scaled by positive net cash flow, over 12 months
+    n_fcf = features_df['net_cashflow'].reindex(results.index).fillna(0).clip(lower=0)
+    loan_limit = np.round(monthly_income * n_fcf * 0.3 * 12 / 100) * 100
+    
+    # Interest Rate
+    interest_rate = (8.0 + pd_val.fillna(1.0) * 20.0).clip(upper=36.0)
+    
+    results['loan_limit'] = np.where(results['decision'] == 'Approve', loan_limit, 0)
+    results['interest_rate'] = interest_rate
+    results['monthly_income'] = monthly_income
+    return results.rename_axis('user_id').reset_index()
+
 if __name__ == "__main__":
     # Test the pipeline
     try:
@@ -94,6 +305,11 @@ if __name__ == "__main__":
             user_row = df.iloc[i]
             result = pipeline.run_waterfall(user_row)
             print(f"User {user_row['user_id']}: {result}")
+        
+        if pipeline.drift_monitor is not None:
+            decisions = pipeline.run_batch(df.set_index('user_id'))
+            print(f"\nBatch decisions:\n{decisions['decision'].value_counts()}")
+            print(f"\nFeature drift vs. training:\n{pipeline.drift_monitor.report().head(10)}")
             
     except FileNotFoundError:
         print("features.csv not found.")
@@ -1,50 +1,92 @@
+import argparse
 import os
 import subprocess
 import sys
-import time
+from dag import Stage, DAGRunner
+from data_gen import save_synthetic_data
+from features import build_features
+from train_model import train_model
+from score import score_portfolio
 
-def run_command(command, description):
-    """Run a command and handle errors"""
-    print(f"\n{'='*60}")
-    print(f"⏳ {description}...")
-    print(f"{'='*60}")
-    result = subprocess.run(command, shell=True)
-    if result.returncode != 0:
-        print(f"❌ Error running: {description}")
-        print(f"Command: {command}")
-        sys.exit(1)
-    print(f"✅ {description} completed successfully!\n")
+TRANSACTIONS = "transactions.csv"
+USERS = "users.csv"
+MODEL_BUNDLE = "model_bundle"
+
+def build_stages(regenerate=False, num_users=1000):
+    """
+    Declares the pipeline: data_gen -> features -> train_model -> score.
+    
+    Args:
+        regenerate (bool): Include synthetic data generation even if the
+            data files exist. Otherwise existing CSVs are treated as source
+            data and never overwritten.
+        num_users (int): Users to generate.
+    """
+    stages = []
+    if regenerate or not os.path.exists(TRANSACTIONS) or not os.path.exists(USERS):
+        stages.append(Stage(
+            "data_gen", save_synthetic_data,
+            outputs=[TRANSACTIONS, USERS],
+            params={'num_users': num_users, 'transactions_path': TRANSACTIONS, 'users_path': USERS},
+            code=["data_gen"]
+        ))
+    stages += [
+        Stage(
+            "features", build_features,
+            inputs=[TRANSACTIONS, USERS],
+            outputs=["features.csv", "features.bin"],
+            params={'transactions_path': TRANSACTIONS, 'users_path': USERS,
+                    'features_path': "features.csv", 'store_path': "features.db",
+                    'matrix_path': "features.bin"},
+            code=["features"]
+        ),
+        Stage(
+            "train_model", train_model,
+            inputs=["features.bin"],
+            outputs=[MODEL_BUNDLE],
+            params={'matrix_path': "features.bin", 'bundle_path': MODEL_BUNDLE},
+            code=["train_model"]
+        ),
+        Stage(
+            "score", score_portfolio,
+            inputs=[TRANSACTIONS, USERS, MODEL_BUNDLE],
+            outputs=["decisions"],
+            params={'transactions': TRANSACTIONS, 'users': USERS, 'output': "decisions",
+                    'model': MODEL_BUNDLE, 'fresh': True},
+            code=["score"]
+        ),
+    ]
+    return stages
 
 def main():
+    parser = argparse.ArgumentParser(description="Run the credit scoring pipeline, then the dashboard.")
+    parser.add_argument("--regenerate", action="store_true", help="(Re)generate synthetic data")
+    parser.add_argument("--num-users", type=int, default=1000, help="Users to generate")
+    parser.add_argument("--force", action="store_true", help="Re-run every stage, ignoring the cache")
+    parser.add_argument("--jobs", type=int, default=None, help="Max stages running in parallel")
+    parser.add_argument("--no-app", action="store_true", help="Do not launch the dashboard")
+    parser.add_argument("targets", nargs="*", help="Stages to build (default: all)")
+    args = parser.parse_args()
+    
     print("\n" + "="*60)
     print("🚀 Gen-Z Credit Scoring Engine")
     print("="*60)
-    print("This will run the complete credit scoring pipeline:")
-    print("  1. Generate synthetic data (if needed)")
-    print("  2. Calculate features")
-    print("  3. Train model (if needed)")
-    print("  4. Launch Streamlit dashboard")
+    print("Stages are skipped when their inputs, code and parameters are unchanged.")
     print("="*60 + "\n")
     
-    # Get Python executable
-    python_exe = sys.executable
-    
-    # Step 1: Generate Data (if files don't exist)
-    if not os.path.exists("users.csv") or not os.path.exists("transactions.csv"):
-        run_command(f'"{python_exe}" data_gen.py', "Step 1: Generating Synthetic Data")
-    else:
-        print("\n✓ Data files already exist, skipping generation")
-    
-    # Step 2: Calculate Features
-    run_command(f'"{python_exe}" features.py', "Step 2: Calculating Features")
+    runner = DAGRunner(build_stages(args.regenerate, args.num_users),
+                       root=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        runner.run(args.targets or None, jobs=args.jobs, force=args.force)
+    except Exception as e:
+        print(f"❌ Pipeline failed: {e}")
+        sys.exit(1)
+    print("✅ Pipeline up to date!\n")
     
-    # Step 3: Train Model (if model doesn't exist)
-    if not os.path.exists("xgb_model.pkl"):
-        run_command(f'"{python_exe}" train_model.py', "Step 3: Training Model")
-    else:
-        print("\n✓ Model already exists, skipping training")
+    if args.no_app:
+        return
     
-    # Step 4: Launch UI
+    # Launch UI
     print("\n" + "="*60)
     print("🎯 Launching Streamlit Dashboard...")
     print("="*60)
@@ -52,7 +94,7 @@ def main():
     print("📌 To stop the server, press Ctrl+C")
     print("\n" + "="*60 + "\n")
     
-    cmd = f'"{python_exe}" -m streamlit run app.py'
+    cmd = f'"{sys.executable}" -m streamlit run app.py'
     try:
         subprocess.run(cmd, shell=True)
     except KeyboardInterrupt:
@@ -0,0 +1,316 @@
+# Headless batch scoring: transactions -> features -> CreditPipeline -> offers.
+# Users are hash-partitioned into shards; each scored shard is committed as one
+# Parquet part by an atomic rename, so a killed job resumes where it stopped
+# (parts record their inputs and model; changed ones are rescored or refused).
+#
+#   python score.py --transactions transactions.csv --users users.csv --output decisions
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import time
+import pandas as pd
+import numpy as np
+from features import CashFlowFeatures
+from pipeline import CreditPipeline, compute_offers
+from fraud import FraudGate
+from dedup import deduplicate_transactions
+from validation import validate_inputs
+from model_bundle import bundle_digest
+import memprofile
+
+# Columns the offers need besides the model's features
+OFFER_FEATURES = ['net_cashflow']
+
+# Output columns (written as-is for shards without transactions)
+RESULT_COLUMNS = ['user_id', 'decision', 'reason', 'pd', 'gate', 'score',
+                  'loan_limit', 'interest_rate', 'monthly_income']
+
+# Default shard count: at least MIN_SHARDS, and about this much input per shard
+MIN_SHARDS = 16
+SHARD_INPUT_BYTES = 128 << 20
+
+# Parquet metadata key of the run fingerprint stored in every part
+FINGERPRINT_KEY = b'credit_run'
+
+
+def shard_of(user_ids, n_shards):
+    """
+    Assigns users to shards by a stable hash of their ID.
+    """
+    hashes = pd.util.hash_array(np.asarray(user_ids, dtype=object).astype(str), categorize=True)
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+def shard_path(work_dir, name, shard):
+    return os.path.join(work_dir, 'shards', f'{name}-{shard:05d}.csv')
+
+
+def partition(path, work_dir, name, n_shards, chunk_rows):
+    """
+    Streams a CSV in chunks and appends each row to its user's shard file.
+    """
+    if path is None:
+        return
+    for chunk in pd.read_csv(path, dtype={'user_id': str}, chunksize=chunk_rows):
+        shards = shard_of(chunk['user_id'], n_shards)
+        for shard, part in chunk.groupby(shards):
+            target = shard_path(work_dir, name, shard)
+            part.to_csv(target, mode='a', header=not os.path.exists(target), index=False)
+
+
+def default_shards(transactions):
+    """
+    Picks a shard count that bounds the input (and so memory) per shard.
+    """
+    return max(MIN_SHARDS, -(-os.path.getsize(transactions) // SHARD_INPUT_BYTES))
+
+
+def _file_fingerprint(path):
+    # Path, size and modification time: a replaced or edited input no longer matches
+    if not path:
+        return None
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def prepare_shards(transactions, users, work_dir, n_shards, chunk_rows):
+    """
+    Partitions the inputs once; an interrupted partition step is redone.
+
+    The marker records each input's size and modification time, so
+    checkpoints of inputs that changed since are never resumed.
+
+    Returns:
+        dict: The partition fingerprint (inputs and shard count).
+    """
+    marker = os.path.join(work_dir, 'partition.json')
+    params = {
+        'transactions': _file_fingerprint(transactions),
+        'users': _file_fingerprint(users),
+        'shards': n_shards
+    }
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == params:
+                return params
+        sys.exit(f"{work_dir} was partitioned from other inputs, inputs changed since or another "
+                 f"shard count. Use --fresh to start over.")
+
+    shutil.rmtree(os.path.join(work_dir, 'shards'), ignore_errors=True)
+    os.makedirs(os.path.join(work_dir, 'shards'))
+    print(f"Partitioning inputs into {n_shards} shards...")
+    partition(transactions, work_dir, 'transactions', n_shards, chunk_rows)
+    partition(users, work_dir, 'users', n_shards, chunk_rows)
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return params
+
+
+def run_fingerprint(partition_params, model):
+    """
+    Identifies what a part was scored from: the partition and the model
+    bundle's digest.
+    """
+    return {'partition': partition_params, 'model': bundle_digest(model)}
+
+
+def part_path(output, shard):
+    return os.path.join(output, f'part-{shard:05d}.parquet')
+
+
+def encode_part(results, fingerprint):
+    """
+    Serializes a shard's results to Parquet with the run fingerprint in the
+    file's metadata.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[FINGERPRINT_KEY] = json.dumps(fingerprint).encode()
+    buffer = io.BytesIO()
+    pq.write_table(table.replace_schema_metadata(metadata), buffer)
+    return buffer.getvalue()
+
+
+def write_part(output, shard, data):
+    # Atomic: a partial file is never seen as done
+    target = part_path(output, shard)
+    with open(target + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(target + '.tmp', target)
+
+
+def _part_fingerprint(path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowException):
+        return None
+    value = metadata.get(FINGERPRINT_KEY)
+    return json.loads(value) if value else None
+
+
+def pending_shards(output, n_shards, fingerprint):
+    """
+    Returns the shards still to score: those without a part, and those whose
+    part was scored from other inputs or another model (rescored).
+    """
+    pending = []
+    stale = 0
+    for shard in range(n_shards):
+        path = part_path(output, shard)
+        if not os.path.exists(path):
+            pending.append(shard)
+        elif _part_fingerprint(path) != fingerprint:
+            pending.append(shard)
+            stale += 1
+    if len(pending) < n_shards:
+        print(f"Resuming: {n_shards - len(pending)} of {n_shards} shards already done")
+    if stale:
+        print(f"Rescoring {stale} shards scored from other inputs or another model")
+    return pending
+
+
+def score_shard(transactions_df, users_df, pipeline):
+    """
+    Scores one shard of users end to end.
+
+    Args:
+        transactions_df (pd.DataFrame): All transactions of the shard's users.
+        users_df (pd.DataFrame): Their profiles (or None).
+        pipeline (CreditPipeline): Loaded pipeline.
+
+    Returns:
+        pd.DataFrame: Decisions and offers, one row per user (users whose
+            transactions are all invalid are left out).
+    """
+    with memprofile.stage("ingest"):
+        transactions_df, users_df, quarantined, _, _ = validate_inputs(transactions_df, users_df,
+                                                                             max_date=pd.Timestamp.now())
+        if len(quarantined):
+            print(f"Skipping {len(quarantined):,} invalid transactions: "
+                  f"{quarantined['reason'].value_counts().to_dict()}")
+            if transactions_df.empty:
+                return pd.DataFrame(columns=RESULT_COLUMNS)
+        transactions_df, _ = deduplicate_transactions(transactions_df)
+
+    with memprofile.stage("features"):
+        feature_names = None
+        if pipeline.required_features is not None:
+            feature_names = list(dict.fromkeys(pipeline.required_features + OFFER_FEATURES))
+        features_df = CashFlowFeatures(transactions_df, users_df).calculate_features(feature_names)
+
+    with memprofile.stage("scoring"):
+        fraud_gate = FraudGate()
+        fraud_gate.observe_frame(transactions_df)
+        decisions = pipeline.run_batch(features_df, fraud_gate=fraud_gate)
+
+        results = compute_offers(decisions, features_df, transactions_df)
+        results['pd'] = pd.to_numeric(results['pd'], errors='coerce') # NaN for Gate 1 rejects
+    return results
+
+
+def _read_shard(work_dir, name, shard):
+    path = shard_path(work_dir, name, shard)
+    return pd.read_csv(path, dtype={'user_id': str}) if os.path.exists(path) else None
+
+
+def score_portfolio(transactions="transactions.csv", users=None, output="decisions",
+                    model="model_bundle", shards=None, chunk_rows=1000000, work_dir=None, fresh=False,
+                    shadow_models=None):
+    """
+    Scores every user in a transactions file into a Parquet dataset.
+
+    Args:
+        transactions (str): Transactions CSV.
+        users (str): User profiles CSV (optional).
+        output (str): Output directory, one part file per shard.
+        model (str): Model bundle directory from train_model.py.
+        shards (int): Number of user shards, bounding memory (default: from
+            the input size, see default_shards()).
+        chunk_rows (int): Rows per input read chunk.
+        work_dir (str): Checkpoint directory (default: <output>.work).
+        fresh (bool): Discard checkpoints and start over.
+        shadow_models (list): Challenger bundles to shadow-score; their
+            comparison with the champion (over the shards scored in this
+            run) is printed at the end.
+    """
+    work_dir = work_dir or output.rstrip('/') + '.work'
+    if fresh:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(work_dir, exist_ok=True)
+    os.makedirs(output, exist_ok=True)
+
+    shards = shards or default_shards(transactions)
+    partition_params = prepare_shards(transactions, users, work_dir, shards, chunk_rows)
+    # Batch runs compare every shard: wait for slow challengers rather than drop shards
+    pipeline = CreditPipeline(model, shadow_models=shadow_models, shadow_block=True)
+    if pipeline.model is None:
+        sys.exit(1)
+
+    fingerprint = run_fingerprint(partition_params, model)
+    pending = pending_shards(output, shards, fingerprint)
+
+    start = time.time()
+    users_done = 0
+    for i, shard in enumerate(pending, 1):
+        transactions_df = _read_shard(work_dir, 'transactions', shard)
+        if transactions_df is not None:
+            results = score_shard(transactions_df, _read_shard(work_dir, 'users', shard), pipeline)
+        else:
+            results = pd.DataFrame(columns=RESULT_COLUMNS)
+
+        write_part(output, shard, encode_part(results, fingerprint))
+
+        users_done += len(results)
+        elapsed = time.time() - start
+        eta = elapsed / i * (len(pending) - i)
+        print(f"Shard {shard + 1}/{shards}: {len(results):,} users | "
+              f"{users_done / elapsed:,.0f} users/s | ETA {eta:,.0f}s")
+
+    print(f"Done. Decisions in {output}/ (read with pd.read_parquet('{output}'))")
+
+    if pipeline.shadow is not None:
+        for name, report in pipeline.shadow.report().items():
+            print(f"\nShadow model {name}: {report['flip_rate']:.1%} of {report['n']:,} decisions flipped, "
+                  f"mean PD delta {report['mean_delta']:+.4f} (max |delta| {report['max_abs_delta']:.4f})")
+            if report['dropped']:
+                print(f"({report['dropped']:,} users skipped: the challenger fell behind)")
+            print(report['flips'])
+        pipeline.shadow.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-score a portfolio without the dashboard.")
+    parser.add_argument("--transactions", default="transactions.csv", help="Transactions CSV")
+    parser.add_argument("--users", default=None, help="User profiles CSV (optional)")
+    parser.add_argument("--output", default="decisions", help="Output Parquet dataset directory")
+    parser.add_argument("--model", default="model_bundle", help="Model bundle from train_model.py")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Number of user shards, bounding memory (default: from the input size)")
+    parser.add_argument("--chunk-rows", type=int, default=1000000, help="Rows per input read chunk")
+    parser.add_argument("--work-dir", default=None, help="Checkpoint directory (default: <output>.work)")
+    parser.add_argument("--fresh", action="store_true", help="Discard checkpoints and start over")
+    parser.add_argument("--shadow", action="append", default=None, help="Challenger bundle to shadow-score (repeatable)")
+    parser.add_argument("--memprofile", default=None, help="Write per-stage peak memory and top allocations to this JSON report")
+    parser.add_argument("--memory-budget", action="append", default=None,
+                        help="Fail once a stage has grown RSS by more than this, e.g. features=512 (MB, repeatable; "
+                        "checked when the stage ends, not a cap)")
+    args = parser.parse_args()
+
+    if args.memprofile or args.memory_budget:
+        memprofile.enable(args.memprofile, memprofile.parse_budgets(args.memory_budget),
+                          trace_allocations=args.memprofile is not None)
+    try:
+        score_portfolio(args.transactions, args.users, args.output, args.model,
+                        args.shards, args.chunk_rows, args.work_dir, args.fresh, args.shadow)
+    except memprofile.MemoryBudgetExceeded as e:
+        sys.exit(f"Memory budget exceeded: {e}")
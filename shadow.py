@@ -0,0 +1,214 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import numpy as np
+from model_bundle import ModelBundle
+
+DECISIONS = ['Approve', 'Refer', 'Reject']
+
+# Batches waiting for a shadow scoring thread before submit() drops or blocks
+MAX_PENDING_BATCHES = 4
+
+# Bins for the challenger - champion PD delta histogram
+DELTA_EDGES = np.array([-0.5, -0.2, -0.1, -0.05, -0.01, 0.01, 0.05, 0.1, 0.2, 0.5])
+
+
+def decide(pd_scores, approve_pd, reject_pd):
+    """
+    Maps PDs to decision codes (indices into DECISIONS), as in Gate 2/3.
+    """
+    return np.select([pd_scores > reject_pd, pd_scores < approve_pd], [2, 0], 1)
+
+
+class ShadowComparison:
+    def __init__(self):
+        """
+        Running comparison of a challenger against the champion.
+
+        Holds a champion x challenger decision count matrix and moments and
+        a histogram of the PD deltas. Updates are O(batch) and comparisons
+        from different workers merge by adding counts.
+        """
+        self.flips = np.zeros((len(DECISIONS), len(DECISIONS)), dtype=np.int64)
+        self.delta_hist = np.zeros(len(DELTA_EDGES) + 1, dtype=np.int64)
+        self.n = 0
+        self.delta_sum = 0.0
+        self.delta_sq = 0.0
+        self.delta_max = 0.0 # largest absolute delta
+        self.errors = 0
+        self.dropped = 0 # users in batches skipped because the queue was full
+
+    def update(self, champion_codes, challenger_codes, deltas):
+        """
+        Adds one batch.
+
+        Args:
+            champion_codes (np.ndarray): Champion decision codes.
+            challenger_codes (np.ndarray): Challenger decision codes.
+            deltas (np.ndarray): Challenger PD - champion PD (NaN where the
+                champion had no PD, e.g. Gate 1 rejects).
+        """
+        k = len(DECISIONS)
+        self.flips += np.bincount(champion_codes * k + challenger_codes, minlength=k * k).reshape(k, k)
+        deltas = deltas[~np.isnan(deltas)]
+        if len(deltas):
+            self.n += len(deltas)
+            self.delta_sum += float(deltas.sum())
+            self.delta_sq += float(np.square(deltas).sum())
+            self.delta_max = max(self.delta_max, float(np.abs(deltas).max()))
+            self.delta_hist += np.bincount(np.searchsorted(DELTA_EDGES, deltas), minlength=len(self.delta_hist))
+
+    def merge(self, other):
+        self.flips += other.flips
+        self.delta_hist += other.delta_hist
+        self.n += other.n
+        self.delta_sum += other.delta_sum
+        self.delta_sq += other.delta_sq
+        self.delta_max = max(self.delta_max, other.delta_max)
+        self.errors += other.errors
+        self.dropped += other.dropped
+        return self
+
+    def report(self):
+        """
+        Returns:
+            dict: 'flips' (champion rows x challenger columns), 'flip_rate',
+                'n', 'mean_delta', 'std_delta', 'max_abs_delta', 'delta_hist',
+                'errors' and 'dropped' (users not compared).
+        """
+        total = self.flips.sum()
+        mean = self.delta_sum / self.n if self.n else np.nan
+        var = self.delta_sq / self.n - mean ** 2 if self.n else np.nan
+        labels = ['<= {:+.2f}'.format(DELTA_EDGES[0])] + [
+            '({:+.2f}, {:+.2f}]'.format(a, b) for a, b in zip(DELTA_EDGES[:-1], DELTA_EDGES[1:])
+        ] + ['> {:+.2f}'.format(DELTA_EDGES[-1])]
+        return {
+            'flips': pd.DataFrame(self.flips, index=DECISIONS, columns=DECISIONS)
+                       .rename_axis(index='champion', columns='challenger'),
+            'flip_rate': float(1 - np.trace(self.flips) / total) if total else np.nan,
+            'n': int(total),
+            'mean_delta': mean,
+            'std_delta': float(np.sqrt(max(var, 0.0))) if self.n else np.nan,
+            'max_abs_delta': self.delta_max,
+            'delta_hist': pd.Series(self.delta_hist, index=labels, name='users'),
+            'errors': self.errors,
+            'dropped': self.dropped
+        }
+
+
+class ShadowScorer:
+    def __init__(self, models, max_workers=1, nthread=1, max_pending=MAX_PENDING_BATCHES, block=False):
+        """
+        Scores challenger models in the background on the champion's features.
+
+        Batches are handed to a thread pool after the champion has decided,
+        so the champion's latency only pays for the hand-off. XGBoost
+        releases the GIL while predicting, and each challenger is limited to
+        `nthread` threads to leave the cores to the champion. At most
+        `max_pending` batches are queued or being scored; when a slow
+        challenger falls behind, further batches are dropped (and counted
+        in the report) or, with `block`, submit() waits for a free slot.
+
+        Args:
+            models (dict or list): Challenger name -> bundle path (a list of
+                paths uses the directory names).
+            max_workers (int): Background scoring threads.
+            nthread (int): XGBoost threads per challenger prediction.
+            max_pending (int): Batches held at most (queued or running).
+            block (bool): Wait for a slot instead of dropping the batch
+                (batch scoring, where every batch should be compared).
+        """
+        if not isinstance(models, dict):
+            models = {os.path.basename(os.path.normpath(p)): p for p in models}
+        self.models = {}
+        for name, path in models.items():
+            bundle = ModelBundle(path)
+            bundle.set_threads(nthread)
+            self.models[name] = bundle
+        self.comparisons = {name: ShadowComparison() for name in self.models}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shadow")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.block = block
+
+    @property
+    def feature_names(self):
+        """
+        Features any challenger needs, in first-seen order.
+        """
+        names = [f for bundle in self.models.values() for f in bundle.feature_names]
+        return list(dict.fromkeys(names))
+
+    def submit(self, features_df, decisions):
+        """
+        Queues a scored batch for shadow scoring.
+
+        Args:
+            features_df (pd.DataFrame): The feature matrix the champion used
+                (not copied; must not be modified in place afterwards).
+            decisions (pd.DataFrame): Champion output of run_batch() (likewise).
+
+        Returns:
+            bool: False if the batch was dropped because the queue was full.
+        """
+        if not self._slots.acquire(blocking=self.block):
+            with self._lock:
+                for comparison in self.comparisons.values():
+                    comparison.dropped += len(features_df)
+            return False
+        # Only references cross the thread boundary; conversion happens in the worker
+        future = self.executor.submit(self._score, features_df, decisions['decision'], decisions['pd'],
+                                      decisions['gate'])
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return True
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def _score(self, features_df, decision, champion_pd, gate):
+        champion_codes = pd.Categorical(decision, categories=DECISIONS).codes
+        champion_pd = pd.to_numeric(champion_pd, errors='coerce').to_numpy(dtype=np.float64)
+        gate1 = (gate == 1).to_numpy()
+        known = champion_codes >= 0 # skip 'Error' decisions
+        for name, bundle in self.models.items():
+            comparison = self.comparisons[name]
+            try:
+                pd_scores = bundle.predict(features_df).astype(np.float64)
+                codes = decide(pd_scores, bundle.thresholds['approve_pd'], bundle.thresholds['reject_pd'])
+                codes = np.where(gate1, 2, codes) # Gate 1 is model-independent
+                with self._lock:
+                    comparison.update(champion_codes[known], codes[known], (pd_scores - champion_pd)[known])
+            except Exception as e:
+                with self._lock:
+                    comparison.errors += 1
+                print(f"Shadow model {name} failed: {e}")
+
+    def wait(self):
+        """
+        Blocks until every queued batch has been scored.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            for future in pending:
+                future.result()
+
+    def report(self):
+        """
+        Returns {challenger name: ShadowComparison.report()} over everything
+        submitted so far.
+        """
+        self.wait()
+        with self._lock:
+            return {name: c.report() for name, c in self.comparisons.items()}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,160 @@
+import json
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+# Header: 8-byte little-endian length, then JSON layout; arrays start 64-byte aligned
+_HEADER_BYTES = 8
+_ALIGN = 64
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+class SharedFeatureMatrix:
+    def __init__(self, shm, layout, owner=False):
+        """
+        Feature matrix in one shared-memory block, for process pools.
+
+        Holds a C-contiguous float32 (users x features) block, the user ids
+        and the column names. Pickling sends only the block's name, so a
+        matrix passed to a pool worker (as an argument or initializer
+        argument) is attached there instead of copied, and row slices are
+        plain numpy views of the shared block.
+
+        Use create() to build one and attach() to open an existing one.
+        """
+        self._shm = shm
+        self.layout = layout
+        self.owner = owner
+        self.columns = layout['columns']
+        self.values = np.ndarray((layout['rows'], len(self.columns)), dtype=np.float32,
+                                 buffer=shm.buf, offset=layout['values_offset'])
+        self._ids = np.ndarray((layout['rows'],), dtype=layout['ids_dtype'],
+                               buffer=shm.buf, offset=layout['ids_offset'])
+        self._index = None
+
+    @classmethod
+    def allocate(cls, index, columns, name=None):
+        """
+        Creates a zero-filled shared matrix (e.g. for workers to write into).
+
+        Args:
+            index (array-like): User ids, one per row.
+            columns (list): Column names.
+            name (str): Block name (default: generated).
+
+        Returns:
+            SharedFeatureMatrix: The owning handle; call unlink() (or use it
+                as a context manager) when every worker is done.
+        """
+        columns = list(columns)
+        ids = pd.Index(index).astype(str).to_numpy().astype(bytes)
+        if ids.dtype.itemsize == 0:
+            ids = ids.astype('S1')
+        layout = {'rows': len(ids), 'columns': columns, 'ids_dtype': ids.dtype.str,
+                  'values_offset': 0, 'ids_offset': 0}
+        # Room for the header with its offsets filled in (at most 20 digits each)
+        values_offset = _aligned(_HEADER_BYTES + len(json.dumps(layout)) + 40)
+        layout['values_offset'] = values_offset
+        layout['ids_offset'] = _aligned(values_offset + 4 * len(ids) * len(columns))
+        header = json.dumps(layout).encode()
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, layout['ids_offset'] + ids.nbytes))
+        shm.buf[:_HEADER_BYTES] = len(header).to_bytes(_HEADER_BYTES, 'little')
+        shm.buf[_HEADER_BYTES:_HEADER_BYTES + len(header)] = header
+        matrix = cls(shm, layout, owner=True)
+        matrix._ids[:] = ids
+        return matrix
+
+    @classmethod
+    def create(cls, features_df, columns=None, name=None):
+        """
+        Copies a features DataFrame into a new shared-memory block.
+
+        Args:
+            features_df (pd.DataFrame): Features indexed by user_id, e.g. from
+                CashFlowFeatures.calculate_features().
+            columns (list): Columns to keep, in order (default: all).
+            name (str): Block name (default: generated).
+
+        Returns:
+            SharedFeatureMatrix: The owning handle (see allocate()).
+        """
+        columns = list(features_df.columns if columns is None else columns)
+        matrix = cls.allocate(features_df.index, columns, name)
+        matrix.values[:] = features_df[columns].to_numpy(dtype=np.float32)
+        return matrix
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Opens a matrix created by another process (no copy).
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        length = int.from_bytes(bytes(shm.buf[:_HEADER_BYTES]), 'little')
+        layout = json.loads(bytes(shm.buf[_HEADER_BYTES:_HEADER_BYTES + length]))
+        return cls(shm, layout)
+
+    def __reduce__(self):
+        return (SharedFeatureMatrix.attach, (self.name,))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __len__(self):
+        return self.layout['rows']
+
+    @property
+    def index(self):
+        """
+        User ids as a pd.Index (built on first use).
+        """
+        if self._index is None:
+            self._index = pd.Index(self._ids.astype(str).astype(object), name='user_id')
+        return self._index
+
+    def rows(self, start=None, stop=None, columns=None):
+        """
+        Returns a float32 array of rows [start, stop).
+
+        A view of the shared block when `columns` is None or equals the
+        stored columns; other column selections are copied.
+        """
+        block = self.values[start:stop]
+        if columns is None or list(columns) == self.columns:
+            return block
+        positions = [self.columns.index(c) for c in columns]
+        return block[:, positions]
+
+    def frame(self, start=None, stop=None):
+        """
+        Returns rows [start, stop) as a DataFrame indexed by user_id that
+        shares the block's memory (do not modify it in place).
+        """
+        return pd.DataFrame(self.values[start:stop], index=self.index[start:stop],
+                            columns=self.columns, copy=False)
+
+    def close(self):
+        # Views handed out keep the buffer exported; drop ours first
+        self.values = self._ids = self._index = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass # a caller still holds a view; the mapping goes with the process
+
+    def unlink(self):
+        """
+        Frees the block (creator only; attached handles stay readable).
+        """
+        self.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
@@ -17,7 +17,7 @@ def test_imports():
         'streamlit',
         'shap',
         'altair',
-        'matplotlib'
+        'pyarrow'
     ]
     
     for module in modules:
@@ -43,8 +43,8 @@ def test_files():
         'train_model.py',
         'users.csv',
         'transactions.csv',
-        'xgb_model.pkl',
-        'shap_explainer.pkl'
+        'model_bundle/manifest.json',
+        'model_bundle/model.ubj'
     ]
     
     for file in files:
@@ -1,21 +1,212 @@
+import os
+import time
 import pandas as pd
 import numpy as np
 import xgboost as xgb
-import shap
-import pickle
-from sklearn.model_selection import train_test_split
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.metrics import accuracy_score, roc_auc_score
+from feature_store import FeatureStore
+from feature_matrix import FeatureMatrix
+from drift import FeatureSketch
+from model_bundle import save_bundle
+from evaluation import evaluate, print_report
+from pipeline import APPROVE_PD, REJECT_PD
 
-def train_model():
+MODEL_PARAMS = {
+    'objective': 'binary:logistic',
+    'n_estimators': 100,
+    'learning_rate': 0.1,
+    'max_depth': 4,
+    'eval_metric': 'logloss'
+}
+
+# Training data for cross-validation workers, sent once per process by _init_cv_worker()
+_cv_data = None
+
+
+def _fit(params, dtrain, seed=None):
+    # Native-API fit, same model as XGBClassifier(**params).fit() on the same rows
+    booster_params = {k: v for k, v in params.items() if k != 'n_estimators'}
+    if seed is not None:
+        booster_params['seed'] = seed
+    return xgb.train(booster_params, dtrain, num_boost_round=params['n_estimators'])
+
+
+def _init_cv_worker(X, y, params):
+    global _cv_data
+    _cv_data = (X, y, params)
+
+
+def _fit_fold(seed, fold, train_idx, test_idx, n_threads):
+    # Fits one (seed, fold) and scores its held-out rows
+    X, y, params = _cv_data
+    model = xgb.XGBClassifier(**params, random_state=seed, n_jobs=n_threads)
+    model.fit(X.iloc[train_idx], y.iloc[train_idx])
+    prob = model.predict_proba(X.iloc[test_idx])[:, 1]
+    summary = evaluate(y.iloc[test_idx], prob, n_bootstrap=0)['summary']['estimate']
+    metrics = {
+        'seed': seed,
+        'fold': fold,
+        'accuracy': float(((prob > 0.5) == y.iloc[test_idx].to_numpy()).mean()),
+        'auc': float(summary['auc']),
+        'ks': float(summary['ks'])
+    }
+    return test_idx, prob, metrics, bytes(model.get_booster().save_raw('ubj'))
+
+
+def cross_validate(X, y, params, n_folds=5, seeds=(42,), n_jobs=None):
+    """
+    Stratified k-fold cross-validation repeated over several seeds.
+
+    Every (seed, fold) fit is an independent task in a process pool. The
+    training data is sent to each worker once, and the cores are split
+    between concurrent fits (threads per fit = cores // workers) so the
+    pool never oversubscribes the machine.
+
+    Args:
+        X (pd.DataFrame): Features.
+        y (pd.Series): Labels.
+        params (dict): XGBClassifier parameters.
+        n_folds (int): Folds per seed.
+        seeds (list): Seeds for the fold split and the model.
+        n_jobs (int): Concurrent fits (default: CPU count).
+
+    Returns:
+        tuple: (per-fit metrics DataFrame, out-of-fold probabilities averaged
+            over seeds, list of fitted boosters in (seed, fold) order)
+    """
+    tasks = []
+    for seed in seeds:
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+        for fold, (train_idx, test_idx) in enumerate(splitter.split(X, y)):
+            tasks.append((seed, fold, train_idx, test_idx))
+
+    cores = os.cpu_count() or 1
+    workers = max(1, min(len(tasks), n_jobs or cores))
+    n_threads = max(1, cores // workers)
+
+    oof = np.zeros(len(X))
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(workers, initializer=_init_cv_worker, initargs=(X, y, params)) as pool:
+        futures = [pool.submit(_fit_fold, *task, n_threads) for task in tasks]
+        for i, future in enumerate(futures):
+            test_idx, prob, metrics, raw = future.result()
+            oof[test_idx] += prob / len(seeds)
+            results[i] = (metrics, raw)
+            print(f"  seed {metrics['seed']} fold {metrics['fold']}: AUC {metrics['auc']:.4f}, KS {metrics['ks']:.4f}")
+
+    boosters = [xgb.Booster(model_file=bytearray(raw)) for _, raw in results]
+    return pd.DataFrame([m for m, _ in results]), oof, boosters
+
+
+def _train_holdout(X, y, params, dmatrix):
+    # Single 80/20 split: fit on 80%, evaluate on the hold-out 20%
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    y_test = y.iloc[test_idx]
+
+    print("Training XGBoost model...")
+    booster = _fit(params, dmatrix.slice(train_idx))
+    
+    # Evaluate
+    y_prob = booster.predict(dmatrix.slice(test_idx))
+    y_pred = (y_prob > 0.5).astype(int)
+    
+    acc = accuracy_score(y_test, y_pred)
+    auc = roc_auc_score(y_test, y_prob)
+    
+    print(f"Model Accuracy: {acc:.4f}")
+    print(f"Model AUC: {auc:.4f}")
+
+    metadata = {
+        'n_train': int(len(train_idx)),
+        'n_test': int(len(test_idx)),
+        'accuracy': float(acc),
+        'auc': float(auc)
+    }
+    return booster, (y_test, y_prob), X.iloc[train_idx], metadata
+
+
+def _train_cv(X, y, params, dmatrix, n_folds, seeds, n_jobs, ensemble):
+    # Repeated stratified k-fold; the final model is the fold ensemble or a refit on all rows
+    print(f"Cross-validating XGBoost model ({n_folds} folds x {len(seeds)} seeds)...")
+    start = time.time()
+    folds, oof, fold_boosters = cross_validate(X, y, params, n_folds, seeds, n_jobs)
+    print(f"Cross-validation took {time.time() - start:.1f}s")
+
+    spread = folds[['accuracy', 'auc', 'ks']].agg(['mean', 'std', 'min', 'max']).T
+    print(f"Metrics over {len(folds)} fits:\n{spread.round(4)}")
+
+    if ensemble:
+        boosters = fold_boosters
+        print(f"Ensembling {len(boosters)} fold models")
+    else:
+        print("Refitting on all data...")
+        boosters = _fit(params, dmatrix)
+
+    metadata = {
+        'n_train': int(len(X)),
+        'n_test': 0,
+        'accuracy': float(spread.loc['accuracy', 'mean']),
+        'auc': float(spread.loc['auc', 'mean']),
+        'cv': {
+            'folds': int(n_folds),
+            'seeds': [int(seed) for seed in seeds],
+            'ensemble': bool(ensemble),
+            'metrics': {metric: {k: float(v) for k, v in row.items()} for metric, row in spread.iterrows()}
+        }
+    }
+    return boosters, (y, oof), X, metadata
+
+
+def train_model(features_path="features.csv", store_path=None, as_of=None, bundle_path="model_bundle",
+                cv_folds=None, seeds=(42,), n_jobs=None, ensemble=False, matrix_path=None):
     """
     Trains an XGBoost model on the features.csv data.
+    
+    Args:
+        features_path (str): Features CSV written by features.py.
+        store_path (str): Read from this feature store instead of the CSV.
+        as_of: With a store, train on features as they were known at this
+            timestamp (point-in-time, no later snapshots). Defaults to latest.
+        bundle_path (str): Model bundle directory to write (see model_bundle.py).
+        cv_folds (int): Cross-validate with this many stratified folds per
+            seed instead of a single 80/20 split.
+        seeds (list): Cross-validation seeds.
+        n_jobs (int): Concurrent cross-validation fits (default: CPU count).
+        ensemble (bool): With cv_folds, bundle the fold models as an ensemble
+            (log-odds averaged) instead of refitting on all data.
+        matrix_path (str): Read the binary feature matrix written by
+            features.py instead (memory-mapped, with its cached DMatrix).
     """
     print("Loading data...")
-    try:
-        df = pd.read_csv("features.csv", dtype={'user_id': str})
-    except FileNotFoundError:
-        print("features.csv not found. Run features.py first.")
-        return
+    matrix = None
+    if matrix_path is not None:
+        try:
+            matrix = FeatureMatrix(matrix_path)
+        except FileNotFoundError:
+            print(f"{matrix_path} not found. Run features.py first.")
+            return
+        df = matrix.frame()
+    elif store_path is not None:
+        store = FeatureStore(store_path)
+        if as_of is not None:
+            df = store.read_as_of(as_of)
+        else:
+            df = store.read_latest()
+        store.close()
+        if df.empty:
+            print(f"No features in {store_path} as of {as_of}. Run features.py first.")
+            return
+        df = df.drop(['as_of', 'feature_as_of'], axis=1).reset_index()
+    else:
+        try:
+            # round_trip: the same float64 values features.py wrote (and stored in features.bin)
+            df = pd.read_csv(features_path, dtype={'user_id': str}, float_precision='round_trip')
+        except FileNotFoundError:
+            print(f"{features_path} not found. Run features.py first.")
+            return
 
     # Create target variable based on simple logic for training purposes
     # High risk = 1 (Default), Low risk = 0 (Good)
@@ -37,19 +228,13 @@ def train_model():
     
     # Normalize risk score and assign labels
     # Threshold: if risk score > 8, then default = 1
-    df['target'] = (risk_score > 8).astype(int)
-    
-    print(f"Target distribution:\n{df['target'].value_counts()}")
+    y = (risk_score > 8).astype(int).rename('target').reset_index(drop=True)
     
-    # Drop non-feature columns
-    cols_to_drop = ['user_id', 'target']
-    if 'Unnamed: 0' in df.columns:
-        cols_to_drop.append('Unnamed: 0')
-        
-    X = df.drop(cols_to_drop, axis=1)
-    y = df['target']
+    print(f"Target distribution:\n{y.value_counts()}")
     
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Drop non-feature columns (the binary matrix has none; its values stay mapped)
+    cols_to_drop = [c for c in ('user_id', 'Unnamed: 0') if c in df.columns]
+    X = df.drop(cols_to_drop, axis=1) if cols_to_drop else df
     
     # Monotone constraints
     # 1 = increasing constraint (higher value -> higher risk)
@@ -83,12 +268,21 @@ def train_model():
     constraints_dict = {
         'net_cashflow': -1,
         'eom_balance': -1,
+        'min_balance_30d': -1,
+        'min_balance_60d': -1,
+        'min_balance_90d': -1,
         'sim_age': -1,
         'device_age': -1,
         'signup_tenure': -1,
         'upi_tenure': -1,
         'address_stability': -1,
         'income_stability': 1,
+        'recurring_income_streams': -1,
+        'income_regularity': -1,
+        'income_cadence_days': 0,
+        'days_to_next_income': 0,
+        'recurring_payments': 0,
+        'days_to_next_payment': 0,
         'upi_stability': 1
     }
     
@@ -96,41 +290,54 @@ def train_model():
     for feat in feature_names:
         final_constraints.append(constraints_dict.get(feat, 1)) # Default to 1 (Higher is Riskier)
 
-    print("Training XGBoost model...")
-    model = xgb.XGBClassifier(
-        objective='binary:logistic',
-        n_estimators=100,
-        learning_rate=0.1,
-        max_depth=4,
-        monotone_constraints=tuple(final_constraints),
-        use_label_encoder=False,
-        eval_metric='logloss'
-    )
-    
-    model.fit(X_train, y_train)
-    
-    # Evaluate
-    y_pred = model.predict(X_test)
-    y_prob = model.predict_proba(X_test)[:, 1]
-    
-    acc = accuracy_score(y_test, y_pred)
-    auc = roc_auc_score(y_test, y_prob)
-    
-    print(f"Model Accuracy: {acc:.4f}")
-    print(f"Model AUC: {auc:.4f}")
-    
-    # Save model
-    with open("xgb_model.pkl", "wb") as f:
-        pickle.dump(model, f)
-    print("Saved model to xgb_model.pkl")
-    
-    # Train SHAP explainer
-    print("Generating SHAP explainer...")
-    explainer = shap.TreeExplainer(model)
+    params = dict(MODEL_PARAMS, monotone_constraints=tuple(final_constraints))
+    dmatrix = matrix.dmatrix(y) if matrix is not None else xgb.DMatrix(X, label=y)
+    if cv_folds:
+        boosters, evaluated, sketch_data, metadata = _train_cv(X, y, params, dmatrix, cv_folds, seeds, n_jobs, ensemble)
+    else:
+        boosters, evaluated, sketch_data, metadata = _train_holdout(X, y, params, dmatrix)
+
+    # Governance report (95% bootstrap intervals): hold-out set, or out-of-fold with CV
+    report = evaluate(*evaluated, n_bootstrap=1000)
+    print_report(report)
     
-    with open("shap_explainer.pkl", "wb") as f:
-        pickle.dump(explainer, f)
-    print("Saved SHAP explainer to shap_explainer.pkl")
+    # Save the model, its decision policy and the training feature sketch
+    # (reference for drift monitoring) as one bundle
+    metadata = {
+        'trained_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'xgboost_version': xgb.__version__,
+        'source': matrix_path or store_path or features_path,
+        'as_of': None if as_of is None else str(as_of),
+        **metadata,
+        'evaluation': {metric: {k: float(v) for k, v in row.items()}
+                       for metric, row in report['summary'].iterrows()},
+        'params': {k: v for k, v in params.items()
+                   if k in ('n_estimators', 'learning_rate', 'max_depth', 'objective')}
+    }
+    save_bundle(
+        bundle_path,
+        boosters,
+        monotone_constraints=final_constraints,
+        thresholds={'approve_pd': APPROVE_PD, 'reject_pd': REJECT_PD},
+        metadata=metadata,
+        drift_sketch=FeatureSketch.from_data(sketch_data)
+    )
+    print(f"Saved model bundle to {bundle_path}/")
 
 if __name__ == "__main__":
-    train_model()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Train the credit risk model.")
+    parser.add_argument("--features", default="features.csv", help="Features CSV from features.py")
+    parser.add_argument("--store", default=None, help="Train from this feature store instead (e.g. features.db)")
+    parser.add_argument("--matrix", default=None, help="Train from this binary feature matrix instead (e.g. features.bin)")
+    parser.add_argument("--as-of", default=None, help="Point-in-time snapshot to train on (with --store)")
+    parser.add_argument("--bundle", default="model_bundle", help="Model bundle directory to write")
+    parser.add_argument("--cv-folds", type=int, default=None, help="Stratified k-fold cross-validation instead of an 80/20 split")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[42], help="Cross-validation seeds (with --cv-folds)")
+    parser.add_argument("--jobs", type=int, default=None, help="Concurrent cross-validation fits (default: CPU count)")
+    parser.add_argument("--ensemble", action="store_true", help="Bundle the fold models as an ensemble (with --cv-folds)")
+    args = parser.parse_args()
+    
+    train_model(args.features, args.store, args.as_of, args.bundle,
+                args.cv_folds, args.seeds, args.jobs, args.ensemble, args.matrix)
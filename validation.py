@@ -0,0 +1,201 @@
+import pandas as pd
+import numpy as np
+
+REQUIRED_TRANSACTION_COLUMNS = ['user_id', 'date', 'amount']
+REQUIRED_USER_COLUMNS = ['user_id']
+
+STATUSES = ('Success', 'Declined', 'Failed')
+
+# Profile fields the features read; blanks are allowed (treated as 0)
+PROFILE_COLUMNS = [
+    'sim_age_months', 'device_age_months', 'loan_apps_installed', 'gaming_apps_installed',
+    'finance_apps_installed', 'signup_tenure_days', 'upi_id_tenure_days', 'address_stability_flag'
+]
+
+# Plausible ranges: larger amounts and earlier dates are data errors
+MAX_ABS_AMOUNT = 1e8
+MIN_DATE = pd.Timestamp('1990-01-01')
+
+# Quarantine reasons, one bit each (a row can fail several checks)
+TRANSACTION_REASONS = [
+    'missing user_id', 'non-numeric amount', 'amount out of range', 'malformed date',
+    'date out of range', 'unknown status', 'no user profile'
+]
+USER_REASONS = ['missing user_id', 'duplicate user_id', 'non-numeric profile field', 'negative profile field']
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def _require(df, columns, name):
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValidationError(f"{name} file is missing required columns: {', '.join(missing)} "
+                              f"(found: {', '.join(map(str, df.columns))})")
+
+
+def _id_checks(ids, known=None):
+    # (missing ids, ids not in `known`) from one hash pass over the column
+    codes, uniques = pd.factorize(ids)
+    missing = codes < 0
+    if len(uniques):
+        missing |= (uniques == '')[codes]
+    if known is None:
+        return missing, None
+    unknown = np.append(~pd.Index(uniques).isin(known), True) # NaN ids are unknown too
+    return missing, unknown[codes]
+
+
+def _to_numeric(values):
+    # (numbers, mask of values that are present but not numbers)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(np.float64), np.zeros(len(values), dtype=bool)
+    numbers = pd.to_numeric(values, errors='coerce')
+    return numbers, (numbers.isna() & values.notna()).to_numpy()
+
+
+def _to_datetime(values):
+    # Dates repeat heavily: parse each distinct value once. Offsets are
+    # normalized to naive UTC, so aware and naive dates compare.
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        return values.dt.tz_convert(None)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce', format='mixed', utc=True)
+    parsed = parsed.dt.tz_convert(None).to_numpy()
+    result = parsed.take(np.where(codes < 0, 0, codes)) if len(parsed) else np.full(len(codes), np.datetime64('NaT'))
+    return pd.Series(result, index=values.index).where(codes >= 0)
+
+
+def _split(df, checks, reasons):
+    """
+    Splits rows into clean and quarantined from per-check boolean masks.
+
+    Returns:
+        tuple: (clean rows, quarantined rows with a 'reason' column, reason
+            -> row count)
+    """
+    flags = np.zeros(len(df), dtype=np.uint32)
+    for bit, reason in enumerate(reasons):
+        if reason in checks:
+            flags |= checks[reason].astype(np.uint32) << bit
+    bad = flags != 0
+    if not bad.any():
+        return df, df.iloc[:0].assign(reason=pd.Series(dtype=object)), {}
+    counts = {reason: int(np.count_nonzero(flags & (1 << bit))) for bit, reason in enumerate(reasons)}
+
+    # Label each distinct combination of failed checks once
+    combos, inverse = np.unique(flags[bad], return_inverse=True)
+    labels = np.array(['; '.join(r for bit, r in enumerate(reasons) if combo >> bit & 1) for combo in combos],
+                      dtype=object)
+    quarantined = df[bad].assign(reason=labels[inverse])
+    return df[~bad], quarantined, {r: n for r, n in counts.items() if n}
+
+
+def validate_users(users_df):
+    """
+    Checks user profiles and quarantines the invalid ones.
+
+    Args:
+        users_df (pd.DataFrame): User profiles ('user_id' plus profile fields).
+
+    Returns:
+        tuple: (valid profiles with numeric profile fields, quarantined rows
+            with a 'reason' column, report dict)
+    """
+    _require(users_df, REQUIRED_USER_COLUMNS, "Users")
+    ids = users_df['user_id']
+    checks = {
+        'missing user_id': _id_checks(ids)[0],
+        'duplicate user_id': ids.duplicated().to_numpy() & ids.notna().to_numpy(),
+    }
+    non_numeric = np.zeros(len(users_df), dtype=bool)
+    negative = np.zeros(len(users_df), dtype=bool)
+    numbers = {}
+    for column in PROFILE_COLUMNS:
+        if column in users_df.columns:
+            numbers[column], bad = _to_numeric(users_df[column])
+            non_numeric |= bad
+            negative |= (numbers[column] < 0).to_numpy()
+    checks['non-numeric profile field'] = non_numeric
+    checks['negative profile field'] = negative
+
+    users_df = users_df.copy(deep=False)
+    for column, values in numbers.items():
+        users_df[column] = values
+    clean, quarantined, reasons = _split(users_df, checks, USER_REASONS)
+    report = {'rows_in': len(users_df), 'rows_out': len(clean), 'quarantined': len(quarantined), 'reasons': reasons}
+    return clean, quarantined, report
+
+
+def validate_transactions(transactions_df, users_df=None, max_date=None):
+    """
+    Checks transactions and quarantines the rows that would crash or skew
+    the features.
+
+    Every check is one whole-column operation: schema, types (numeric
+    amounts, parseable dates), the status enumeration, plausible ranges
+    and, with profiles, that every transaction's user has one. Valid rows
+    come back with 'amount' as float and 'date' parsed, so later stages
+    (dedup, features) skip their own parsing.
+
+    Args:
+        transactions_df (pd.DataFrame): Raw transactions.
+        users_df (pd.DataFrame): Validated user profiles (optional).
+        max_date: Latest plausible transaction date, e.g. the processing
+            date; rows at any time on that day pass (default: no upper
+            bound).
+
+    Returns:
+        tuple: (valid rows, quarantined rows with a 'reason' column,
+            report dict with 'rows_in', 'rows_out', 'quarantined' and
+            'reasons' (reason -> rows))
+
+    Raises:
+        ValidationError: Required columns are missing.
+    """
+    _require(transactions_df, REQUIRED_TRANSACTION_COLUMNS, "Transactions")
+    df = transactions_df
+    amounts, non_numeric = _to_numeric(df['amount'])
+    dates = _to_datetime(df['date'])
+    missing_ids, unknown_ids = _id_checks(df['user_id'], users_df['user_id'] if users_df is not None else None)
+
+    checks = {
+        'missing user_id': missing_ids,
+        'non-numeric amount': non_numeric | amounts.isna().to_numpy(),
+        'amount out of range': (amounts.abs() > MAX_ABS_AMOUNT).to_numpy() | np.isinf(amounts.to_numpy()),
+        'malformed date': dates.isna().to_numpy(),
+        'date out of range': (dates < MIN_DATE).to_numpy(),
+    }
+    if max_date is not None:
+        end_of_day = pd.Timestamp(max_date).normalize() + pd.Timedelta(days=1)
+        checks['date out of range'] |= (dates >= end_of_day).to_numpy()
+    if 'status' in df.columns:
+        checks['unknown status'] = ~df['status'].isin(STATUSES).to_numpy()
+    if unknown_ids is not None:
+        checks['no user profile'] = unknown_ids
+
+    df = df.copy(deep=False)
+    df['amount'] = amounts
+    df['date'] = dates
+    clean, quarantined, reasons = _split(df, checks, TRANSACTION_REASONS)
+    report = {'rows_in': len(df), 'rows_out': len(clean), 'quarantined': len(quarantined), 'reasons': reasons}
+    return clean, quarantined, report
+
+
+def validate_inputs(transactions_df, users_df=None, max_date=None):
+    """
+    Validates profiles, then transactions against the valid profiles.
+
+    Returns:
+        tuple: (transactions, users, quarantined transactions, quarantined
+            users, report) where report has 'transactions' and 'users'
+            entries; users and their quarantine are None without profiles.
+    """
+    quarantined_users = users_report = None
+    if users_df is not None:
+        users_df, quarantined_users, users_report = validate_users(users_df)
+    transactions_df, quarantined, report = validate_transactions(transactions_df, users_df, max_date)
+    return transactions_df, users_df, quarantined, quarantined_users, {'transactions': report, 'users': users_report}